@@ -0,0 +1,234 @@
+# backup.py
+# Резервные копии базы текущего ивента через онлайн-API резервного копирования SQLite.
+#
+#   python backup.py            # одна копия сейчас
+#   python backup.py --list     # существующие копии
+#
+# В боте копии делает BackupScheduler раз в config.BACKUP_INTERVAL_SECONDS.
+import argparse
+import asyncio
+import datetime
+import glob
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from typing import List, Optional
+
+import config
+import database
+import metrics
+from bot_logging import get_logger
+
+log = get_logger('backup')
+
+BACKUP_SUFFIX = ".db.gz"
+
+# Размер блока при сжатии копии
+CHUNK_SIZE = 1024 * 1024
+
+class _TooManyRestarts(Exception):
+    pass
+
+def copy_database(src_path: str, dst_path: str) -> dict:
+    """
+    Копирует базу по config.BACKUP_PAGES_PER_STEP страниц с паузой между шагами.
+    Между шагами блокировок на источнике нет, и бот пишет в базу как обычно.
+
+    В режиме WAL соединение-источник держит открытую транзакцию чтения: все шаги читают
+    один снимок, а запись других соединений идет в WAL и не мешает копированию.
+    В режиме журнала отката транзакцию держать нельзя (она заблокировала бы запись), поэтому
+    запись бота между шагами заставляет SQLite начать копирование заново; после
+    config.BACKUP_MAX_RESTARTS перезапусков оставшееся копируется одним шагом.
+    """
+    steps = 0
+    restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal steps, restarts, last_remaining
+        steps += 1
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > config.BACKUP_MAX_RESTARTS:
+                raise _TooManyRestarts()
+        last_remaining = remaining
+        if remaining:
+            time.sleep(config.BACKUP_STEP_SLEEP)
+
+    src = sqlite3.connect(src_path, isolation_level=None)
+    dst = sqlite3.connect(dst_path)
+    try:
+        wal = src.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        if wal:
+            src.execute("BEGIN")
+            src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        try:
+            src.backup(dst, pages=config.BACKUP_PAGES_PER_STEP, progress=progress)
+            single_step = False
+        except _TooManyRestarts:
+            src.backup(dst, pages=-1)
+            single_step = True
+        if wal:
+            src.execute("COMMIT")
+        pages = dst.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        dst.close()
+        src.close()
+
+    return {'pages': pages, 'steps': steps, 'restarts': restarts, 'single_step': single_step, 'wal': wal}
+
+def _verify(path: str) -> Optional[str]:
+    """Проверка целостности копии; возвращает описание ошибки или None."""
+    conn = sqlite3.connect(path)
+    try:
+        rows = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    finally:
+        conn.close()
+    return None if rows == ['ok'] else "; ".join(rows[:5])
+
+def _backup_time(path: str) -> datetime.datetime:
+    stamp = os.path.basename(path)[:-len(BACKUP_SUFFIX)].rsplit('_', 2)
+    return datetime.datetime.strptime(f"{stamp[-2]}_{stamp[-1]}", '%Y%m%d_%H%M%S')
+
+def list_backups() -> List[str]:
+    """
+    Сжатые копии от старых к новым. Порядок - по времени создания из конца имени: имя начинается
+    с имени базы ивента, и копии разных ивентов по имени файла упорядочены неверно.
+    """
+    paths = glob.glob(os.path.join(config.BACKUP_DIR, '*' + BACKUP_SUFFIX))
+    return sorted(paths, key=lambda path: (_backup_time(path), path))
+
+def apply_retention(now: Optional[datetime.datetime] = None) -> List[str]:
+    """
+    Оставляет config.BACKUP_KEEP_RECENT последних копий и самую позднюю копию каждого дня
+    за config.BACKUP_KEEP_DAILY дней; остальные удаляет. Возвращает удаленные файлы.
+    """
+    now = now or datetime.datetime.utcnow()
+    backups = list_backups()
+    keep = set(backups[-config.BACKUP_KEEP_RECENT:]) if config.BACKUP_KEEP_RECENT else set()
+
+    daily = {}
+    for path in backups:
+        moment = _backup_time(path)
+        if now - moment <= datetime.timedelta(days=config.BACKUP_KEEP_DAILY):
+            daily[moment.date()] = path
+    keep.update(daily.values())
+
+    removed = []
+    for path in backups:
+        if path not in keep:
+            os.remove(path)
+            removed.append(path)
+    return removed
+
+def run_backup() -> dict:
+    """
+    Делает копию базы текущего ивента: пошаговое копирование, проверка целостности,
+    сжатие gzip и политика хранения. Выполняется синхронно (в боте - в отдельном потоке).
+    Возвращает сведения о копии; при ошибке проверки копия удаляется и поднимается RuntimeError.
+    """
+    started = time.perf_counter()
+    src_path = database.DATABASE_NAME
+    os.makedirs(config.BACKUP_DIR, exist_ok=True)
+
+    name = os.path.splitext(os.path.basename(src_path))[0]
+    stamp = datetime.datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+    copy_path = os.path.join(config.BACKUP_DIR, f"{name}_{stamp}.db.tmp")
+    archive_path = os.path.join(config.BACKUP_DIR, f"{name}_{stamp}{BACKUP_SUFFIX}")
+
+    try:
+        result = copy_database(src_path, copy_path)
+        copied = time.perf_counter()
+
+        error = _verify(copy_path)
+        if error:
+            raise RuntimeError(f"копия не прошла integrity_check: {error}")
+
+        with open(copy_path, 'rb') as src, gzip.open(archive_path + '.tmp', 'wb',
+                                                    compresslevel=config.BACKUP_COMPRESSLEVEL) as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        os.replace(archive_path + '.tmp', archive_path)
+
+        result.update({
+            'path': archive_path,
+            'size_bytes': os.path.getsize(copy_path),
+            'archive_bytes': os.path.getsize(archive_path),
+            'copy_seconds': round(copied - started, 3),
+            'seconds': round(time.perf_counter() - started, 3),
+        })
+    finally:
+        for path in (copy_path, archive_path + '.tmp'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    result['removed'] = apply_retention()
+    return result
+
+class BackupScheduler:
+    """Фоновые резервные копии раз в interval секунд; копирование идет в отдельном потоке."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.duration = metrics.histogram("backup_duration_seconds", "Время создания резервной копии")
+        self.failures = metrics.counter("backup_failures_total", "Неудачные резервные копии")
+        self.last_success: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        metrics.gauge(
+            "backup_last_success_age_seconds", "Сколько секунд назад сделана последняя резервная копия",
+            lambda: [({}, time.time() - self.last_success)] if self.last_success else []
+        )
+
+    def start(self):
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def backup_now(self) -> Optional[dict]:
+        """Делает копию (одновременно - не больше одной). Возвращает сведения о копии или None при ошибке."""
+        async with self._lock:
+            try:
+                result = await asyncio.to_thread(run_backup)
+            except Exception:
+                self.failures.inc()
+                log.exception("Ошибка резервного копирования", extra={'path': database.DATABASE_NAME})
+                return None
+
+        self.duration.observe(result['seconds'])
+        self.last_success = time.time()
+        log.info("Резервная копия создана", extra=result)
+        return result
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.backup_now()
+
+def main():
+    parser = argparse.ArgumentParser(description="Резервная копия базы текущего ивента")
+    parser.add_argument('--list', action='store_true', help="Показать существующие копии")
+    args = parser.parse_args()
+
+    if args.list:
+        for path in list_backups():
+            print(f"{path}\t{os.path.getsize(path)}")
+        return
+
+    try:
+        result = run_backup()
+    except (RuntimeError, sqlite3.Error, OSError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"{result['path']}: {result['size_bytes']} -> {result['archive_bytes']} байт, "
+          f"шагов {result['steps']}, перезапусков {result['restarts']}, {result['seconds']} с")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+# bench_database.py
+# Нагрузочные замеры функций database.py на синтетических данных.
+#
+#   python bench_database.py --size s m --output before.json
+#   python bench_database.py --size s m --baseline before.json --output after.json
+#
+# Наборы данных воспроизводимы (--seed) и кэшируются в bench_data/; результаты - JSON
+# с p50/p99, пропускной способностью и выделением памяти (tracemalloc) по каждой функции.
+import argparse
+import datetime
+import hashlib
+import inspect
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import config
+import database
+import storage
+
+# Пресеты размеров: (игроков, скриншотов)
+SIZES = {
+    's': (1_000, 10_000),
+    'm': (10_000, 200_000),
+    'l': (100_000, 2_000_000),
+}
+
+BENCH_GUILD_ID = 1
+# Второй сервер (10% объема) проверяет, что запросы одного сервера не читают чужие строки
+OTHER_GUILD_ID = 2
+FIRST_DISCORD_ID = 300_000_000_000_000_000
+
+# Распределение статусов модерации: одобрено / отклонено / ожидает
+STATUS_WEIGHTS = ((True, 55), (False, 15), (None, 30))
+DISQUALIFIED_SHARE = 0.02
+DUPLICATE_SHARE = 0.03
+EVENT_START = datetime.datetime(2025, 8, 1, 12, 0, 0)
+EVENT_DAYS = 7
+
+# Версия генератора: при изменении генератора или схемы кэш наборов пересоздается
+GENERATOR_VERSION = 2
+
+DATA_DIR = "bench_data"
+
+def _dataset_key(players: int, submissions: int, seed: int) -> str:
+    source = inspect.getsource(database.SQLiteStorage.setup_database) + str(GENERATOR_VERSION)
+    schema = hashlib.sha1(source.encode('utf-8')).hexdigest()[:8]
+    return f"bench_{players}_{submissions}_{seed}_{schema}"
+
+def _generate_guild(cursor, rng: random.Random, guild_id: int, players: int, submissions: int,
+                    first_submission_id: int) -> int:
+    """Заполняет один сервер: игроки, скриншоты, файлы архива и карточки модерации."""
+    discord_ids = [FIRST_DISCORD_ID + i for i in range(players)]
+    disqualified = set(rng.sample(discord_ids, int(players * DISQUALIFIED_SHARE)))
+
+    cursor.executemany('''
+        INSERT INTO players (guild_id, discord_id, static_id, nickname, registration_time, is_disqualified)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (
+        (guild_id, discord_id, f"{rng.randrange(10**6):06d}", f"Player_{discord_id % 10**6}",
+         storage.to_epoch_ms(EVENT_START + datetime.timedelta(seconds=rng.randrange(86_400))),
+         discord_id in disqualified)
+        for discord_id in discord_ids
+    ))
+
+    # Активность игроков распределена по Парето: немногие присылают большую часть скриншотов
+    weights = [rng.paretovariate(1.2) for _ in discord_ids]
+    authors = rng.choices(discord_ids, weights=weights, k=submissions)
+    offsets = sorted(rng.randrange(EVENT_DAYS * 86_400 * 1000) for _ in range(submissions))
+    statuses = rng.choices([status for status, _ in STATUS_WEIGHTS],
+                           weights=[weight for _, weight in STATUS_WEIGHTS], k=submissions)
+
+    rows = []
+    files = []
+    hashes = []
+    numbers = dict.fromkeys(discord_ids, 0)  # Скриншоты идут по времени: seq - счетчик игрока
+    for i in range(submissions):
+        submission_id = first_submission_id + i
+        numbers[authors[i]] += 1
+        if hashes and rng.random() < DUPLICATE_SHARE:
+            sha256, duplicate_of = rng.choice(hashes)
+        else:
+            sha256, duplicate_of = f"{rng.getrandbits(256):064x}", None
+            hashes.append((sha256, submission_id))
+            files.append((sha256, f"{config.SCREENSHOT_ARCHIVE_DIR}/{sha256[:2]}/{sha256[2:4]}/{sha256}.png",
+                          'png', 1920, 1080, rng.randrange(200_000, 3_000_000),
+                          database._to_signed64(rng.getrandbits(64))))
+        rows.append((
+            submission_id, guild_id, authors[i], f"https://cdn.discordapp.com/attachments/{submission_id}.png",
+            storage.to_epoch_ms(EVENT_START) + offsets[i],
+            True, statuses[i], sha256, duplicate_of, numbers[authors[i]]
+        ))
+
+    cursor.executemany('''
+        INSERT INTO submissions (submission_id, guild_id, player_id, screenshot_url, submission_time,
+                                 is_valid, is_approved, file_sha256, duplicate_of, seq)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    cursor.executemany('INSERT OR IGNORE INTO screenshot_files VALUES (?, ?, ?, ?, ?, ?, ?)', files)
+
+    # Все рассмотренные и 80% ожидающих скриншотов уже опубликованы в канале модерации (по 10 на сообщение)
+    cards = [row[0] for row in rows if row[6] is not None or rng.random() < 0.8]
+    cursor.executemany(
+        'INSERT INTO moderation_cards (submission_id, channel_id, message_id) VALUES (?, ?, ?)',
+        ((submission_id, guild_id * 1000, submission_id // 10) for submission_id in cards)
+    )
+    return first_submission_id + submissions
+
+def build_dataset(players: int, submissions: int, seed: int) -> str:
+    """Возвращает путь к набору данных, создавая его при первом запуске."""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    path = os.path.join(DATA_DIR, _dataset_key(players, submissions, seed) + ".db")
+    if os.path.exists(path):
+        return path
+
+    print(f"⏳ Генерация набора: {players} игроков, {submissions} скриншотов...", file=sys.stderr)
+    started = time.perf_counter()
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    database.DATABASE_NAME = tmp_path
+    database.setup_database()
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(tmp_path)
+    cursor = conn.cursor()
+    next_id = _generate_guild(cursor, rng, BENCH_GUILD_ID, players, submissions, 1)
+    _generate_guild(cursor, rng, OTHER_GUILD_ID, max(1, players // 10), max(1, submissions // 10), next_id)
+    database._rebuild_hourly_stats(cursor)
+    conn.commit()
+    cursor.execute('ANALYZE')
+    conn.close()
+
+    os.replace(tmp_path, path)
+    print(f"✅ Набор создан за {time.perf_counter() - started:.1f} с", file=sys.stderr)
+    return path
+
+class Context:
+    """Данные набора, из которых берутся аргументы вызовов."""
+
+    def __init__(self, path: str, rng: random.Random):
+        conn = sqlite3.connect(path)
+        cursor = conn.cursor()
+        cursor.execute('SELECT discord_id FROM players WHERE guild_id = ?', (BENCH_GUILD_ID,))
+        self.players = [row[0] for row in cursor.fetchall()]
+        cursor.execute('SELECT MIN(submission_id), MAX(submission_id) FROM submissions WHERE guild_id = ?',
+                       (BENCH_GUILD_ID,))
+        self.first_submission, self.last_submission = cursor.fetchone()
+        cursor.execute('SELECT sha256 FROM screenshot_files LIMIT 10000')
+        self.hashes = [row[0] for row in cursor.fetchall()]
+        conn.close()
+        self.rng = rng
+        self.next_discord_id = FIRST_DISCORD_ID + 10**9
+
+    def player(self) -> int:
+        return self.rng.choice(self.players)
+
+    def submission(self) -> int:
+        return self.rng.randint(self.first_submission, self.last_submission)
+
+    def sha256(self) -> str:
+        return self.rng.choice(self.hashes)
+
+    def new_player(self) -> int:
+        self.next_discord_id += 1
+        return self.next_discord_id
+
+# Функция database.py -> аргументы очередного вызова
+BENCHMARKS = [
+    ('setup_database', lambda c: ()),
+    ('get_guild_settings', lambda c: (BENCH_GUILD_ID,)),
+    ('update_guild_settings', lambda c: (BENCH_GUILD_ID, None, None, 1234)),
+    ('register_player', lambda c: (BENCH_GUILD_ID, c.new_player(), "000000", "Bench")),
+    ('get_player', lambda c: (BENCH_GUILD_ID, c.player())),
+    ('get_player_guilds', lambda c: (c.player(),)),
+    ('list_players', lambda c: (BENCH_GUILD_ID,)),
+    ('add_submission', lambda c: (BENCH_GUILD_ID, c.player(), "https://cdn/bench.png", c.sha256())),
+    ('get_player_submissions', lambda c: (BENCH_GUILD_ID, c.player())),
+    ('get_player_submissions_page', lambda c: (BENCH_GUILD_ID, c.player(), c.rng.choice((None, 'pending')))),
+    ('get_player_submission_counts', lambda c: (BENCH_GUILD_ID, c.player())),
+    ('get_leaderboard', lambda c: (BENCH_GUILD_ID,)),
+    ('get_all_players_stats', lambda c: (BENCH_GUILD_ID,)),
+    ('disqualify_player', lambda c: (BENCH_GUILD_ID, c.player())),
+    ('cancel_disqualification', lambda c: (BENCH_GUILD_ID, c.player())),
+    ('is_player_disqualified', lambda c: (BENCH_GUILD_ID, c.player())),
+    ('approve_screenshot', lambda c: (c.submission(),)),
+    ('reject_screenshot', lambda c: (c.submission(),)),
+    ('get_approved_screenshots_stats', lambda c: (BENCH_GUILD_ID,)),
+    ('get_submission_by_id', lambda c: (c.submission(),)),
+    ('get_leaderboard_by_approved', lambda c: (BENCH_GUILD_ID,)),
+    ('get_player_screenshot_number', lambda c: (c.player(), c.submission())),
+    ('save_moderation_cards', lambda c: (1000, c.rng.getrandbits(40), [c.submission() for _ in range(10)])),
+    ('get_moderation_card_group', lambda c: (c.submission(),)),
+    ('get_unposted_pending_submissions', lambda c: (BENCH_GUILD_ID,)),
+    ('save_screenshot_file', lambda c: (f"{c.rng.getrandbits(256):064x}", "/bench.png", 'png', 1, 1, 1)),
+    ('get_screenshot_file', lambda c: (c.sha256(),)),
+    ('save_perceptual_hash', lambda c: (c.sha256(), c.rng.getrandbits(64))),
+    ('get_guild_perceptual_hashes', lambda c: (BENCH_GUILD_ID,)),
+    ('get_hourly_stats', lambda c: (BENCH_GUILD_ID, EVENT_START)),
+    # Разрушающая операция: выполняется последней, один раз, на втором сервере
+    ('reset_all_statistics', lambda c: (OTHER_GUILD_ID,)),
+]
+
+def _percentile(sorted_values, q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+def _measure_memory(function, args) -> tuple:
+    """
+    Пик выделенной за вызов памяти и память, которую занимает возвращенный результат, в КБ
+    (размер записей, которые держат у себя вызывающий код и представления).
+    """
+    tracemalloc.start()
+    try:
+        result = function(*args)
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return round(peak / 1024, 2), round(retained / 1024, 2)
+
+def run_function(name: str, make_args, ctx: Context, budget: float, max_iterations: int) -> dict:
+    """
+    Вызывает функцию, пока не исчерпан бюджет времени (не меньше 3 и не больше max_iterations раз),
+    и отдельным вызовом под tracemalloc меряет выделение памяти.
+    """
+    function = getattr(database, name)
+    iterations = 1 if name == 'reset_all_statistics' else max_iterations
+    durations = []
+    deadline = time.perf_counter() + budget
+
+    for i in range(iterations):
+        args = make_args(ctx)
+        started = time.perf_counter()
+        function(*args)
+        durations.append(time.perf_counter() - started)
+        if i >= 2 and time.perf_counter() > deadline:
+            break
+
+    durations.sort()
+    total = sum(durations)
+    alloc_peak_kb, retained_kb = (None, None) if iterations == 1 else _measure_memory(function, make_args(ctx))
+    return {
+        'iterations': len(durations),
+        'p50_ms': round(_percentile(durations, 0.50) * 1000, 4),
+        'p99_ms': round(_percentile(durations, 0.99) * 1000, 4),
+        'mean_ms': round(total / len(durations) * 1000, 4),
+        'ops_per_sec': round(len(durations) / total, 2) if total else None,
+        'alloc_peak_kb': alloc_peak_kb,
+        'retained_kb': retained_kb,
+    }
+
+def run_dataset(size: str, seed: int, budget: float, max_iterations: int) -> dict:
+    players, submissions = SIZES[size]
+    source = build_dataset(players, submissions, seed)
+
+    # Функции записи меняют данные, поэтому каждый прогон идет на копии набора
+    work_path = source.replace('.db', '.run.db')
+    shutil.copyfile(source, work_path)
+    database.DATABASE_NAME = work_path
+
+    ctx = Context(work_path, random.Random(seed))
+    results = {}
+    for name, make_args in BENCHMARKS:
+        results[name] = run_function(name, make_args, ctx, budget, max_iterations)
+        print(f"  {name:<34} p50 {results[name]['p50_ms']:>10.3f} мс  p99 {results[name]['p99_ms']:>10.3f} мс"
+              f"  ({results[name]['iterations']} вызовов)"
+              + (f"  память {results[name]['alloc_peak_kb']:.1f}/{results[name]['retained_kb']:.1f} КБ"
+                 if results[name]['alloc_peak_kb'] is not None else ""), file=sys.stderr)
+
+    os.remove(work_path)
+    return {'size': size, 'players': players, 'submissions': submissions, 'seed': seed, 'results': results}
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+def compare(baseline: dict, current: dict, threshold: float, min_delta_ms: float) -> list:
+    """
+    Сравнивает p50 с предыдущим прогоном. Регрессия - рост больше чем в threshold раз
+    и больше чем на min_delta_ms (чтобы не реагировать на шум быстрых функций).
+    Возвращает список регрессий (size, function, ratio).
+    """
+    regressions = []
+    previous = {(dataset['size'], name): result
+                for dataset in baseline['datasets'] for name, result in dataset['results'].items()}
+
+    print(f"\n{'набор':<5} {'функция':<34} {'было p50':>10} {'стало p50':>10} {'изм.':>7}", file=sys.stderr)
+    for dataset in current['datasets']:
+        for name, result in dataset['results'].items():
+            before = previous.get((dataset['size'], name))
+            if not before or not before['p50_ms']:
+                continue
+            ratio = result['p50_ms'] / before['p50_ms']
+            regressed = ratio > threshold and result['p50_ms'] - before['p50_ms'] > min_delta_ms
+            mark = " ⚠️" if regressed else ""
+            print(f"{dataset['size']:<5} {name:<34} {before['p50_ms']:>10.3f} {result['p50_ms']:>10.3f}"
+                  f" {ratio:>6.2f}x{mark}", file=sys.stderr)
+            if regressed:
+                regressions.append((dataset['size'], name, round(ratio, 2)))
+
+    # Память - только для сведения: результаты прогонов без замера памяти пропускаются
+    rows = [(dataset['size'], name, previous[(dataset['size'], name)], result)
+            for dataset in current['datasets'] for name, result in dataset['results'].items()
+            if result.get('retained_kb') is not None
+            and previous.get((dataset['size'], name), {}).get('retained_kb') is not None]
+    if rows:
+        print(f"\n{'набор':<5} {'функция':<34} {'пик, КБ':>16} {'результат, КБ':>16}", file=sys.stderr)
+        for size, name, before, result in rows:
+            print(f"{size:<5} {name:<34} {before['alloc_peak_kb']:>7.1f} → {result['alloc_peak_kb']:<7.1f}"
+                  f" {before['retained_kb']:>7.1f} → {result['retained_kb']:<7.1f}", file=sys.stderr)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры функций database.py на синтетических данных")
+    parser.add_argument('--size', nargs='+', choices=SIZES, default=['s'], help="Размеры наборов: s, m, l")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--budget', type=float, default=2.0, help="Секунд на одну функцию")
+    parser.add_argument('--iterations', type=int, default=200, help="Максимум вызовов одной функции")
+    parser.add_argument('--output', help="Файл для результатов JSON (по умолчанию stdout)")
+    parser.add_argument('--baseline', help="Результаты предыдущего прогона для сравнения")
+    parser.add_argument('--threshold', type=float, default=1.2, help="Рост p50, считающийся регрессией")
+    parser.add_argument('--min-delta-ms', type=float, default=0.1, help="Минимальный рост p50 для регрессии, мс")
+    parser.add_argument('--fail-on-regression', action='store_true', help="Код выхода 1 при регрессии")
+    args = parser.parse_args()
+
+    config.SLOW_QUERY_LOG_ENABLED = False
+    # Наборы данных - файлы SQLite, поэтому замеры всегда идут через SQLiteStorage
+    database.use_storage(database.SQLiteStorage())
+    measured = {name for name, _ in BENCHMARKS}
+    missing = [name for name in storage.OPERATIONS if name not in measured]
+    if missing:
+        print(f"⚠️ Не измеряются: {', '.join(sorted(missing))}", file=sys.stderr)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'budget_seconds': args.budget,
+            'max_iterations': args.iterations,
+        },
+        'datasets': []
+    }
+    for size in args.size:
+        print(f"📊 Набор {size}: {SIZES[size][0]} игроков, {SIZES[size][1]} скриншотов", file=sys.stderr)
+        report['datasets'].append(run_dataset(size, args.seed, args.budget, args.iterations))
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(json.load(f), report, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n❌ Регрессии: {regressions}", file=sys.stderr)
+            if args.fail_on_regression:
+                sys.exit(1)
+
+if __name__ == "__main__":
+    main()
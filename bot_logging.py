@@ -0,0 +1,142 @@
+# bot_logging.py
+import atexit
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+
+import config
+
+# Идентификаторы текущего взаимодействия (interaction_id, submission_id, user_id, guild_id).
+# Каждый обработчик discord.py выполняется в своей задаче asyncio, поэтому значения не смешиваются.
+_context: contextvars.ContextVar[dict] = contextvars.ContextVar('log_context', default={})
+
+# Стандартные атрибуты LogRecord: все остальное считается полями записи из extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+_configured = False
+
+def get_logger(name: str) -> logging.Logger:
+    """Логгер подсистемы бота, например get_logger('dm') -> photoevent.dm."""
+    return logging.getLogger(f"photoevent.{name}")
+
+def bind(**ids):
+    """
+    Добавляет идентификаторы ко всем записям журнала до конца текущей задачи.
+    Вместо interaction можно передать сам объект discord.Interaction.
+    """
+    interaction = ids.pop('interaction', None)
+    if interaction is not None:
+        ids.setdefault('interaction_id', interaction.id)
+        ids.setdefault('user_id', interaction.user.id)
+        if interaction.guild_id:
+            ids.setdefault('guild_id', interaction.guild_id)
+    _context.set({**_context.get(), **ids})
+
+class ContextFilter(logging.Filter):
+    """Копирует идентификаторы взаимодействия в запись (выполняется в потоке цикла событий, дешево)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for key, value in _context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только долю записей ниже WARNING (для разговорчивых подсистем)."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+class JsonFormatter(logging.Formatter):
+    """Одна строка JSON на запись: время, уровень, логгер, сообщение и поля из extra/bind."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and key not in data:
+                data[key] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Кладет запись в очередь как есть: форматирование (включая трассировку исключения)
+    выполняется в потоке QueueListener, а не в цикле событий.
+    """
+
+    def __init__(self, handlers):
+        super().__init__(queue.SimpleQueue())
+        self.listener = logging.handlers.QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+        self._stopped = False
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def stop(self):
+        """Дописывает все, что осталось в очереди, и останавливает фоновый поток."""
+        if not self._stopped:
+            self._stopped = True
+            self.listener.stop()
+
+    def close(self):
+        self.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+        super().close()
+
+def queued(*handlers: logging.Handler) -> logging.Handler:
+    """Обработчик, который передает записи в handlers через очередь и фоновый поток."""
+    handler = _DeferredQueueHandler(handlers)
+    atexit.register(handler.stop)
+    return handler
+
+def setup_logging():
+    """
+    Настраивает журнал бота: записи из логгеров photoevent.* через очередь передаются
+    фоновому потоку, который форматирует их в JSON и пишет в stdout (и в файл, если он задан).
+    """
+    global _configured
+    if _configured:
+        return
+    _configured = True
+
+    formatter = JsonFormatter()
+    handlers = []
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+    handlers.append(stream_handler)
+
+    if config.LOG_FILE:
+        file_handler = logging.handlers.RotatingFileHandler(
+            config.LOG_FILE, maxBytes=config.LOG_FILE_MAX_BYTES, backupCount=config.LOG_FILE_BACKUPS, encoding='utf-8'
+        )
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+
+    queue_handler = queued(*handlers)
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger('photoevent')
+    root.setLevel(config.LOG_LEVEL)
+    root.propagate = False
+    root.addHandler(queue_handler)
+
+    for name, rate in config.LOG_SAMPLING.items():
+        logging.getLogger(f"photoevent.{name}").addFilter(SamplingFilter(rate))
@@ -9,12 +9,18 @@ load_dotenv()
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 
 # ID вашего сервера (гильдии) - замените на реальный ID
+# Существующие данные из базы одного сервера при обновлении переносятся на этот сервер
 GUILD_ID = 714813888226525226
 
+# Серверы, для которых слэш-команды синхронизируются сразу
+# (пустой список - глобальная синхронизация для всех серверов бота)
+GUILD_IDS = [GUILD_ID]
+
 # Примечание: Админ команды теперь работают для всех пользователей 
 # с правами администратора на сервере (не нужна отдельная роль)
 
-# Настройки времени проведения ивента (формат ISO 8601)
+# Настройки времени проведения ивента по умолчанию (формат ISO 8601)
+# Для отдельного сервера их можно переопределить командой /admin_event_settings
 # Пример: 10 июля 2025, 18:00 по московскому времени (UTC+3)
 EVENT_START_TIME = "2025-06-10T18:00:00+03:00"
 # Пример: 17 июля 2025, 23:59 по московскому времени (UTC+3)
@@ -22,3 +28,145 @@ EVENT_END_TIME = "2025-07-17T23:59:00+03:00"
 
 # Малиновый цвет для Embed-сообщений
 RASPBERRY_COLOR = 0xE30B5D
+
+# ID канала модерации сервера GUILD_ID, куда публикуются карточки новых скриншотов
+# (None - канал модерации отключен, скриншоты доступны только через /admin_stats)
+# Для других серверов канал задается командой /admin_event_settings
+MODERATION_CHANNEL_ID = None
+# Ограничение отправки в канал модерации: не более N сообщений за M секунд
+MODERATION_INBOX_RATE = 5
+MODERATION_INBOX_PER = 5.0
+# Сколько секунд ждать следующие скриншоты, чтобы объединить их в одно сообщение
+MODERATION_INBOX_COALESCE_SECONDS = 2.0
+
+# Хранилище данных: "sqlite" - файл базы текущего ивента (database.py), "memory" - словари
+# в памяти процесса без файлов, для тестов и нагрузочных прогонов (memory_storage.py)
+STORAGE_ENGINE = os.getenv('STORAGE_ENGINE', 'sqlite')
+
+# Каждый ивент хранится в своем файле базы: /reset_stats начинает новый файл,
+# а файл прошлого ивента в фоне сжимается в архив (см. event_files.py)
+EVENTS_DIR = "events"
+EVENT_ARCHIVE_DIR = "events/archive"
+# Распакованные архивы прошлых ивентов, открытые только для чтения
+EVENT_ARCHIVE_CACHE_DIR = "events/readonly"
+# Степень сжатия gzip (1 - быстрее, 9 - меньше)
+EVENT_ARCHIVE_COMPRESSLEVEL = 6
+
+# Выгрузка игроков и скриншотов (data_export.py, команда /admin_export): строк в одной порции
+EXPORT_CHUNK_SIZE = 5000
+# Предел размера файла, который бот прикладывает к ответу (больше - только через командную строку)
+EXPORT_MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+
+# Массовая загрузка (data_import.py): строк в одной транзакции и кэш страниц SQLite на время загрузки
+IMPORT_BATCH_SIZE = 50000
+IMPORT_CACHE_KB = 64 * 1024
+
+# Резервные копии базы текущего ивента (backup.py): раз в BACKUP_INTERVAL_SECONDS (None - не делать)
+BACKUP_DIR = "backups"
+BACKUP_INTERVAL_SECONDS = 3600
+# Копирование идет шагами по BACKUP_PAGES_PER_STEP страниц с паузой BACKUP_STEP_SLEEP секунд
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP = 0.01
+# Сколько раз копирование может начаться заново из-за записи бота (потом - одним шагом)
+BACKUP_MAX_RESTARTS = 5
+BACKUP_COMPRESSLEVEL = 6
+# Хранятся BACKUP_KEEP_RECENT последних копий и последняя копия каждого дня за BACKUP_KEEP_DAILY дней
+BACKUP_KEEP_RECENT = 24
+BACKUP_KEEP_DAILY = 14
+
+# Непрерывная репликация WAL базы текущего ивента (replication.py) в REPLICA_DIR (None - не вести)
+REPLICA_DIR = "replica"
+# Как часто новые кадры WAL копируются в реплику, секунд
+REPLICATION_INTERVAL = 1.0
+# WAL больше REPLICATION_CHECKPOINT_BYTES переносится в базу репликатором - раньше, чем
+# автоматическая контрольная точка SQLite (1000 страниц), которая вынудила бы начать новое поколение
+REPLICATION_CHECKPOINT_BYTES = 2 * 1024 * 1024
+# Сколько контрольная точка ждет читателей и писателей бота, секунд (заняты - попытка при следующей синхронизации)
+REPLICATION_CHECKPOINT_TIMEOUT = 0.1
+# Сколько после контрольной точки репликатор ждет блокировку записи, чтобы докопировать хвост WAL, мс
+REPLICATION_LOCK_TIMEOUT_MS = 5000
+# Новое поколение (свежий снимок базы) не реже раза в REPLICATION_SNAPSHOT_INTERVAL_SECONDS
+REPLICATION_SNAPSHOT_INTERVAL_SECONDS = 24 * 3600
+# Поколения, закончившиеся раньше REPLICATION_RETENTION_HOURS назад, удаляются
+REPLICATION_RETENTION_HOURS = 72
+REPLICATION_COMPRESSLEVEL = 6
+
+# Локальный архив скриншотов (ссылки Discord CDN со временем истекают)
+SCREENSHOT_ARCHIVE_DIR = "screenshot_archive"
+# Сколько вложений скачивается одновременно
+ARCHIVE_DOWNLOAD_CONCURRENCY = 4
+# Максимальный размер скриншота в байтах
+ARCHIVE_MAX_FILE_SIZE = 25 * 1024 * 1024
+
+# Поиск похожих скриншотов по перцептивному хешу (нужен Pillow)
+# Число процессов для расчета хешей
+PHASH_WORKERS = 2
+# Максимальное расстояние Хэмминга между хешами похожих скриншотов (из 64 бит)
+PHASH_MAX_DISTANCE = 10
+# Сколько похожих скриншотов показывать модератору
+PHASH_MAX_MATCHES = 3
+
+# Превью скриншотов для embed модерации и личных сообщений (нужен Pillow)
+THUMBNAIL_DIR = "screenshot_previews"
+# Максимальная сторона превью в пикселях и качество WebP
+THUMBNAIL_MAX_SIDE = 640
+THUMBNAIL_QUALITY = 75
+# Размер кэша превью на диске; при превышении удаляются давно не показанные
+THUMBNAIL_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# Число процессов для создания превью
+THUMBNAIL_WORKERS = 2
+
+# Адрес REST API Discord. Для нагрузочных прогонов без сети - локальная имитация
+# discord_standin.py, например http://127.0.0.1:8787/api/v10 (None - настоящий Discord)
+DISCORD_API_BASE = os.getenv('DISCORD_API_BASE')
+
+# Метрики в формате Prometheus на локальном HTTP endpoint /metrics (None - не запускать)
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+
+# Журнал медленных запросов к базе (включается переменной окружения SLOW_QUERY_LOG=1)
+SLOW_QUERY_LOG_ENABLED = os.getenv('SLOW_QUERY_LOG') == '1'
+# Выражения дольше порога записываются в журнал вместе с EXPLAIN QUERY PLAN
+SLOW_QUERY_THRESHOLD_MS = 50
+SLOW_QUERY_LOG_FILE = "slow_queries.log"
+SLOW_QUERY_LOG_MAX_BYTES = 5 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 3
+# Чтение, которое идет дольше этого времени, прерывается (0 - не прерывать)
+QUERY_MAX_READ_SECONDS = 5.0
+# Как часто (в шагах виртуальной машины SQLite) вызывается обработчик прогресса
+QUERY_PROGRESS_STEPS = 1000
+
+# Сторож цикла событий: пульс каждые LOOP_WATCHDOG_INTERVAL секунд,
+# при блокировке дольше LOOP_STALL_THRESHOLD секунд стек записывается в журнал бота (логгер watchdog)
+LOOP_WATCHDOG_INTERVAL = 0.1
+LOOP_STALL_THRESHOLD = 0.25
+# Сколько последних кадров стека записывать в журнал
+LOOP_STALL_STACK_DEPTH = 20
+
+# Журнал бота: строки JSON в stdout (и в файл, если LOG_FILE задан); запись идет в фоновом потоке
+LOG_LEVEL = "INFO"
+LOG_FILE = None
+LOG_FILE_MAX_BYTES = 10 * 1024 * 1024
+LOG_FILE_BACKUPS = 5
+# Доля записей ниже WARNING, которые сохраняются для разговорчивых подсистем
+LOG_SAMPLING = {
+    "dm": 0.1,
+    "ingest": 0.1,
+    "inbox": 0.1,
+}
+
+# Трассировка взаимодействий: спаны обработчиков, запросов к базе и к Discord API
+# в файле формата OTLP/JSON (отключается переменной окружения TRACING=0)
+TRACING_ENABLED = os.getenv('TRACING') != '0'
+# Доля трасс, записываемых в файл; медленные трассы и трассы с ошибкой записываются всегда
+TRACE_SAMPLE_RATE = 0.01
+# Взаимодействия дольше порога записываются в журнал бота с разбивкой времени
+TRACE_SLOW_MS = 1000
+# Сколько самых долгих спанов показывать в разбивке
+TRACE_SLOW_TOP_SPANS = 5
+# Предел спанов в одной трассе (остальные только считаются)
+TRACE_MAX_SPANS = 500
+TRACE_SERVICE_NAME = "photoevent"
+TRACE_FILE = "traces.jsonl"
+TRACE_FILE_MAX_BYTES = 20 * 1024 * 1024
+TRACE_FILE_BACKUPS = 3
@@ -0,0 +1,188 @@
+# data_export.py
+# Потоковая выгрузка игроков и скриншотов ивента в CSV, JSONL или Parquet.
+#
+#   python data_export.py submissions --output submissions.csv.gz
+#   python data_export.py players --guild 123456789 --format parquet --output players.parquet
+#   python data_export.py submissions --event event_20250717_120000.db --format jsonl --output old.jsonl
+#
+# Строки читаются порциями по ключу (keyset), а не одним fetchall: память не растет
+# с размером ивента, и между порциями бот может писать в базу.
+import argparse
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import urllib.request
+from typing import Iterator, List, Optional, Tuple
+
+import config
+import database
+import event_files
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Без pyarrow доступны только CSV и JSONL
+    pyarrow = None
+
+FORMATS = ('csv', 'jsonl', 'parquet')
+
+def _iso_sql(column: str) -> str:
+    """
+    Время строкой ISO 8601 в UTC (как его читает data_import.py): в базе - миллисекунды Unix,
+    в архивах ивентов до перехода на них - уже строки.
+    """
+    return (f"CASE WHEN typeof({column}) = 'integer' "
+            f"THEN strftime('%Y-%m-%d %H:%M:%f', {column} / 1000.0, 'unixepoch') ELSE {column} END")
+
+# Таблицы выгрузки: колонки (имя, тип) и запрос очередной порции.
+# Первая колонка запроса - ключ порции, она не выгружается. Условие по серверу
+# с унарным плюсом не дает SQLite выбрать индекс сервера вместо порядка по ключу.
+TABLES = {
+    'players': (
+        [('guild_id', 'int'), ('discord_id', 'int'), ('static_id', 'str'), ('nickname', 'str'),
+         ('registration_time', 'str'), ('is_disqualified', 'bool')],
+        f'''
+        SELECT rowid, guild_id, discord_id, static_id, nickname, {_iso_sql('registration_time')}, is_disqualified
+        FROM players
+        WHERE rowid > ? {{guild_filter}}
+        ORDER BY rowid LIMIT ?
+        ''',
+        'AND +guild_id = ?'
+    ),
+    'submissions': (
+        [('submission_id', 'int'), ('guild_id', 'int'), ('player_id', 'int'), ('static_id', 'str'),
+         ('nickname', 'str'), ('screenshot_url', 'str'), ('submission_time', 'str'), ('is_valid', 'bool'),
+         ('is_approved', 'bool'), ('file_sha256', 'str'), ('duplicate_of', 'int')],
+        f'''
+        SELECT s.submission_id, s.submission_id, s.guild_id, s.player_id, p.static_id, p.nickname,
+               s.screenshot_url, {_iso_sql('s.submission_time')}, s.is_valid, s.is_approved, s.file_sha256,
+               s.duplicate_of
+        FROM submissions s
+        LEFT JOIN players p ON p.guild_id = s.guild_id AND p.discord_id = s.player_id
+        WHERE s.submission_id > ? {{guild_filter}}
+        ORDER BY s.submission_id LIMIT ?
+        ''',
+        'AND +s.guild_id = ?'
+    ),
+}
+
+def _open(event: Optional[str]) -> sqlite3.Connection:
+    """База текущего ивента или прошлого ивента из архива, только для чтения."""
+    if event:
+        return event_files.open_archived_event(event)
+    uri = f"file:{urllib.request.pathname2url(os.path.abspath(database.DATABASE_NAME))}?mode=ro"
+    return sqlite3.connect(uri, uri=True)
+
+def iter_chunks(table: str, guild_id: Optional[int] = None, event: Optional[str] = None,
+                chunk_size: int = config.EXPORT_CHUNK_SIZE) -> Iterator[List[tuple]]:
+    """
+    Порции строк таблицы (списки кортежей в порядке колонок TABLES[table]).
+    Каждая порция - отдельный короткий запрос, поэтому блокировка чтения не держится всю выгрузку.
+    """
+    columns, query, guild_filter = TABLES[table]
+    kinds = [kind for _, kind in columns]
+    sql = query.format(guild_filter=guild_filter if guild_id is not None else '')
+
+    conn = _open(event)
+    try:
+        last_key = -1 << 63
+        while True:
+            parameters = (last_key, guild_id, chunk_size) if guild_id is not None else (last_key, chunk_size)
+            rows = conn.execute(sql, parameters).fetchall()
+            if not rows:
+                return
+            last_key = rows[-1][0]
+            yield [
+                tuple(bool(value) if kind == 'bool' and value is not None else value
+                      for kind, value in zip(kinds, row[1:]))
+                for row in rows
+            ]
+    finally:
+        conn.close()
+
+def _open_text(path: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+def _write_csv(chunks: Iterator[List[tuple]], names: List[str], path: str) -> int:
+    count = 0
+    with _open_text(path) as f:
+        writer = csv.writer(f)
+        writer.writerow(names)
+        for chunk in chunks:
+            writer.writerows(chunk)
+            count += len(chunk)
+    return count
+
+def _write_jsonl(chunks: Iterator[List[tuple]], names: List[str], path: str) -> int:
+    count = 0
+    with _open_text(path) as f:
+        for chunk in chunks:
+            f.writelines(json.dumps(dict(zip(names, row)), ensure_ascii=False) + '\n' for row in chunk)
+            count += len(chunk)
+    return count
+
+def _write_parquet(chunks: Iterator[List[tuple]], columns: List[Tuple[str, str]], path: str) -> int:
+    """Каждая порция записывается отдельной группой строк Parquet."""
+    types = {'int': pyarrow.int64(), 'str': pyarrow.string(), 'bool': pyarrow.bool_()}
+    schema = pyarrow.schema([(name, types[kind]) for name, kind in columns])
+    count = 0
+    with pyarrow.parquet.ParquetWriter(path, schema, compression='zstd') as writer:
+        for chunk in chunks:
+            arrays = [pyarrow.array(values, type=field.type) for values, field in zip(zip(*chunk), schema)]
+            writer.write_batch(pyarrow.RecordBatch.from_arrays(arrays, schema=schema))
+            count += len(chunk)
+    return count
+
+def export(table: str, output: str, fmt: str = 'csv', guild_id: Optional[int] = None,
+           event: Optional[str] = None, chunk_size: int = config.EXPORT_CHUNK_SIZE) -> int:
+    """
+    Выгружает таблицу (players или submissions) в файл output и возвращает число строк.
+    CSV и JSONL сжимаются gzip, если имя файла оканчивается на .gz. Файл появляется
+    под своим именем только целиком. Работает синхронно - из бота вызывается в отдельном потоке.
+    """
+    if fmt == 'parquet' and pyarrow is None:
+        raise RuntimeError("для Parquet нужен пакет pyarrow (pip install pyarrow)")
+
+    columns = TABLES[table][0]
+    chunks = iter_chunks(table, guild_id, event, chunk_size)
+    tmp_path = output + '.tmp'
+    try:
+        if fmt == 'csv':
+            count = _write_csv(chunks, [name for name, _ in columns], tmp_path)
+        elif fmt == 'jsonl':
+            count = _write_jsonl(chunks, [name for name, _ in columns], tmp_path)
+        elif fmt == 'parquet':
+            count = _write_parquet(chunks, columns, tmp_path)
+        else:
+            raise ValueError(f"неизвестный формат: {fmt}")
+        os.replace(tmp_path, output)
+        return count
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Выгрузка игроков и скриншотов ивента")
+    parser.add_argument('table', choices=TABLES)
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--output', help="Файл результата (по умолчанию <table>.<format>)")
+    parser.add_argument('--guild', type=int, help="Только этот сервер")
+    parser.add_argument('--event', help="Прошлый ивент из архива events/archive (имя файла без .gz)")
+    parser.add_argument('--chunk-size', type=int, default=config.EXPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    output = args.output or f"{args.table}.{args.format}"
+    try:
+        count = export(args.table, output, args.format, args.guild, args.event, args.chunk_size)
+    except (RuntimeError, sqlite3.Error, OSError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"{count} строк -> {output}")
+
+if __name__ == "__main__":
+    main()
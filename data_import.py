@@ -0,0 +1,272 @@
+# data_import.py
+# Массовая загрузка игроков и скриншотов из CSV или JSONL (например, ростер из таблицы
+# или выгрузка data_export.py для восстановления).
+#
+#   python data_import.py players roster.csv --guild 123456789
+#   python data_import.py submissions submissions.jsonl.gz --rejects rejects.jsonl
+#
+# Файл читается и проверяется построчно; корректные строки вставляются через executemany
+# большими транзакциями. Строки с ошибками не прерывают загрузку и записываются в файл отказов (JSONL).
+#
+# С --defer-indexes вторичные индексы таблицы удаляются на время загрузки и пересоздаются один раз
+# после нее: так быстрее, но запросы бота к таблице в это время идут полным просмотром. Только для
+# базы, с которой бот не работает (восстановление, подготовка ивента).
+import argparse
+import csv
+import datetime
+import gzip
+import json
+import re
+import sqlite3
+import sys
+import time
+from typing import Iterator, Optional, Tuple
+
+import config
+import database
+import storage
+
+# Ограничения полей формы регистрации в боте
+MAX_STATIC_ID_LENGTH = 50
+MAX_NICKNAME_LENGTH = 50
+
+SQLITE_MAX_INT = (1 << 63) - 1
+
+_SHA256 = re.compile(r'[0-9a-f]{64}')
+
+_TRUE = {'1', 'true', 'yes', 'да'}
+_FALSE = {'0', 'false', 'no', 'нет'}
+
+def _read_rows(path: str) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """Строки файла: (номер строки, поля, ошибка разбора). Формат определяется по расширению."""
+    name = path[:-3] if path.endswith('.gz') else path
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8-sig', newline='') as f:
+        if name.endswith('.jsonl'):
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield line_number, None, f"неверный JSON: {e}"
+                    continue
+                if isinstance(row, dict):
+                    yield line_number, row, None
+                else:
+                    yield line_number, None, "строка JSONL должна быть объектом"
+        else:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row, None
+
+def _empty(value) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+def _int(row: dict, field: str, default=None, required: bool = True) -> Optional[int]:
+    value = row.get(field)
+    if _empty(value):
+        if default is None and required:
+            raise ValueError(f"нет поля {field}")
+        return default
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field}: ожидается целое число, получено {value!r}")
+    if not 0 < number <= SQLITE_MAX_INT:
+        raise ValueError(f"{field}: число вне допустимого диапазона")
+    return number
+
+def _text(row: dict, field: str, max_length: Optional[int] = None) -> str:
+    value = row.get(field)
+    if _empty(value):
+        raise ValueError(f"нет поля {field}")
+    value = str(value).strip()
+    if max_length and len(value) > max_length:
+        raise ValueError(f"{field}: длиннее {max_length} символов")
+    return value
+
+def _bool(row: dict, field: str, default: Optional[bool]) -> Optional[bool]:
+    value = row.get(field)
+    if _empty(value):
+        return default
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    raise ValueError(f"{field}: ожидается true/false, получено {value!r}")
+
+def _time(row: dict, field: str) -> int:
+    """
+    Время в миллисекундах Unix, как оно хранится в базе (пустое поле - текущее время).
+    Принимает ISO 8601 (без пояса - UTC) или уже готовое число миллисекунд.
+    """
+    value = row.get(field)
+    if _empty(value):
+        return storage.to_epoch_ms(datetime.datetime.utcnow())
+    if isinstance(value, int) or str(value).strip().isdigit():
+        return int(value)
+    try:
+        moment = datetime.datetime.fromisoformat(str(value).strip().replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"{field}: неверный формат времени {value!r}")
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return storage.to_epoch_ms(moment)
+
+def _player(row: dict, guild_id: Optional[int]) -> tuple:
+    return (
+        _int(row, 'guild_id', guild_id),
+        _int(row, 'discord_id'),
+        _text(row, 'static_id', MAX_STATIC_ID_LENGTH),
+        _text(row, 'nickname', MAX_NICKNAME_LENGTH),
+        _time(row, 'registration_time'),
+        _bool(row, 'is_disqualified', False)
+    )
+
+def _submission(row: dict, guild_id: Optional[int]) -> tuple:
+    sha256 = row.get('file_sha256')
+    if not _empty(sha256):
+        sha256 = str(sha256).strip().lower()
+        if not _SHA256.fullmatch(sha256):
+            raise ValueError("file_sha256: ожидается 64 шестнадцатеричных символа")
+    else:
+        sha256 = None
+    return (
+        _int(row, 'submission_id', required=False),
+        _int(row, 'guild_id', guild_id),
+        _int(row, 'player_id'),
+        _text(row, 'screenshot_url'),
+        _time(row, 'submission_time'),
+        _bool(row, 'is_valid', True),
+        _bool(row, 'is_approved', None),
+        sha256,
+        _int(row, 'duplicate_of', required=False)
+    )
+
+INSERT_SQL = {
+    'players': '''
+        INSERT INTO players (guild_id, discord_id, static_id, nickname, registration_time, is_disqualified)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT DO NOTHING
+    ''',
+    'submissions': '''
+        INSERT INTO submissions (submission_id, guild_id, player_id, screenshot_url, submission_time,
+                                 is_valid, is_approved, file_sha256, duplicate_of)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT DO NOTHING
+    ''',
+}
+
+def _secondary_indexes(conn: sqlite3.Connection, table: str):
+    """Имена и DDL индексов таблицы, созданных CREATE INDEX (без индексов первичного ключа)."""
+    return conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+        (table,)
+    ).fetchall()
+
+def import_file(table: str, path: str, guild_id: Optional[int] = None, rejects_path: Optional[str] = None,
+                defer_indexes: bool = False, batch_size: int = config.IMPORT_BATCH_SIZE) -> dict:
+    """
+    Загружает players или submissions из CSV/JSONL (можно .gz) в базу текущего ивента.
+    guild_id подставляется в строки без колонки guild_id. Уже существующие строки
+    (тот же игрок на сервере, тот же submission_id) пропускаются и считаются дубликатами.
+    Скриншоты незарегистрированных игроков отклоняются. defer_indexes - удалить вторичные
+    индексы на время загрузки (только если бот не работает с базой).
+    Возвращает счетчики: rows, imported, duplicates, rejected, seconds.
+    """
+    validate = _player if table == 'players' else _submission
+    started = time.perf_counter()
+    stats = {'rows': 0, 'imported': 0, 'duplicates': 0, 'rejected': 0}
+
+    database.setup_database()
+    conn = sqlite3.connect(database.DATABASE_NAME, isolation_level=None)
+    conn.execute(f"PRAGMA cache_size = -{config.IMPORT_CACHE_KB}")
+    rejects = open(rejects_path, 'w', encoding='utf-8') if rejects_path else None
+
+    players = None
+    if table == 'submissions':
+        players = set(conn.execute("SELECT guild_id, discord_id FROM players"))
+
+    indexes = _secondary_indexes(conn, table) if defer_indexes else []
+    try:
+        # Индексы обновляются один раз после загрузки, а не на каждой вставке
+        for name, _ in indexes:
+            conn.execute(f'DROP INDEX "{name}"')
+
+        def flush(batch):
+            conn.execute("BEGIN")
+            before = conn.total_changes
+            conn.executemany(INSERT_SQL[table], batch)
+            conn.execute("COMMIT")
+            inserted = conn.total_changes - before
+            stats['imported'] += inserted
+            stats['duplicates'] += len(batch) - inserted
+
+        batch = []
+        for line_number, row, error in _read_rows(path):
+            stats['rows'] += 1
+            if error is None:
+                try:
+                    values = validate(row, guild_id)
+                    if players is not None and (values[1], values[2]) not in players:
+                        raise ValueError("игрок не зарегистрирован на этом сервере")
+                except ValueError as e:
+                    error = str(e)
+
+            if error is not None:
+                stats['rejected'] += 1
+                if rejects:
+                    rejects.write(json.dumps({'line': line_number, 'error': error, 'row': row},
+                                             ensure_ascii=False, default=str) + '\n')
+                continue
+
+            batch.append(values)
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+    finally:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        for _, sql in indexes:
+            conn.execute(sql)
+        conn.close()
+        if rejects:
+            rejects.close()
+
+    # Загруженные строки минуют операции хранилища, поэтому личные номера скриншотов
+    # выдаются после загрузки, а сводки по часам пересчитываются
+    if table == 'submissions' and stats['imported']:
+        database.number_submissions()
+    if stats['imported']:
+        database.rebuild_hourly_stats()
+
+    stats['seconds'] = round(time.perf_counter() - started, 2)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Массовая загрузка игроков и скриншотов")
+    parser.add_argument('table', choices=INSERT_SQL)
+    parser.add_argument('path', help="Файл .csv или .jsonl (можно .gz)")
+    parser.add_argument('--guild', type=int, help="Сервер для строк без колонки guild_id")
+    parser.add_argument('--rejects', help="Файл JSONL для отклоненных строк")
+    parser.add_argument('--defer-indexes', action='store_true',
+                        help="Удалить индексы на время загрузки (только если бот не работает с базой)")
+    parser.add_argument('--batch-size', type=int, default=config.IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    try:
+        stats = import_file(args.table, args.path, args.guild, args.rejects, args.defer_indexes, args.batch_size)
+    except (sqlite3.Error, OSError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Строк: {stats['rows']}, загружено: {stats['imported']}, дубликатов: {stats['duplicates']}, "
+          f"отклонено: {stats['rejected']} за {stats['seconds']} с")
+
+if __name__ == "__main__":
+    main()
@@ -1,393 +1,1269 @@
 # database.py
+# Хранилище в SQLite (SQLiteStorage) и функции модуля, через которые остальной код
+# обращается к текущему хранилищу (см. storage.py)
+import os
+import re
 import sqlite3
 import datetime
-from typing import Optional, List, Tuple
+import inspect
+from typing import Dict, Optional, List, Tuple
 
-DATABASE_NAME = "event_data.db"
+import config
+import metrics
+import query_log
+import storage
+from bot_logging import get_logger
 
-def setup_database():
-    """Создает таблицы, если они еще не существуют."""
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    
-    # Создание таблицы players
+log = get_logger('db')
+
+DEFAULT_DATABASE_NAME = "event_data.db"
+
+# Файл в config.EVENTS_DIR с путем к базе текущего ивента (появляется после первой смены ивента)
+ACTIVE_EVENT_POINTER = "ACTIVE"
+
+def _active_database() -> str:
+    """Путь к базе текущего ивента."""
+    try:
+        with open(os.path.join(config.EVENTS_DIR, ACTIVE_EVENT_POINTER), encoding='utf-8') as f:
+            return f.read().strip() or DEFAULT_DATABASE_NAME
+    except FileNotFoundError:
+        return DEFAULT_DATABASE_NAME
+
+DATABASE_NAME = _active_database()
+
+def _connect(path: Optional[str] = None) -> sqlite3.Connection:
+    """Открывает соединение с базой (с журналом медленных запросов, если он включен в config.py)."""
+    if config.SLOW_QUERY_LOG_ENABLED:
+        return query_log.connect(path or DATABASE_NAME)
+    return sqlite3.connect(path or DATABASE_NAME)
+
+def _to_signed64(value: int) -> int:
+    """SQLite хранит INTEGER как знаковое 64-битное число."""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+def _from_signed64(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+def _records(record):
+    """Фабрика строк курсора: строка результата сразу становится записью record (storage.py)."""
+    make = record._make
+    return lambda cursor, row: make(row)
+
+# Дисквалификация хранится только в строке игрока: скриншот действителен, если действителен сам
+# и игрок не дисквалифицирован. Запросы скриншотов читают строку игрока через _SUBMISSIONS_WITH_PLAYER
+_SUBMISSIONS_WITH_PLAYER = 'submissions s LEFT JOIN players p ON p.guild_id = s.guild_id AND p.discord_id = s.player_id'
+_IS_VALID_SQL = 'CASE WHEN p.is_disqualified THEN 0 ELSE s.is_valid END'
+
+# Столбцы записи storage.Submission в порядке ее полей
+_SUBMISSION_COLUMNS = (f's.submission_id, s.player_id, s.guild_id, s.screenshot_url, s.submission_time, '
+                       f'{_IS_VALID_SQL}, s.is_approved, s.file_sha256, s.duplicate_of')
+
+# Прибавляет счетчики к сводке сервера за час: (guild_id, hour, submissions, approved, rejected,
+# moderated, registrations)
+_ADD_HOURLY_STATS = '''
+    INSERT INTO hourly_stats (guild_id, hour, submissions, approved, rejected, moderated, registrations)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (guild_id, hour) DO UPDATE SET
+        submissions = submissions + excluded.submissions,
+        approved = approved + excluded.approved,
+        rejected = rejected + excluded.rejected,
+        moderated = moderated + excluded.moderated,
+        registrations = registrations + excluded.registrations
+'''
+
+def _hour_sql(column: str) -> str:
+    """Начало часа для столбца времени (миллисекунды Unix), как storage.hour_bucket."""
+    return f"{column} / {storage.HOUR_MS} * {storage.HOUR_MS}"
+
+def _rebuild_hourly_stats(cursor):
+    """Пересчитывает hourly_stats из players, submissions и moderation_log."""
+    # Скриншот уходит из очереди при первом решении после последнего возврата на модерацию
+    # (без таких решений в журнале - в момент отправки)
+    left_queue_at = '''COALESCE(
+        (SELECT l.decided_at FROM moderation_log l
+         WHERE l.submission_id = s.submission_id AND l.log_id > COALESCE(
+             (SELECT MAX(r.log_id) FROM moderation_log r
+              WHERE r.submission_id = s.submission_id AND r.approved IS NULL), 0)
+         ORDER BY l.log_id LIMIT 1),
+        s.submission_time
+    )'''
+    cursor.execute("DELETE FROM hourly_stats")
+    cursor.execute(f'''
+        INSERT INTO hourly_stats (guild_id, hour, submissions, approved, rejected, moderated, registrations)
+        SELECT guild_id, hour, SUM(submissions), SUM(approved), SUM(rejected), SUM(moderated), SUM(registrations)
+        FROM (
+            SELECT guild_id, {_hour_sql('registration_time')} AS hour,
+                   0 AS submissions, 0 AS approved, 0 AS rejected, 0 AS moderated, 1 AS registrations
+            FROM players
+            UNION ALL
+            SELECT guild_id, {_hour_sql('submission_time')}, 1, 0, 0, 0, 0 FROM submissions
+            UNION ALL
+            SELECT guild_id, {_hour_sql('decided_at')}, 0, approved IS NOT NULL AND approved != 0, approved IS 0, 0, 0
+            FROM moderation_log
+            UNION ALL
+            SELECT s.guild_id, {_hour_sql(left_queue_at)}, 0, 0, 0, 1, 0
+            FROM submissions s WHERE s.is_approved IS NOT NULL
+        )
+        GROUP BY guild_id, hour
+    ''')
+
+def _migrate_to_guild_schema(cursor):
+    """
+    Переносит базу одного сервера на схему с guild_id.
+    Все существующие игроки и скриншоты относятся к config.GUILD_ID.
+    """
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS players (
-            discord_id INTEGER PRIMARY KEY,
+        CREATE TABLE players_new (
+            guild_id INTEGER NOT NULL,
+            discord_id INTEGER NOT NULL,
             static_id TEXT NOT NULL,
             nickname TEXT NOT NULL,
             registration_time TIMESTAMP NOT NULL,
-            is_disqualified BOOLEAN DEFAULT FALSE
+            is_disqualified BOOLEAN DEFAULT FALSE,
+            PRIMARY KEY (guild_id, discord_id)
         )
     ''')
+    cursor.execute('''
+        INSERT INTO players_new (guild_id, discord_id, static_id, nickname, registration_time, is_disqualified)
+        SELECT ?, discord_id, static_id, nickname, registration_time, is_disqualified FROM players
+    ''', (config.GUILD_ID,))
     
-    # Создание таблицы submissions
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS submissions (
+        CREATE TABLE submissions_new (
             submission_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL,
             player_id INTEGER NOT NULL,
             screenshot_url TEXT NOT NULL,
             submission_time TIMESTAMP NOT NULL,
             is_valid BOOLEAN DEFAULT TRUE,
             is_approved BOOLEAN DEFAULT FALSE,
-            FOREIGN KEY (player_id) REFERENCES players (discord_id)
+            FOREIGN KEY (guild_id, player_id) REFERENCES players (guild_id, discord_id)
         )
     ''')
+    cursor.execute('''
+        INSERT INTO submissions_new (submission_id, guild_id, player_id, screenshot_url, submission_time, is_valid, is_approved)
+        SELECT submission_id, ?, player_id, screenshot_url, submission_time, is_valid, is_approved FROM submissions
+    ''', (config.GUILD_ID,))
     
-    # Добавляем поле is_approved если его нет (для обновления существующих баз)
-    try:
-        cursor.execute('ALTER TABLE submissions ADD COLUMN is_approved BOOLEAN DEFAULT FALSE')
-    except sqlite3.OperationalError:
-        pass  # Поле уже существует
-    
-    conn.commit()
-    conn.close()
+    cursor.execute("DROP TABLE submissions")
+    cursor.execute("DROP TABLE players")
+    cursor.execute("ALTER TABLE players_new RENAME TO players")
+    cursor.execute("ALTER TABLE submissions_new RENAME TO submissions")
+
+# Столбцы времени: до перехода на миллисекунды Unix они объявлялись как TIMESTAMP
+# и хранили строки адаптера datetime модуля sqlite3 ("ГГГГ-ММ-ДД ЧЧ:ММ:СС.мкс")
+_TIME_COLUMNS = {'players': 'registration_time', 'submissions': 'submission_time', 'moderation_log': 'decided_at'}
 
-def register_player(discord_id: int, static_id: str, nickname: str) -> bool:
+def _epoch_ms_sql(column: str) -> str:
+    """Строка времени адаптера sqlite3 в миллисекунды Unix (дробная часть может отсутствовать)."""
+    return (f"CASE WHEN typeof({column}) = 'text' THEN CAST(strftime('%s', {column}) AS INTEGER) * 1000 "
+            f"+ CAST(substr({column} || '.000', 21, 3) AS INTEGER) ELSE {column} END")
+
+def _migrate_to_epoch_time(cursor) -> bool:
     """
-    Добавляет нового игрока в таблицу players.
-    Возвращает True при успехе, False если игрок уже существует.
+    Переводит столбцы времени со строк на целые миллисекунды Unix: таблица пересоздается
+    по своему же DDL с типом INTEGER у столбца времени. Индексы создаются заново в setup_database.
+    Возвращает True, если что-то было переведено.
     """
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    
-    try:
-        # Проверяем, существует ли уже игрок
-        cursor.execute("SELECT discord_id FROM players WHERE discord_id = ?", (discord_id,))
-        if cursor.fetchone():
-            conn.close()
-            return False
+    migrated = False
+    for table, column in _TIME_COLUMNS.items():
+        cursor.execute(f"PRAGMA table_info({table})")
+        columns = [(row[1], row[2]) for row in cursor.fetchall()]
+        if (column, 'TIMESTAMP') not in columns:
+            continue
         
-        # Добавляем нового игрока
-        cursor.execute('''
-            INSERT INTO players (discord_id, static_id, nickname, registration_time, is_disqualified)
-            VALUES (?, ?, ?, ?, FALSE)
-        ''', (discord_id, static_id, nickname, datetime.datetime.utcnow()))
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+        ddl = re.sub(r'^CREATE TABLE\s+"?\w+"?', f'CREATE TABLE {table}_new', cursor.fetchone()[0])
+        cursor.execute(ddl.replace(f'{column} TIMESTAMP', f'{column} INTEGER', 1))
         
-        conn.commit()
-        conn.close()
-        return True
-    except sqlite3.Error:
-        conn.close()
-        return False
+        names = [name for name, _ in columns]
+        values = [_epoch_ms_sql(name) if name == column else name for name in names]
+        cursor.execute(f"INSERT INTO {table}_new ({', '.join(names)}) SELECT {', '.join(values)} FROM {table}")
+        
+        # Счетчик AUTOINCREMENT удаляется вместе с таблицей: сохраняем его, чтобы ID не повторялись
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_sequence'")
+        sequence = None
+        if cursor.fetchone():
+            cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,))
+            sequence = cursor.fetchone()
+        
+        cursor.execute(f"DROP TABLE {table}")
+        cursor.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+        if sequence:
+            cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (sequence[0], table))
+        migrated = True
+    return migrated
 
-def get_player(discord_id: int) -> Optional[dict]:
-    """Получает данные игрока."""
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    
+def _number_submissions(cursor) -> int:
+    """
+    Выдает личные номера (seq) скриншотам без номера: по времени отправки (при равном времени -
+    по ID), продолжая нумерацию скриншотов игрока на сервере. Нужна после переноса строк в обход
+    add_submission (обновление старой базы, импорт). Возвращает число пронумерованных скриншотов.
+    """
     cursor.execute('''
-        SELECT discord_id, static_id, nickname, registration_time, is_disqualified
-        FROM players WHERE discord_id = ?
-    ''', (discord_id,))
-    
-    result = cursor.fetchone()
-    conn.close()
-    
-    if result:
-        return {
-            'discord_id': result[0],
-            'static_id': result[1],
-            'nickname': result[2],
-            'registration_time': result[3],
-            'is_disqualified': bool(result[4])
-        }
-    return None
+        SELECT guild_id, player_id, submission_id FROM submissions WHERE seq IS NULL
+        ORDER BY guild_id, player_id, submission_time, submission_id
+    ''')
+    rows = cursor.fetchall()
+    numbers = []
+    last = {}
+    for guild_id, player_id, submission_id in rows:
+        key = (guild_id, player_id)
+        if key not in last:
+            cursor.execute('SELECT COALESCE(MAX(seq), 0) FROM submissions WHERE guild_id = ? AND player_id = ?', key)
+            last[key] = cursor.fetchone()[0]
+        last[key] += 1
+        numbers.append((last[key], submission_id))
+    cursor.executemany('UPDATE submissions SET seq = ? WHERE submission_id = ?', numbers)
+    return len(numbers)
 
-def add_submission(player_id: int, screenshot_url: str) -> bool:
-    """Добавляет новый скриншот в таблицу submissions."""
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
+def _new_event_path() -> str:
+    name = f"event_{datetime.datetime.utcnow():%Y%m%d_%H%M%S}"
+    path = os.path.join(config.EVENTS_DIR, f"{name}.db")
+    number = 1
+    while os.path.exists(path):
+        number += 1
+        path = os.path.join(config.EVENTS_DIR, f"{name}_{number}.db")
+    return path
+
+class SQLiteStorage(storage.Storage):
+    """Хранилище в файле SQLite текущего ивента (DATABASE_NAME)."""
     
-    try:
+    def setup_database(self, path: Optional[str] = None):
+        """Создает таблицы, если они еще не существуют (по умолчанию в базе текущего ивента)."""
+        conn = _connect(path)
+        cursor = conn.cursor()
+        
+        # Журнал WAL: чтение не блокирует запись, а кадры журнала копирует репликация (replication.py).
+        # Режим сохраняется в файле базы
+        cursor.execute('PRAGMA journal_mode = WAL')
+        
+        # Добавляем поле is_approved если его нет (для обновления существующих баз)
+        try:
+            cursor.execute('ALTER TABLE submissions ADD COLUMN is_approved BOOLEAN DEFAULT FALSE')
+        except sqlite3.OperationalError:
+            pass  # Поле уже существует или таблицы еще нет
+        
+        # Базы, созданные до поддержки нескольких серверов, переводим на схему с guild_id
+        cursor.execute("PRAGMA table_info(players)")
+        player_columns = [row[1] for row in cursor.fetchall()]
+        if player_columns and 'guild_id' not in player_columns:
+            _migrate_to_guild_schema(cursor)
+        
+        # Создание таблицы players (игрок регистрируется отдельно на каждом сервере)
         cursor.execute('''
-            INSERT INTO submissions (player_id, screenshot_url, submission_time, is_valid, is_approved)
-            VALUES (?, ?, ?, TRUE, NULL)
-        ''', (player_id, screenshot_url, datetime.datetime.utcnow()))
+            CREATE TABLE IF NOT EXISTS players (
+                guild_id INTEGER NOT NULL,
+                discord_id INTEGER NOT NULL,
+                static_id TEXT NOT NULL,
+                nickname TEXT NOT NULL,
+                registration_time INTEGER NOT NULL,
+                is_disqualified BOOLEAN DEFAULT FALSE,
+                PRIMARY KEY (guild_id, discord_id)
+            )
+        ''')
+        
+        # Создание таблицы submissions
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS submissions (
+                submission_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                guild_id INTEGER NOT NULL,
+                player_id INTEGER NOT NULL,
+                screenshot_url TEXT NOT NULL,
+                submission_time INTEGER NOT NULL,
+                is_valid BOOLEAN DEFAULT TRUE,
+                is_approved BOOLEAN DEFAULT FALSE,
+                file_sha256 TEXT,
+                duplicate_of INTEGER,
+                seq INTEGER,
+                FOREIGN KEY (guild_id, player_id) REFERENCES players (guild_id, discord_id)
+            )
+        ''')
+        
+        # Добавляем поля локального архива скриншотов (для обновления существующих баз)
+        for column in ('file_sha256 TEXT', 'duplicate_of INTEGER'):
+            try:
+                cursor.execute(f'ALTER TABLE submissions ADD COLUMN {column}')
+            except sqlite3.OperationalError:
+                pass  # Поле уже существует
+        
+        # Личный номер скриншота игрока (seq): выдается при добавлении, в старых базах - один раз здесь
+        try:
+            cursor.execute('ALTER TABLE submissions ADD COLUMN seq INTEGER')
+            seq_added = True
+        except sqlite3.OperationalError:
+            seq_added = False  # Поле уже существует
+        
+        # Время в базах, созданных до перехода на миллисекунды Unix, хранится строками
+        time_migrated = _migrate_to_epoch_time(cursor)
+        if seq_added:
+            _number_submissions(cursor)
+        
+        # Раньше дисквалификация записывалась в is_valid всех скриншотов игрока (до user_version 1):
+        # скриншотам дисквалифицированных игроков флаг возвращается, недействительными их делает строка игрока
+        cursor.execute("PRAGMA user_version")
+        if cursor.fetchone()[0] < 1:
+            cursor.execute('''
+                UPDATE submissions SET is_valid = TRUE
+                WHERE is_valid = FALSE AND EXISTS (
+                    SELECT 1 FROM players p
+                    WHERE p.guild_id = submissions.guild_id AND p.discord_id = submissions.player_id
+                    AND p.is_disqualified = TRUE
+                )
+            ''')
+            cursor.execute("PRAGMA user_version = 1")
+        
+        # Индексы, разделенные по серверам: запросы одного сервера не читают чужие строки.
+        # Скриншоты игрока листаются страницами по seq, в том числе с отбором по статусу
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_players_discord ON players (discord_id)')
+        cursor.execute('DROP INDEX IF EXISTS idx_submissions_guild_player')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_submissions_player_seq ON submissions (guild_id, player_id, seq)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_submissions_player_status '
+                       'ON submissions (guild_id, player_id, is_approved, seq)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_submissions_guild_status ON submissions (guild_id, is_approved)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_submissions_guild_sha ON submissions (guild_id, file_sha256)')
+        
+        # Файлы локального архива скриншотов (адресация по SHA-256 содержимого)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS screenshot_files (
+                sha256 TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                format TEXT NOT NULL,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                phash INTEGER
+            )
+        ''')
+        
+        # Добавляем поле перцептивного хеша (для обновления существующих баз)
+        try:
+            cursor.execute('ALTER TABLE screenshot_files ADD COLUMN phash INTEGER')
+        except sqlite3.OperationalError:
+            pass  # Поле уже существует
+        
+        # Настройки ивента для каждого сервера (NULL - значение по умолчанию из config.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS guild_settings (
+                guild_id INTEGER PRIMARY KEY,
+                event_start_time TEXT,
+                event_end_time TEXT,
+                moderation_channel_id INTEGER
+            )
+        ''')
+        
+        # Карточки скриншотов, опубликованные в канале модерации
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS moderation_cards (
+                submission_id INTEGER PRIMARY KEY,
+                channel_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                FOREIGN KEY (submission_id) REFERENCES submissions (submission_id)
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_moderation_cards_message ON moderation_cards (message_id)')
+        
+        # Журнал решений модерации: строки только добавляются, порядок решений - порядок log_id.
+        # Статус скриншота (submissions.is_approved) - последнее решение из журнала
+        # (approved NULL - скриншот возвращен на модерацию)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS moderation_log (
+                log_id INTEGER PRIMARY KEY,
+                submission_id INTEGER NOT NULL,
+                guild_id INTEGER NOT NULL,
+                moderator_id INTEGER,
+                approved BOOLEAN,
+                reason TEXT,
+                decided_at INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_moderation_log_submission ON moderation_log (submission_id)')
+        
+        # Сводки по часам (hour - начало часа в миллисекундах Unix): обновляются в операциях записи,
+        # для существующих баз (и после перевода времени на миллисекунды) заполняются из исходных таблиц
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'hourly_stats'")
+        hourly_stats_exists = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS hourly_stats (
+                guild_id INTEGER NOT NULL,
+                hour INTEGER NOT NULL,
+                submissions INTEGER NOT NULL DEFAULT 0,
+                approved INTEGER NOT NULL DEFAULT 0,
+                rejected INTEGER NOT NULL DEFAULT 0,
+                moderated INTEGER NOT NULL DEFAULT 0,
+                registrations INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (guild_id, hour)
+            ) WITHOUT ROWID
+        ''')
+        if not hourly_stats_exists or time_migrated:
+            _rebuild_hourly_stats(cursor)
         
         conn.commit()
         conn.close()
-        return True
-    except sqlite3.Error:
+    
+    def get_guild_settings(self, guild_id: int) -> dict:
+        """
+        Возвращает настройки ивента сервера.
+        Незаданные поля берутся из config.py (канал модерации по умолчанию - только для config.GUILD_ID).
+        """
+        conn = _connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT event_start_time, event_end_time, moderation_channel_id
+            FROM guild_settings WHERE guild_id = ?
+        ''', (guild_id,))
+        
+        result = cursor.fetchone() or (None, None, None)
         conn.close()
-        return False
-
-def get_player_submissions(discord_id: int) -> List[dict]:
-    """Получает все скриншоты конкретного игрока."""
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
+        
+        default_channel = config.MODERATION_CHANNEL_ID if guild_id == config.GUILD_ID else None
+        return {
+            'guild_id': guild_id,
+            'event_start_time': result[0] or config.EVENT_START_TIME,
+            'event_end_time': result[1] or config.EVENT_END_TIME,
+            'moderation_channel_id': result[2] or default_channel
+        }
     
-    cursor.execute('''
-        SELECT submission_id, screenshot_url, submission_time, is_valid, is_approved
-        FROM submissions WHERE player_id = ?
-        ORDER BY submission_time DESC
-    ''', (discord_id,))
-    
-    results = cursor.fetchall()
-    conn.close()
-    
-    submissions = []
-    for result in results:
-        submissions.append({
-            'submission_id': result[0],
-            'screenshot_url': result[1],
-            'submission_time': result[2],
-            'is_valid': bool(result[3]),
-            'is_approved': result[4]  # None, True, or False
-        })
-    
-    return submissions
-
-def get_leaderboard() -> List[Tuple[int, str, int]]:
-    """
-    Возвращает список игроков, отсортированный по количеству валидных скриншотов (по убыванию).
-    Возвращает список кортежей: (discord_id, nickname, screenshot_count)
-    """
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
+    def update_guild_settings(self, guild_id: int, event_start_time: Optional[str] = None,
+                              event_end_time: Optional[str] = None,
+                              moderation_channel_id: Optional[int] = None) -> bool:
+        """Сохраняет настройки ивента сервера. Переданные None поля не изменяются."""
+        conn = _connect()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('''
+                INSERT INTO guild_settings (guild_id, event_start_time, event_end_time, moderation_channel_id)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (guild_id) DO UPDATE SET
+                    event_start_time = COALESCE(excluded.event_start_time, event_start_time),
+                    event_end_time = COALESCE(excluded.event_end_time, event_end_time),
+                    moderation_channel_id = COALESCE(excluded.moderation_channel_id, moderation_channel_id)
+            ''', (guild_id, event_start_time, event_end_time, moderation_channel_id))
+            
+            conn.commit()
+            conn.close()
+            return True
+        except sqlite3.Error:
+            conn.close()
+            return False
     
-    cursor.execute('''
-        SELECT p.discord_id, p.nickname, COUNT(s.submission_id) as screenshot_count
-        FROM players p
-        LEFT JOIN submissions s ON p.discord_id = s.player_id AND s.is_valid = TRUE
-        WHERE p.is_disqualified = FALSE
-        GROUP BY p.discord_id, p.nickname
-        ORDER BY screenshot_count DESC
-    ''')
+    def register_player(self, guild_id: int, discord_id: int, static_id: str, nickname: str) -> bool:
+        """
+        Добавляет нового игрока в таблицу players.
+        Возвращает True при успехе, False если игрок уже зарегистрирован на этом сервере.
+        """
+        conn = _connect()
+        cursor = conn.cursor()
+        
+        try:
+            # Проверяем, существует ли уже игрок
+            cursor.execute("SELECT discord_id FROM players WHERE guild_id = ? AND discord_id = ?", (guild_id, discord_id))
+            if cursor.fetchone():
+                conn.close()
+                return False
+            
+            # Добавляем нового игрока
+            now = datetime.datetime.utcnow()
+            cursor.execute('''
+                INSERT INTO players (guild_id, discord_id, static_id, nickname, registration_time, is_disqualified)
+                VALUES (?, ?, ?, ?, ?, FALSE)
+            ''', (guild_id, discord_id, static_id, nickname, storage.to_epoch_ms(now)))
+            cursor.execute(_ADD_HOURLY_STATS, (guild_id, storage.hour_bucket(now), 0, 0, 0, 0, 1))
+            
+            conn.commit()
+            conn.close()
+            return True
+        except sqlite3.Error:
+            conn.close()
+            return False
     
-    results = cursor.fetchall()
-    conn.close()
+    def get_player(self, guild_id: int, discord_id: int) -> Optional[storage.Player]:
+        """Получает данные игрока на сервере."""
+        conn = _connect()
+        cursor = conn.cursor()
+        cursor.row_factory = _records(storage.Player)
+        
+        cursor.execute('''
+            SELECT discord_id, static_id, nickname, registration_time, is_disqualified, guild_id
+            FROM players WHERE guild_id = ? AND discord_id = ?
+        ''', (guild_id, discord_id))
+        
+        result = cursor.fetchone()
+        conn.close()
+        
+        return result
     
-    return results
-
-def get_all_players_stats() -> int:
-    """Возвращает общее количество зарегистрированных игроков."""
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
+    def get_player_guilds(self, discord_id: int) -> List[int]:
+        """
+        Возвращает ID серверов, на которых зарегистрирован игрок.
+        Последняя регистрация идет первой.
+        """
+        conn = _connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT guild_id FROM players WHERE discord_id = ?
+            ORDER BY registration_time DESC
+        ''', (discord_id,))
+        
+        results = [row[0] for row in cursor.fetchall()]
+        conn.close()
+        
+        return results
     
-    cursor.execute("SELECT COUNT(*) FROM players")
-    result = cursor.fetchone()
-    conn.close()
+    def list_players(self, guild_id: Optional[int] = None) -> List[Tuple[storage.Player, int]]:
+        """Игроки сервера (или всех серверов) с числом действительных скриншотов."""
+        conn = _connect()
+        cursor = conn.cursor()
+        cursor.row_factory = lambda cursor, row: (storage.Player._make(row[:6]), row[6])
+        
+        sql = '''
+            SELECT p.discord_id, p.static_id, p.nickname, p.registration_time, p.is_disqualified, p.guild_id,
+                   CASE WHEN p.is_disqualified THEN 0 ELSE
+                       (SELECT COUNT(*) FROM submissions s
+                        WHERE s.guild_id = p.guild_id AND s.player_id = p.discord_id AND s.is_valid = TRUE)
+                   END
+            FROM players p
+        '''
+        if guild_id is not None:
+            cursor.execute(sql + " WHERE p.guild_id = ? ORDER BY p.discord_id", (guild_id,))
+        else:
+            cursor.execute(sql + " ORDER BY p.guild_id, p.discord_id")
+        
+        results = cursor.fetchall()
+        conn.close()
+        
+        return results
     
-    return result[0] if result else 0
-
-def disqualify_player(discord_id: int) -> bool:
-    """
-    Устанавливает is_disqualified в TRUE для игрока и is_valid в FALSE для всех его скриншотов.
-    """
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
+    def add_submission(self, guild_id: int, player_id: int, screenshot_url: str,
+                       file_sha256: Optional[str] = None) -> Optional[int]:
+        """
+        Добавляет новый скриншот в таблицу submissions.
+        Если файл с таким SHA-256 уже отправлялся на этом сервере, скриншот помечается
+        как дубликат первого такого скриншота (duplicate_of).
+        Возвращает ID нового скриншота или None при ошибке.
+        """
+        conn = _connect()
+        cursor = conn.cursor()
+        
+        try:
+            duplicate_of = None
+            if file_sha256:
+                cursor.execute('''
+                    SELECT submission_id FROM submissions
+                    WHERE guild_id = ? AND file_sha256 = ?
+                    ORDER BY submission_id LIMIT 1
+                ''', (guild_id, file_sha256))
+                result = cursor.fetchone()
+                duplicate_of = result[0] if result else None
+            
+            now = datetime.datetime.utcnow()
+            cursor.execute('''
+                INSERT INTO submissions (guild_id, player_id, screenshot_url, submission_time, is_valid, is_approved,
+                                         file_sha256, duplicate_of, seq)
+                VALUES (?, ?, ?, ?, TRUE, NULL, ?, ?,
+                        (SELECT COALESCE(MAX(seq), 0) + 1 FROM submissions WHERE guild_id = ? AND player_id = ?))
+            ''', (guild_id, player_id, screenshot_url, storage.to_epoch_ms(now), file_sha256, duplicate_of,
+                  guild_id, player_id))
+            submission_id = cursor.lastrowid
+            cursor.execute(_ADD_HOURLY_STATS, (guild_id, storage.hour_bucket(now), 1, 0, 0, 0, 0))
+            
+            conn.commit()
+            conn.close()
+            return submission_id
+        except sqlite3.Error:
+            conn.close()
+            return None
     
-    try:
-        # Дисквалифицируем игрока
-        cursor.execute('''
-            UPDATE players SET is_disqualified = TRUE WHERE discord_id = ?
-        ''', (discord_id,))
+    def get_player_submissions(self, guild_id: int, discord_id: int) -> List[storage.PlayerSubmission]:
+        """Получает все скриншоты конкретного игрока на сервере."""
+        conn = _connect()
+        cursor = conn.cursor()
+        cursor.row_factory = _records(storage.PlayerSubmission)
         
-        # Делаем все его скриншоты невалидными
-        cursor.execute('''
-            UPDATE submissions SET is_valid = FALSE WHERE player_id = ?
-        ''', (discord_id,))
+        cursor.execute(f'''
+            SELECT s.submission_id, s.screenshot_url, s.submission_time, {_IS_VALID_SQL}, s.is_approved, s.seq
+            FROM {_SUBMISSIONS_WITH_PLAYER} WHERE s.guild_id = ? AND s.player_id = ?
+            ORDER BY s.seq DESC
+        ''', (guild_id, discord_id))
         
-        conn.commit()
+        results = cursor.fetchall()
         conn.close()
-        return True
-    except sqlite3.Error:
+        
+        return results
+    
+    def get_player_submissions_page(self, guild_id: int, discord_id: int, status: Optional[str] = None,
+                                    before_seq: Optional[int] = None,
+                                    limit: int = 25) -> List[storage.PlayerSubmission]:
+        """
+        Страница скриншотов игрока, новые первыми. Выборка продолжается с before_seq по индексу
+        (guild_id, player_id[, is_approved], seq), поэтому читает только строки страницы,
+        сколько бы скриншотов ни было у игрока.
+        """
+        conn = _connect()
+        cursor = conn.cursor()
+        cursor.row_factory = _records(storage.PlayerSubmission)
+        
+        sql = f'''
+            SELECT s.submission_id, s.screenshot_url, s.submission_time, {_IS_VALID_SQL}, s.is_approved, s.seq
+            FROM {_SUBMISSIONS_WITH_PLAYER} WHERE s.guild_id = ? AND s.player_id = ?
+        '''
+        parameters = [guild_id, discord_id]
+        if status is not None:
+            sql += ' AND s.is_approved IS ?'
+            parameters.append(storage.SUBMISSION_STATUSES[status])
+        if before_seq is not None:
+            sql += ' AND s.seq < ?'
+            parameters.append(before_seq)
+        cursor.execute(sql + ' ORDER BY s.seq DESC LIMIT ?', parameters + [limit])
+        
+        results = cursor.fetchall()
         conn.close()
-        return False
-
-def cancel_disqualification(discord_id: int) -> bool:
-    """
-    Снимает дисквалификацию с игрока и восстанавливает действительность его скриншотов.
-    """
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
+        
+        return results
     
-    try:
-        # Снимаем дисквалификацию
+    def get_player_submission_counts(self, guild_id: int, discord_id: int) -> Dict[str, int]:
+        """Число скриншотов игрока по статусам (только по индексу, без чтения строк)."""
+        conn = _connect()
+        cursor = conn.cursor()
+        
         cursor.execute('''
-            UPDATE players SET is_disqualified = FALSE WHERE discord_id = ?
-        ''', (discord_id,))
+            SELECT is_approved, COUNT(*) FROM submissions
+            WHERE guild_id = ? AND player_id = ?
+            GROUP BY is_approved
+        ''', (guild_id, discord_id))
+        counts = dict(cursor.fetchall())
+        conn.close()
+        
+        return {status: counts.get(value, 0) for status, value in storage.SUBMISSION_STATUSES.items()}
+    
+    def get_leaderboard(self, guild_id: int) -> List[Tuple[int, str, int]]:
+        """
+        Возвращает список игроков сервера, отсортированный по количеству валидных скриншотов (по убыванию).
+        Возвращает список кортежей: (discord_id, nickname, screenshot_count)
+        """
+        conn = _connect()
+        cursor = conn.cursor()
         
-        # Восстанавливаем действительность скриншотов
         cursor.execute('''
-            UPDATE submissions SET is_valid = TRUE WHERE player_id = ?
-        ''', (discord_id,))
+            SELECT p.discord_id, p.nickname, COUNT(s.submission_id) as screenshot_count
+            FROM players p
+            LEFT JOIN submissions s ON s.guild_id = p.guild_id AND p.discord_id = s.player_id AND s.is_valid = TRUE
+            WHERE p.guild_id = ? AND p.is_disqualified = FALSE
+            GROUP BY p.discord_id, p.nickname
+            ORDER BY screenshot_count DESC
+        ''', (guild_id,))
         
-        conn.commit()
+        results = cursor.fetchall()
         conn.close()
-        return True
-    except sqlite3.Error:
+        
+        return results
+    
+    def get_all_players_stats(self, guild_id: int) -> int:
+        """Возвращает общее количество зарегистрированных игроков сервера."""
+        conn = _connect()
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT COUNT(*) FROM players WHERE guild_id = ?", (guild_id,))
+        result = cursor.fetchone()
         conn.close()
-        return False
-
-def is_player_disqualified(discord_id: int) -> bool:
-    """Проверяет, дисквалифицирован ли игрок."""
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
+        
+        return result[0] if result else 0
     
-    cursor.execute('''
-        SELECT is_disqualified FROM players WHERE discord_id = ?
-    ''', (discord_id,))
+    def disqualify_player(self, guild_id: int, discord_id: int) -> bool:
+        """
+        Устанавливает is_disqualified в TRUE для игрока на сервере. Скриншоты не переписываются:
+        их действительность вычисляется в запросах по строке игрока.
+        """
+        conn = _connect()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('''
+                UPDATE players SET is_disqualified = TRUE WHERE guild_id = ? AND discord_id = ?
+            ''', (guild_id, discord_id))
+            
+            conn.commit()
+            conn.close()
+            return True
+        except sqlite3.Error:
+            conn.close()
+            return False
     
-    result = cursor.fetchone()
-    conn.close()
+    def cancel_disqualification(self, guild_id: int, discord_id: int) -> bool:
+        """
+        Снимает дисквалификацию с игрока: скриншоты снова действительны по своим флагам is_valid.
+        """
+        conn = _connect()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('''
+                UPDATE players SET is_disqualified = FALSE WHERE guild_id = ? AND discord_id = ?
+            ''', (guild_id, discord_id))
+            
+            conn.commit()
+            conn.close()
+            return True
+        except sqlite3.Error:
+            conn.close()
+            return False
     
-    return bool(result[0]) if result else False
-
-def approve_screenshot(submission_id: int) -> bool:
-    """Одобряет скриншот (устанавливает is_approved = TRUE)."""
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
+    def is_player_disqualified(self, guild_id: int, discord_id: int) -> bool:
+        """Проверяет, дисквалифицирован ли игрок на сервере."""
+        conn = _connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT is_disqualified FROM players WHERE guild_id = ? AND discord_id = ?
+        ''', (guild_id, discord_id))
+        
+        result = cursor.fetchone()
+        conn.close()
+        
+        return bool(result[0]) if result else False
     
-    try:
+    def record_moderation_decisions(self, decisions: List[Tuple[int, Optional[bool], Optional[int], Optional[str]]]
+                                    ) -> int:
+        """
+        Применяет решения модерации (submission_id, approved, moderator_id, reason) одной транзакцией:
+        записывает их в журнал moderation_log и обновляет статус скриншотов. approved None возвращает
+        скриншот на модерацию. Решения по несуществующим скриншотам пропускаются.
+        Возвращает число примененных решений.
+        """
+        conn = _connect()
+        cursor = conn.cursor()
+        decided_at = datetime.datetime.utcnow()
+        
+        try:
+            cursor.executemany('''
+                INSERT INTO moderation_log (submission_id, guild_id, moderator_id, approved, reason, decided_at)
+                SELECT submission_id, guild_id, ?, ?, ?, ? FROM submissions WHERE submission_id = ?
+            ''', [(moderator_id, approved, reason, storage.to_epoch_ms(decided_at), submission_id)
+                  for submission_id, approved, moderator_id, reason in decisions])
+            recorded = cursor.rowcount
+            
+            # Сводка по часам: решения и скриншоты, которые уходят из очереди модерации (статус до решения).
+            # Возврат на модерацию меняет час ухода из очереди - тогда сводка пересчитывается целиком
+            reopened = any(approved is None for _, approved, _, _ in decisions)
+            ids = [] if reopened else list({submission_id for submission_id, _, _, _ in decisions})
+            status = {}
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                cursor.execute(f'''
+                    SELECT submission_id, guild_id, is_approved FROM submissions
+                    WHERE submission_id IN ({','.join('?' * len(chunk))})
+                ''', chunk)
+                status.update((row[0], (row[1], row[2] is None)) for row in cursor.fetchall())
+            counts = {}
+            for submission_id, approved, _, _ in decisions:
+                if submission_id in status:
+                    guild_id, pending = status[submission_id]
+                    guild_counts = counts.setdefault(guild_id, [0, 0, 0])
+                    guild_counts[0 if approved else 1] += 1
+                    if pending:
+                        guild_counts[2] += 1
+                        status[submission_id] = (guild_id, False)
+            hour = storage.hour_bucket(decided_at)
+            cursor.executemany(_ADD_HOURLY_STATS, [
+                (guild_id, hour, 0, approved_count, rejected_count, moderated, 0)
+                for guild_id, (approved_count, rejected_count, moderated) in counts.items()
+            ])
+            
+            cursor.executemany('''
+                UPDATE submissions SET is_approved = ? WHERE submission_id = ?
+            ''', [(approved, submission_id) for submission_id, approved, _, _ in decisions])
+            if reopened:
+                _rebuild_hourly_stats(cursor)
+            
+            conn.commit()
+            conn.close()
+            return recorded
+        except sqlite3.Error:
+            log.exception("Ошибка при сохранении решений модерации",
+                          extra={'submission_ids': [submission_id for submission_id, _, _, _ in decisions]})
+            conn.close()
+            return 0
+    
+    def get_moderation_history(self, submission_id: int) -> List[storage.ModerationDecision]:
+        """Решения модерации по скриншоту от первого к последнему."""
+        conn = _connect()
+        cursor = conn.cursor()
+        cursor.row_factory = _records(storage.ModerationDecision)
+        
         cursor.execute('''
-            UPDATE submissions SET is_approved = TRUE WHERE submission_id = ?
+            SELECT moderator_id, approved, reason, decided_at FROM moderation_log
+            WHERE submission_id = ?
+            ORDER BY log_id
         ''', (submission_id,))
         
-        conn.commit()
-        success = cursor.rowcount > 0
+        results = cursor.fetchall()
         conn.close()
-        return success
-    except sqlite3.Error:
+        
+        return results
+    
+    def get_moderation_log(self, guild_id: Optional[int] = None) -> List[Tuple[int, Optional[int], int]]:
+        """
+        Журнал модерации сервера (None - всех серверов) в порядке записи:
+        (submission_id, approved, decided_ms). Читается по порядку log_id, без сортировки.
+        """
+        conn = _connect()
+        cursor = conn.cursor()
+        
+        if guild_id is None:
+            cursor.execute("SELECT submission_id, approved, decided_at FROM moderation_log ORDER BY log_id")
+        else:
+            cursor.execute('''
+                SELECT submission_id, approved, decided_at FROM moderation_log
+                WHERE guild_id = ?
+                ORDER BY log_id
+            ''', (guild_id,))
+        
+        results = cursor.fetchall()
         conn.close()
-        return False
-
-def reject_screenshot(submission_id: int) -> bool:
-    """Отклоняет скриншот (устанавливает is_approved = FALSE)."""
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
+        
+        return results
     
-    try:
+    def reopen_unmoderated_rejections(self) -> int:
+        """Возвращает на модерацию отклоненные скриншоты без решений в журнале модерации."""
+        conn = _connect()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('''
+                UPDATE submissions SET is_approved = NULL
+                WHERE is_approved = FALSE
+                AND NOT EXISTS (SELECT 1 FROM moderation_log l WHERE l.submission_id = submissions.submission_id)
+            ''')
+            reopened = cursor.rowcount
+            if reopened:
+                _rebuild_hourly_stats(cursor)
+            
+            conn.commit()
+            conn.close()
+            return reopened
+        except sqlite3.Error:
+            log.exception("Ошибка при возврате скриншотов на модерацию")
+            conn.close()
+            return 0
+    
+    def get_approved_screenshots_stats(self, guild_id: int) -> List[Tuple[int, str, str, int]]:
+        """
+        Возвращает статистику одобренных скриншотов для всех игроков сервера.
+        Возвращает список кортежей: (discord_id, nickname, static_id, approved_count)
+        """
+        conn = _connect()
+        cursor = conn.cursor()
+        
         cursor.execute('''
-            UPDATE submissions SET is_approved = FALSE WHERE submission_id = ?
-        ''', (submission_id,))
+            SELECT p.discord_id, p.nickname, p.static_id, COUNT(s.submission_id) as approved_count
+            FROM players p
+            LEFT JOIN submissions s ON s.guild_id = p.guild_id AND p.discord_id = s.player_id
+                AND s.is_approved = TRUE AND s.is_valid = TRUE
+            WHERE p.guild_id = ? AND p.is_disqualified = FALSE
+            GROUP BY p.discord_id, p.nickname, p.static_id
+            HAVING approved_count > 0
+            ORDER BY approved_count DESC
+        ''', (guild_id,))
         
-        conn.commit()
-        success = cursor.rowcount > 0
+        results = cursor.fetchall()
         conn.close()
-        return success
-    except sqlite3.Error:
+        
+        return results
+    
+    def get_submission_by_id(self, submission_id: int) -> Optional[storage.Submission]:
+        """Получает данные скриншота по ID."""
+        conn = _connect()
+        cursor = conn.cursor()
+        cursor.row_factory = _records(storage.Submission)
+        
+        cursor.execute(f"SELECT {_SUBMISSION_COLUMNS} FROM {_SUBMISSIONS_WITH_PLAYER} WHERE s.submission_id = ?",
+                       (submission_id,))
+        
+        result = cursor.fetchone()
         conn.close()
-        return False
-
-def get_approved_screenshots_stats() -> List[Tuple[int, str, str, int]]:
-    """
-    Возвращает статистику одобренных скриншотов для всех игроков.
-    Возвращает список кортежей: (discord_id, nickname, static_id, approved_count)
-    """
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
+        
+        return result
     
-    cursor.execute('''
-        SELECT p.discord_id, p.nickname, p.static_id, COUNT(s.submission_id) as approved_count
-        FROM players p
-        LEFT JOIN submissions s ON p.discord_id = s.player_id AND s.is_approved = TRUE AND s.is_valid = TRUE
-        WHERE p.is_disqualified = FALSE
-        GROUP BY p.discord_id, p.nickname, p.static_id
-        HAVING approved_count > 0
-        ORDER BY approved_count DESC
-    ''')
+    def get_leaderboard_by_approved(self, guild_id: int) -> List[Tuple[int, str, int, int]]:
+        """
+        Возвращает топ игроков сервера по количеству одобренных скриншотов.
+        Возвращает список кортежей: (discord_id, nickname, total_screenshots, approved_count)
+        """
+        conn = _connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT
+                p.discord_id,
+                p.nickname,
+                COUNT(s.submission_id) as total_screenshots,
+                COUNT(CASE WHEN s.is_approved = TRUE THEN 1 END) as approved_count
+            FROM players p
+            LEFT JOIN submissions s ON s.guild_id = p.guild_id AND p.discord_id = s.player_id AND s.is_valid = TRUE
+            WHERE p.guild_id = ? AND p.is_disqualified = FALSE
+            GROUP BY p.discord_id, p.nickname
+            HAVING total_screenshots > 0
+            ORDER BY approved_count DESC, total_screenshots DESC
+        ''', (guild_id,))
+        
+        results = cursor.fetchall()
+        conn.close()
+        
+        return results
     
-    results = cursor.fetchall()
-    conn.close()
+    def get_player_screenshot_number(self, discord_id: int, submission_id: int) -> int:
+        """
+        Возвращает личный номер скриншота игрока (1-й, 2-й, 3-й и т.д.).
+        Номер (seq) выдается при добавлении скриншота, поэтому читается одной строкой.
+        """
+        conn = _connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT seq FROM submissions WHERE submission_id = ? AND player_id = ?',
+                       (submission_id, discord_id))
+        
+        result = cursor.fetchone()
+        conn.close()
+        
+        return result[0] if result and result[0] else 1
     
-    return results
-
-def get_submission_by_id(submission_id: int) -> Optional[dict]:
-    """Получает данные скриншота по ID."""
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
+    def get_hourly_stats(self, guild_id: int, since: datetime.datetime) -> Tuple[int, List[dict]]:
+        """Сводки сервера по часам с часа момента since и очередь модерации на начало периода."""
+        conn = _connect()
+        cursor = conn.cursor()
+        since_hour = storage.hour_bucket(since)
+        
+        cursor.execute('''
+            SELECT COALESCE(SUM(submissions - moderated), 0) FROM hourly_stats
+            WHERE guild_id = ? AND hour < ?
+        ''', (guild_id, since_hour))
+        pending = cursor.fetchone()[0]
+        
+        cursor.execute('''
+            SELECT hour, submissions, approved, rejected, moderated, registrations FROM hourly_stats
+            WHERE guild_id = ? AND hour >= ?
+            ORDER BY hour
+        ''', (guild_id, since_hour))
+        results = cursor.fetchall()
+        conn.close()
+        
+        backlog = pending
+        rows = []
+        for hour, submissions, approved, rejected, moderated, registrations in results:
+            pending += submissions - moderated
+            rows.append({'hour': storage.from_epoch_ms(hour), 'submissions': submissions, 'approved': approved, 'rejected': rejected,
+                         'moderated': moderated, 'registrations': registrations, 'pending': pending})
+        return backlog, rows
     
-    cursor.execute('''
-        SELECT submission_id, player_id, screenshot_url, submission_time, is_valid, is_approved
-        FROM submissions WHERE submission_id = ?
-    ''', (submission_id,))
+    def rebuild_hourly_stats(self):
+        """Пересчитывает сводки по часам из исходных таблиц одной транзакцией."""
+        conn = _connect()
+        cursor = conn.cursor()
+        
+        try:
+            _rebuild_hourly_stats(cursor)
+            conn.commit()
+        finally:
+            conn.close()
     
-    result = cursor.fetchone()
-    conn.close()
+    def number_submissions(self) -> int:
+        """Нумерует скриншоты без личного номера одной транзакцией (см. _number_submissions)."""
+        conn = _connect()
+        cursor = conn.cursor()
+        
+        try:
+            numbered = _number_submissions(cursor)
+            conn.commit()
+            return numbered
+        finally:
+            conn.close()
     
-    if result:
-        return {
-            'submission_id': result[0],
-            'discord_id': result[1],  # player_id это тот же discord_id
-            'screenshot_url': result[2],
-            'submission_time': result[3],
-            'is_valid': result[4],
-            'is_approved': result[5]
-        }
-    return None
+    def reset_all_statistics(self, guild_id: int) -> bool:
+        """
+        Очищает все статистики и профили игроков сервера в текущем файле базы.
+        На большой базе это долго держит блокировку и удаляет историю - для нового ивента
+        используется start_new_event.
+        """
+        conn = _connect()
+        cursor = conn.cursor()
+        
+        try:
+            # Удаляем карточки канала модерации, журнал модерации и все скриншоты сервера
+            cursor.execute('''
+                DELETE FROM moderation_cards WHERE submission_id IN (
+                    SELECT submission_id FROM submissions WHERE guild_id = ?
+                )
+            ''', (guild_id,))
+            cursor.execute('''
+                DELETE FROM moderation_log WHERE submission_id IN (
+                    SELECT submission_id FROM submissions WHERE guild_id = ?
+                )
+            ''', (guild_id,))
+            cursor.execute("DELETE FROM submissions WHERE guild_id = ?", (guild_id,))
+            
+            # Удаляем всех игроков сервера
+            cursor.execute("DELETE FROM players WHERE guild_id = ?", (guild_id,))
+            cursor.execute("DELETE FROM hourly_stats WHERE guild_id = ?", (guild_id,))
+            
+            conn.commit()
+            conn.close()
+            return True
+        except sqlite3.Error:
+            log.exception("Ошибка при сбросе статистики", extra={'guild_id': guild_id})
+            conn.close()
+            return False
+    
+    def start_new_event(self, guild_id: int) -> Optional[str]:
+        """
+        Начинает новый ивент сервера в новом файле базы и сразу переключает бота на него.
+        В новый файл переносятся настройки серверов и данные других серверов (их ивенты продолжаются),
+        а нумерация скриншотов продолжается, чтобы ID не повторялись между ивентами.
+        Прошлый файл не изменяется. Возвращает его путь (для архивации) или None при ошибке.
+        """
+        global DATABASE_NAME
+        old_path = DATABASE_NAME
+        os.makedirs(config.EVENTS_DIR, exist_ok=True)
+        new_path = _new_event_path()
 
-def get_leaderboard_by_approved() -> List[Tuple[int, str, int, int]]:
-    """
-    Возвращает топ игроков по количеству одобренных скриншотов.
-    Возвращает список кортежей: (discord_id, nickname, total_screenshots, approved_count)
-    """
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
+        try:
+            self.setup_database(new_path)
+
+            conn = _connect(new_path)
+            cursor = conn.cursor()
+            cursor.execute("ATTACH DATABASE ? AS previous", (old_path,))
+
+            cursor.execute('''
+                INSERT INTO guild_settings (guild_id, event_start_time, event_end_time, moderation_channel_id)
+                SELECT guild_id, event_start_time, event_end_time, moderation_channel_id FROM previous.guild_settings
+            ''')
+            cursor.execute('''
+                INSERT INTO players (guild_id, discord_id, static_id, nickname, registration_time, is_disqualified)
+                SELECT guild_id, discord_id, static_id, nickname, registration_time, is_disqualified
+                FROM previous.players WHERE guild_id != ?
+            ''', (guild_id,))
+            cursor.execute('''
+                INSERT INTO submissions (submission_id, guild_id, player_id, screenshot_url, submission_time,
+                                         is_valid, is_approved, file_sha256, duplicate_of, seq)
+                SELECT submission_id, guild_id, player_id, screenshot_url, submission_time,
+                       is_valid, is_approved, file_sha256, duplicate_of, seq
+                FROM previous.submissions WHERE guild_id != ?
+            ''', (guild_id,))
+            cursor.execute('''
+                INSERT INTO moderation_cards (submission_id, channel_id, message_id)
+                SELECT c.submission_id, c.channel_id, c.message_id
+                FROM previous.moderation_cards c
+                JOIN submissions s ON s.submission_id = c.submission_id
+            ''')
+            cursor.execute('''
+                INSERT INTO moderation_log (log_id, submission_id, guild_id, moderator_id, approved, reason, decided_at)
+                SELECT log_id, submission_id, guild_id, moderator_id, approved, reason, decided_at
+                FROM previous.moderation_log WHERE guild_id != ?
+            ''', (guild_id,))
+            cursor.execute('''
+                INSERT INTO hourly_stats (guild_id, hour, submissions, approved, rejected, moderated, registrations)
+                SELECT guild_id, hour, submissions, approved, rejected, moderated, registrations
+                FROM previous.hourly_stats WHERE guild_id != ?
+            ''', (guild_id,))
+            # Файлы архива скриншотов нужны только перенесенным скриншотам
+            cursor.execute('''
+                INSERT INTO screenshot_files (sha256, path, format, width, height, size_bytes, phash)
+                SELECT sha256, path, format, width, height, size_bytes, phash
+                FROM previous.screenshot_files
+                WHERE sha256 IN (SELECT file_sha256 FROM submissions)
+            ''')
+            cursor.execute("DELETE FROM sqlite_sequence WHERE name = 'submissions'")
+            cursor.execute('''
+                INSERT INTO sqlite_sequence (name, seq)
+                SELECT name, seq FROM previous.sqlite_sequence WHERE name = 'submissions'
+            ''')
+
+            conn.commit()
+            cursor.execute("DETACH DATABASE previous")
+            conn.close()
+
+            # Переключение: указатель заменяется атомарно, новые соединения открывают новый файл
+            pointer = os.path.join(config.EVENTS_DIR, ACTIVE_EVENT_POINTER)
+            with open(pointer + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(new_path)
+            os.replace(pointer + '.tmp', pointer)
+            DATABASE_NAME = new_path
+            return old_path
+        except (sqlite3.Error, OSError):
+            log.exception("Ошибка при создании файла нового ивента", extra={'path': new_path})
+            if os.path.exists(new_path):
+                os.remove(new_path)
+            return None
     
-    cursor.execute('''
-        SELECT 
-            p.discord_id, 
-            p.nickname,
-            COUNT(s.submission_id) as total_screenshots,
-            COUNT(CASE WHEN s.is_approved = TRUE THEN 1 END) as approved_count
-        FROM players p
-        LEFT JOIN submissions s ON p.discord_id = s.player_id AND s.is_valid = TRUE
-        WHERE p.is_disqualified = FALSE
-        GROUP BY p.discord_id, p.nickname
-        HAVING total_screenshots > 0
-        ORDER BY approved_count DESC, total_screenshots DESC
-    ''')
+    def save_moderation_cards(self, channel_id: int, message_id: int, submission_ids: List[int]) -> bool:
+        """Запоминает, в каком сообщении канала модерации опубликованы карточки скриншотов."""
+        conn = _connect()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.executemany('''
+                INSERT OR REPLACE INTO moderation_cards (submission_id, channel_id, message_id)
+                VALUES (?, ?, ?)
+            ''', [(submission_id, channel_id, message_id) for submission_id in submission_ids])
+            
+            conn.commit()
+            conn.close()
+            return True
+        except sqlite3.Error:
+            conn.close()
+            return False
     
-    results = cursor.fetchall()
-    conn.close()
+    def get_moderation_card_group(self, submission_id: int) -> Optional[Tuple[int, int, List[int]]]:
+        """
+        Находит сообщение канала модерации с карточкой скриншота.
+        Возвращает кортеж (channel_id, message_id, [submission_id всех карточек сообщения]) или None.
+        """
+        conn = _connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT channel_id, message_id FROM moderation_cards WHERE submission_id = ?
+        ''', (submission_id,))
+        
+        result = cursor.fetchone()
+        if not result:
+            conn.close()
+            return None
+        
+        channel_id, message_id = result
+        cursor.execute('''
+            SELECT submission_id FROM moderation_cards WHERE message_id = ?
+            ORDER BY submission_id
+        ''', (message_id,))
+        
+        submission_ids = [row[0] for row in cursor.fetchall()]
+        conn.close()
+        
+        return channel_id, message_id, submission_ids
     
-    return results
-
-def get_player_screenshot_number(discord_id: int, submission_id: int) -> int:
-    """
-    Возвращает личный номер скриншота игрока (1-й, 2-й, 3-й и т.д.).
-    Основан на времени отправки скриншотов конкретного игрока.
-    """
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
+    def get_unposted_pending_submissions(self, guild_id: int) -> List[int]:
+        """Возвращает ID скриншотов сервера на модерации, которые еще не опубликованы в канале модерации."""
+        conn = _connect()
+        cursor = conn.cursor()
+        
+        cursor.execute(f'''
+            SELECT s.submission_id
+            FROM {_SUBMISSIONS_WITH_PLAYER}
+            LEFT JOIN moderation_cards c ON c.submission_id = s.submission_id
+            WHERE s.guild_id = ? AND s.is_approved IS NULL AND {_IS_VALID_SQL} = TRUE AND c.submission_id IS NULL
+            ORDER BY s.submission_id
+        ''', (guild_id,))
+        
+        results = [row[0] for row in cursor.fetchall()]
+        conn.close()
+        
+        return results
     
-    # Получаем порядковый номер скриншота среди всех скриншотов игрока
-    cursor.execute('''
-        SELECT COUNT(*) + 1 as screenshot_number
-        FROM submissions s1
-        WHERE s1.player_id = ? 
-        AND s1.submission_time < (
-            SELECT s2.submission_time 
-            FROM submissions s2 
-            WHERE s2.submission_id = ?
-        )
-    ''', (discord_id, submission_id))
+    def save_screenshot_file(self, sha256: str, path: str, image_format: str, width: int, height: int, size_bytes: int) -> bool:
+        """Запоминает файл локального архива скриншотов (повторное сохранение того же файла игнорируется)."""
+        conn = _connect()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('''
+                INSERT OR IGNORE INTO screenshot_files (sha256, path, format, width, height, size_bytes)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (sha256, path, image_format, width, height, size_bytes))
+            
+            conn.commit()
+            conn.close()
+            return True
+        except sqlite3.Error:
+            conn.close()
+            return False
     
-    result = cursor.fetchone()
-    conn.close()
+    def get_screenshot_file(self, sha256: str) -> Optional[storage.ScreenshotFile]:
+        """Получает данные файла локального архива по SHA-256."""
+        conn = _connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT sha256, path, format, width, height, size_bytes, phash
+            FROM screenshot_files WHERE sha256 = ?
+        ''', (sha256,))
+        
+        result = cursor.fetchone()
+        conn.close()
+        
+        if result:
+            return storage.ScreenshotFile(*result[:6], _from_signed64(result[6]) if result[6] is not None else None)
+        return None
     
-    return result[0] if result else 1
-
-def reset_all_statistics() -> bool:
-    """
-    Очищает все статистики и профили игроков (полный сброс для нового ивента).
-    """
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
+    def save_perceptual_hash(self, sha256: str, phash: int) -> bool:
+        """Сохраняет 64-битный перцептивный хеш файла архива."""
+        conn = _connect()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('''
+                UPDATE screenshot_files SET phash = ? WHERE sha256 = ?
+            ''', (_to_signed64(phash), sha256))
+            
+            conn.commit()
+            conn.close()
+            return True
+        except sqlite3.Error:
+            conn.close()
+            return False
     
-    try:
-        # Удаляем все скриншоты
-        cursor.execute("DELETE FROM submissions")
+    def get_guild_perceptual_hashes(self, guild_id: int) -> List[Tuple[int, int, int]]:
+        """
+        Возвращает перцептивные хеши всех скриншотов сервера.
+        Возвращает список кортежей: (submission_id, player_id, phash)
+        """
+        conn = _connect()
+        cursor = conn.cursor()
         
-        # Удаляем всех игроков
-        cursor.execute("DELETE FROM players")
+        cursor.execute('''
+            SELECT s.submission_id, s.player_id, f.phash
+            FROM submissions s
+            JOIN screenshot_files f ON f.sha256 = s.file_sha256
+            WHERE s.guild_id = ? AND f.phash IS NOT NULL
+        ''', (guild_id,))
         
-        conn.commit()
-        conn.close()
-        return True
-    except sqlite3.Error as e:
-        print(f"Ошибка при сбросе статистики: {e}")
+        results = [(row[0], row[1], _from_signed64(row[2])) for row in cursor.fetchall()]
         conn.close()
-        return False
+        
+        return results
+
+def create_storage(engine: str) -> storage.Storage:
+    """Хранилище по имени из config.STORAGE_ENGINE: 'sqlite' или 'memory'."""
+    if engine == 'sqlite':
+        return SQLiteStorage()
+    if engine == 'memory':
+        import memory_storage
+        return memory_storage.MemoryStorage()
+    raise ValueError(f"неизвестное хранилище: {engine}")
+
+# Хранилище, которому функции модуля передают вызовы
+current_storage = create_storage(config.STORAGE_ENGINE)
+
+def use_storage(engine: storage.Storage) -> storage.Storage:
+    """Переключает функции модуля на другое хранилище (тесты, нагрузочные прогоны). Возвращает прежнее."""
+    global current_storage
+    previous, current_storage = current_storage, engine
+    return previous
+
+def _operation(name: str):
+    """Функция модуля для операции хранилища: сигнатура и описание берутся из storage.Storage."""
+    interface = getattr(storage.Storage, name)
+    
+    def call(*args, **kwargs):
+        return getattr(current_storage, name)(*args, **kwargs)
+    
+    signature = inspect.signature(interface)
+    call.__name__ = call.__qualname__ = name
+    call.__doc__ = interface.__doc__
+    call.__signature__ = signature.replace(parameters=list(signature.parameters.values())[1:])
+    # Время выполнения и ошибки каждой операции (см. metrics.py)
+    return metrics.timed('db')(call)
+
+for _name in storage.OPERATIONS:
+    globals()[_name] = _operation(_name)
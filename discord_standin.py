@@ -0,0 +1,435 @@
+# discord_standin.py
+# Локальная имитация REST API Discord для нагрузочных прогонов без сети.
+#
+#   python discord_standin.py --port 8787 --latency-ms 80 --dm-closed-share 0.1
+#   python loadtest.py --rest-api http://127.0.0.1:8787/api/v10
+#
+# Бот направляется в имитацию переменной окружения DISCORD_API_BASE (см. config.py).
+#
+# Поддерживаются маршруты, которые использует бот: вход по токену, пользователи, личные
+# сообщения, сообщения каналов, ответы на взаимодействия и followup, синхронизация
+# слэш-команд. Лимиты имитируют Discord: корзины по маршруту и основному параметру
+# (канал, сервер, вебхук), глобальный лимит, ответы 429 с retry_after и 403 для игроков
+# с закрытыми личными сообщениями. Gateway (websocket) не имитируется.
+import argparse
+import asyncio
+import datetime
+import hashlib
+import json
+import random
+import time
+from typing import Dict, Optional, Tuple
+
+from aiohttp import web
+
+from bot_logging import get_logger
+
+log = get_logger('standin')
+
+API_PREFIX = "/api/v10"
+APPLICATION_ID = 100_000_000_000_000_001
+BOT_USER_ID = APPLICATION_ID
+
+# Лимиты маршрутов: (метод, шаблон) -> (запросов, за секунд).
+# Значения близки к тем, что Discord возвращает в заголовках X-RateLimit-*;
+# для прогона их можно изменить параметром --route-limit.
+ROUTE_LIMITS: Dict[Tuple[str, str], Tuple[int, float]] = {
+    ('POST', '/channels/{channel_id}/messages'): (5, 5.0),
+    ('PATCH', '/channels/{channel_id}/messages/{message_id}'): (5, 5.0),
+    ('POST', '/webhooks/{webhook_id}/{webhook_token}'): (5, 2.0),
+    ('PATCH', '/webhooks/{webhook_id}/{webhook_token}/messages/{message_id}'): (5, 2.0),
+    ('PUT', '/applications/{application_id}/commands'): (2, 60.0),
+    ('PUT', '/applications/{application_id}/guilds/{guild_id}/commands'): (2, 60.0),
+}
+# Лимит маршрутов, которых нет в таблице
+DEFAULT_LIMIT = (50, 1.0)
+# Ответы на взаимодействия и followup не учитываются в глобальном лимите (как в Discord)
+GLOBAL_EXEMPT_PREFIXES = ('/interactions/', '/webhooks/')
+# Основные параметры: у каждого значения своя корзина
+MAJOR_PARAMETERS = ('channel_id', 'guild_id', 'webhook_id', 'webhook_token')
+
+# Код ошибки Discord для закрытых личных сообщений
+CANNOT_SEND_TO_USER = 50007
+
+def _json(data, status: int = 200, headers: Optional[dict] = None) -> web.Response:
+    """JSON-ответ с Content-Type ровно application/json (без charset, как у Discord)."""
+    return web.Response(body=json.dumps(data).encode('utf-8'), status=status, headers=headers,
+                        content_type='application/json')
+
+class Bucket:
+    """Корзина лимита: не более limit запросов за окно per секунд."""
+
+    def __init__(self, name: str, limit: int, per: float):
+        self.name = name
+        self.limit = limit
+        self.per = per
+        self.remaining = limit
+        self.reset_at = 0.0
+
+    def take(self, now: float) -> bool:
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + self.per
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
+
+    def headers(self, now: float) -> dict:
+        reset_after = max(0.0, self.reset_at - now)
+        return {
+            'X-RateLimit-Limit': str(self.limit),
+            'X-RateLimit-Remaining': str(self.remaining),
+            'X-RateLimit-Reset': f"{time.time() + reset_after:.3f}",
+            'X-RateLimit-Reset-After': f"{reset_after:.3f}",
+            'X-RateLimit-Bucket': self.name,
+        }
+
+class DiscordStandIn:
+    """
+    HTTP-сервер, отвечающий как REST API Discord.
+    Данные (пользователи, каналы, сообщения) создаются на лету и нигде не хранятся,
+    кроме счетчиков запросов, которые отдаются по GET /_standin/stats.
+    """
+
+    def __init__(self, latency: float = 0.0, global_limit: int = 50, dm_closed_share: float = 0.0,
+                 seed: int = 42, route_limits: Optional[dict] = None):
+        self.latency = latency
+        self.global_limit = global_limit
+        self.dm_closed_share = dm_closed_share
+        self.seed = seed
+        self.route_limits = {**ROUTE_LIMITS, **(route_limits or {})}
+        self._rng = random.Random(seed)
+        self._buckets: Dict[tuple, Bucket] = {}
+        self._global_window = 0.0
+        self._global_count = 0
+        self._next_id = 200_000_000_000_000_000
+        # Личный канал -> пользователь (чтобы отвечать 403 при закрытых личных сообщениях)
+        self._dm_recipients: Dict[int, int] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    # Данные в формате Discord
+
+    def _snowflake(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    def dm_closed(self, user_id: int) -> bool:
+        """Закрыты ли у пользователя личные сообщения (детерминированно по seed и ID)."""
+        if not self.dm_closed_share:
+            return False
+        return random.Random(f"{self.seed}:{user_id}").random() < self.dm_closed_share
+
+    @staticmethod
+    def user(user_id: int, bot: bool = False) -> dict:
+        return {
+            'id': str(user_id),
+            'username': 'photoevent' if bot else f"user{user_id % 10**6}",
+            'discriminator': '0',
+            'global_name': None,
+            'avatar': None,
+            'bot': bot,
+            'flags': 0,
+            'public_flags': 0,
+        }
+
+    def message(self, channel_id: int, payload: dict, webhook_id: Optional[int] = None) -> dict:
+        return {
+            'id': str(self._snowflake()),
+            'channel_id': str(channel_id),
+            'type': 0,
+            'content': payload.get('content') or '',
+            'author': self.user(BOT_USER_ID, bot=True),
+            'attachments': [],
+            'embeds': payload.get('embeds') or [],
+            'components': payload.get('components') or [],
+            'mentions': [],
+            'mention_roles': [],
+            'mention_everyone': False,
+            'pinned': False,
+            'tts': False,
+            'flags': payload.get('flags') or 0,
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'edited_timestamp': None,
+            **({'webhook_id': str(webhook_id), 'application_id': str(APPLICATION_ID)} if webhook_id else {}),
+        }
+
+    # Лимиты
+
+    def _count(self, route: str, outcome: str):
+        counters = self.stats.setdefault(route, {})
+        counters[outcome] = counters.get(outcome, 0) + 1
+
+    def _check_limits(self, route_key: Tuple[str, str], params: dict) -> Tuple[Optional[web.Response], dict]:
+        """Возвращает (ответ 429 или None, заголовки X-RateLimit-* корзины маршрута)."""
+        now = time.monotonic()
+
+        if self.global_limit and not route_key[1].startswith(GLOBAL_EXEMPT_PREFIXES):
+            if now - self._global_window >= 1.0:
+                self._global_window = now
+                self._global_count = 0
+            self._global_count += 1
+            if self._global_count > self.global_limit:
+                retry_after = round(1.0 - (now - self._global_window), 3)
+                return self._too_many(retry_after, is_global=True), {}
+
+        limit, per = self.route_limits.get(route_key, DEFAULT_LIMIT)
+        major = tuple(params.get(name) for name in MAJOR_PARAMETERS if name in params)
+        bucket = self._buckets.get((route_key, major))
+        if bucket is None:
+            name = hashlib.sha1(repr(route_key).encode()).hexdigest()[:16]
+            bucket = self._buckets[(route_key, major)] = Bucket(name, limit, per)
+
+        if not bucket.take(now):
+            response = self._too_many(round(bucket.reset_at - now, 3), is_global=False)
+            response.headers.update(bucket.headers(now))
+            return response, {}
+        return None, bucket.headers(now)
+
+    @staticmethod
+    def _too_many(retry_after: float, is_global: bool) -> web.Response:
+        headers = {
+            'Retry-After': f"{retry_after:.3f}",
+            # Без Via discord.py считает 429 блокировкой Cloudflare
+            'Via': '1.1 google',
+            'X-RateLimit-Scope': 'global' if is_global else 'user',
+        }
+        if is_global:
+            headers['X-RateLimit-Global'] = 'true'
+        return _json(
+            {'message': 'You are being rate limited.', 'retry_after': retry_after, 'global': is_global},
+            status=429, headers=headers
+        )
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        resource = request.match_info.route.resource
+        template = resource.canonical if resource else request.path
+        if not template.startswith(API_PREFIX):
+            return await handler(request)
+        template = template[len(API_PREFIX):]
+        route = f"{request.method} {template}"
+
+        if self.latency:
+            await asyncio.sleep(self.latency * self._rng.uniform(0.5, 1.5))
+
+        limited, headers = self._check_limits((request.method, template), dict(request.match_info))
+        if limited is not None:
+            self._count(route, '429')
+            return limited
+
+        response = await handler(request)
+        response.headers.update(headers)
+        self._count(route, str(response.status))
+        return response
+
+    # Маршруты
+
+    @staticmethod
+    async def _payload(request: web.Request) -> dict:
+        """Тело запроса: JSON или payload_json из multipart (сообщения с файлами)."""
+        if request.content_type == 'application/json':
+            return await request.json()
+        if request.content_type.startswith('multipart/'):
+            payload = {}
+            reader = await request.multipart()
+            async for part in reader:
+                if part.name == 'payload_json':
+                    payload = json.loads(await part.text())
+                else:
+                    await part.read()
+            return payload
+        return {}
+
+    async def get_me(self, request: web.Request) -> web.Response:
+        return _json(self.user(BOT_USER_ID, bot=True))
+
+    async def get_application(self, request: web.Request) -> web.Response:
+        return _json({
+            'id': str(APPLICATION_ID),
+            'name': 'photoevent',
+            'icon': None,
+            'description': '',
+            'rpc_origins': [],
+            'bot_public': False,
+            'bot_require_code_grant': False,
+            'owner': self.user(APPLICATION_ID + 1),
+            'summary': '',
+            'verify_key': '0' * 64,
+            'team': None,
+            'flags': 0,
+        })
+
+    async def get_gateway(self, request: web.Request) -> web.Response:
+        return _json({
+            'url': 'wss://gateway.invalid',
+            'shards': 1,
+            'session_start_limit': {'total': 1000, 'remaining': 1000, 'reset_after': 0, 'max_concurrency': 1},
+        })
+
+    async def get_user(self, request: web.Request) -> web.Response:
+        return _json(self.user(int(request.match_info['user_id'])))
+
+    async def create_dm(self, request: web.Request) -> web.Response:
+        recipient_id = int((await self._payload(request))['recipient_id'])
+        # Один и тот же личный канал для пользователя, как в Discord
+        channel_id = recipient_id + 1
+        self._dm_recipients[channel_id] = recipient_id
+        return _json({
+            'id': str(channel_id),
+            'type': 1,
+            'last_message_id': None,
+            'recipients': [self.user(recipient_id)],
+        })
+
+    async def get_channel(self, request: web.Request) -> web.Response:
+        channel_id = int(request.match_info['channel_id'])
+        return _json({
+            'id': str(channel_id),
+            'type': 0,
+            'guild_id': request.query.get('guild_id', str(APPLICATION_ID + 2)),
+            'name': f"channel-{channel_id}",
+            'position': 0,
+            'permission_overwrites': [],
+            'nsfw': False,
+            'parent_id': None,
+        })
+
+    async def create_message(self, request: web.Request) -> web.Response:
+        channel_id = int(request.match_info['channel_id'])
+        payload = await self._payload(request)
+        recipient_id = self._dm_recipients.get(channel_id)
+        if recipient_id is not None and self.dm_closed(recipient_id):
+            return _json(
+                {'message': 'Cannot send messages to this user', 'code': CANNOT_SEND_TO_USER}, status=403
+            )
+        return _json(self.message(channel_id, payload))
+
+    async def edit_message(self, request: web.Request) -> web.Response:
+        payload = await self._payload(request)
+        message = self.message(int(request.match_info['channel_id']), payload)
+        message['id'] = request.match_info['message_id']
+        message['edited_timestamp'] = message['timestamp']
+        return _json(message)
+
+    async def interaction_callback(self, request: web.Request) -> web.Response:
+        payload = await self._payload(request)
+        if request.query.get('with_response') not in ('true', '1', 'True'):
+            return web.Response(status=204)
+        data = payload.get('data') or {}
+        interaction_id = request.match_info['interaction_id']
+        return _json({
+            'interaction': {
+                'id': interaction_id,
+                'type': 2,
+                'activity_instance_id': None,
+                'response_message_id': None,
+                'response_message_loading': payload.get('type') == 5,
+                'response_message_ephemeral': bool((data.get('flags') or 0) & 64),
+            },
+            'resource': {'type': payload.get('type'), 'message': self.message(0, data)} if data else None,
+        })
+
+    async def execute_webhook(self, request: web.Request) -> web.Response:
+        payload = await self._payload(request)
+        if request.query.get('wait') not in ('true', '1', 'True'):
+            return web.Response(status=204)
+        return _json(self.message(0, payload, webhook_id=int(request.match_info['webhook_id'])))
+
+    async def edit_webhook_message(self, request: web.Request) -> web.Response:
+        payload = await self._payload(request)
+        message = self.message(0, payload, webhook_id=int(request.match_info['webhook_id']))
+        if request.match_info['message_id'] != '@original':
+            message['id'] = request.match_info['message_id']
+        return _json(message)
+
+    async def delete_webhook_message(self, request: web.Request) -> web.Response:
+        return web.Response(status=204)
+
+    async def sync_commands(self, request: web.Request) -> web.Response:
+        guild_id = request.match_info.get('guild_id')
+        commands = []
+        for command in await self._payload(request):
+            commands.append({
+                **command,
+                'id': str(self._snowflake()),
+                'application_id': str(APPLICATION_ID),
+                'version': '1',
+                **({'guild_id': guild_id} if guild_id else {}),
+            })
+        return _json(commands)
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return _json(self.stats)
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        app.add_routes([
+            web.get(API_PREFIX + '/users/@me', self.get_me),
+            web.get(API_PREFIX + '/oauth2/applications/@me', self.get_application),
+            web.get(API_PREFIX + '/gateway/bot', self.get_gateway),
+            web.post(API_PREFIX + '/users/@me/channels', self.create_dm),
+            web.get(API_PREFIX + '/users/{user_id}', self.get_user),
+            web.get(API_PREFIX + '/channels/{channel_id}', self.get_channel),
+            web.post(API_PREFIX + '/channels/{channel_id}/messages', self.create_message),
+            web.patch(API_PREFIX + '/channels/{channel_id}/messages/{message_id}', self.edit_message),
+            web.post(API_PREFIX + '/interactions/{interaction_id}/{interaction_token}/callback',
+                     self.interaction_callback),
+            web.post(API_PREFIX + '/webhooks/{webhook_id}/{webhook_token}', self.execute_webhook),
+            web.patch(API_PREFIX + '/webhooks/{webhook_id}/{webhook_token}/messages/{message_id}',
+                      self.edit_webhook_message),
+            web.delete(API_PREFIX + '/webhooks/{webhook_id}/{webhook_token}/messages/{message_id}',
+                       self.delete_webhook_message),
+            web.put(API_PREFIX + '/applications/{application_id}/commands', self.sync_commands),
+            web.put(API_PREFIX + '/applications/{application_id}/guilds/{guild_id}/commands', self.sync_commands),
+            web.get('/_standin/stats', self.get_stats),
+        ])
+        return app
+
+    async def start(self, host: str, port: int) -> web.AppRunner:
+        """Запускает сервер в текущем цикле событий; остановка - await runner.cleanup()."""
+        runner = web.AppRunner(self.app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        log.info("Имитация Discord API запущена", extra={'url': f"http://{host}:{port}{API_PREFIX}"})
+        return runner
+
+def parse_route_limit(text: str) -> Tuple[Tuple[str, str], Tuple[int, float]]:
+    """'POST /channels/{channel_id}/messages=5/5' -> (('POST', '/channels/{channel_id}/messages'), (5, 5.0))."""
+    route, _, limit = text.rpartition('=')
+    method, _, template = route.strip().partition(' ')
+    count, _, per = limit.partition('/')
+    try:
+        return (method.upper(), template.strip()), (int(count), float(per or 1))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ожидается 'МЕТОД /шаблон=запросов/секунд': {text}")
+
+async def _serve(args):
+    standin = DiscordStandIn(args.latency_ms / 1000, args.global_limit, args.dm_closed_share, args.seed,
+                             dict(args.route_limit))
+    runner = await standin.start(args.host, args.port)
+    print(f"DISCORD_API_BASE=http://{args.host}:{args.port}{API_PREFIX}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        print(json.dumps(standin.stats, ensure_ascii=False, indent=2))
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная имитация REST API Discord")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8787)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Средняя задержка ответа")
+    parser.add_argument('--global-limit', type=int, default=50, help="Глобальный лимит запросов в секунду (0 - нет)")
+    parser.add_argument('--dm-closed-share', type=float, default=0.0, help="Доля пользователей с закрытыми ЛС")
+    parser.add_argument('--route-limit', type=parse_route_limit, action='append', default=[],
+                        help="Лимит маршрута, например 'POST /users/@me/channels=10/10' (можно несколько)")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# event_files.py
+import asyncio
+import glob
+import gzip
+import os
+import shutil
+import sqlite3
+import urllib.request
+from typing import List, Optional
+
+import config
+import database
+from bot_logging import get_logger
+
+log = get_logger('events')
+
+ARCHIVE_SUFFIX = ".gz"
+
+# Размер блока при сжатии и распаковке файла базы
+CHUNK_SIZE = 1024 * 1024
+
+def archive_event_file(path: str) -> Optional[str]:
+    """
+    Сжимает файл завершенного ивента в config.EVENT_ARCHIVE_DIR и удаляет исходный файл.
+    Перед сжатием журнал переносится в базу, а база сжимается VACUUM.
+    Выполняется в отдельном потоке, возвращает путь к архиву или None при ошибке.
+    """
+    try:
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("PRAGMA journal_mode = DELETE")
+        conn.execute("VACUUM")
+        conn.close()
+
+        os.makedirs(config.EVENT_ARCHIVE_DIR, exist_ok=True)
+        name = os.path.basename(path)
+        archive_path = os.path.join(config.EVENT_ARCHIVE_DIR, name + ARCHIVE_SUFFIX)
+        number = 1
+        while os.path.exists(archive_path):
+            number += 1
+            archive_path = os.path.join(config.EVENT_ARCHIVE_DIR, f"{name}.{number}{ARCHIVE_SUFFIX}")
+
+        tmp_path = archive_path + '.tmp'
+        with open(path, 'rb') as src, gzip.open(tmp_path, 'wb', compresslevel=config.EVENT_ARCHIVE_COMPRESSLEVEL) as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        os.replace(tmp_path, archive_path)
+        os.remove(path)
+        return archive_path
+    except (sqlite3.Error, OSError):
+        log.exception("Ошибка при архивации файла ивента", extra={'path': path})
+        return None
+
+def unarchived_event_files() -> List[str]:
+    """Файлы прошлых ивентов, которые еще не сжаты (например, бот остановился во время архивации)."""
+    candidates = sorted(glob.glob(os.path.join(config.EVENTS_DIR, 'event_*.db')))
+    if os.path.exists(database.DEFAULT_DATABASE_NAME):
+        candidates.append(database.DEFAULT_DATABASE_NAME)
+    active = os.path.abspath(database.DATABASE_NAME)
+    return [path for path in candidates if os.path.abspath(path) != active]
+
+def list_archived_events() -> List[dict]:
+    """Архивы прошлых ивентов, от старых к новым: имя, размер архива и время архивации."""
+    events = []
+    for path in glob.glob(os.path.join(config.EVENT_ARCHIVE_DIR, '*' + ARCHIVE_SUFFIX)):
+        stat = os.stat(path)
+        events.append({
+            'name': os.path.basename(path)[:-len(ARCHIVE_SUFFIX)],
+            'path': path,
+            'size_bytes': stat.st_size,
+            'archived_at': stat.st_mtime
+        })
+    events.sort(key=lambda event: event['archived_at'])
+    return events
+
+def open_archived_event(name: str) -> sqlite3.Connection:
+    """
+    Открывает базу прошлого ивента только для чтения (name - из list_archived_events).
+    Архив распаковывается в config.EVENT_ARCHIVE_CACHE_DIR при первом обращении.
+    """
+    archive_path = os.path.join(config.EVENT_ARCHIVE_DIR, os.path.basename(name) + ARCHIVE_SUFFIX)
+    path = os.path.join(config.EVENT_ARCHIVE_CACHE_DIR, os.path.basename(name))
+
+    if not os.path.exists(path):
+        os.makedirs(config.EVENT_ARCHIVE_CACHE_DIR, exist_ok=True)
+        tmp_path = path + '.tmp'
+        with gzip.open(archive_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        os.replace(tmp_path, path)
+
+    uri = f"file:{urllib.request.pathname2url(os.path.abspath(path))}?mode=ro"
+    return sqlite3.connect(uri, uri=True)
+
+class EventArchiver:
+    """Архивирует файлы завершенных ивентов в фоновом потоке, не блокируя цикл событий."""
+
+    def __init__(self):
+        self._tasks = set()
+
+    @property
+    def pending(self) -> int:
+        """Сколько файлов ждут архивации."""
+        return len(self._tasks)
+
+    def schedule(self, path: str):
+        task = asyncio.create_task(self._archive(path))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _archive(self, path: str):
+        size = os.path.getsize(path)
+        archive_path = await asyncio.to_thread(archive_event_file, path)
+        if archive_path:
+            log.info("Файл ивента заархивирован", extra={
+                'path': path, 'archive': archive_path,
+                'size_bytes': size, 'archive_bytes': os.path.getsize(archive_path)
+            })
+
+event_archiver = EventArchiver()
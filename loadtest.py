@@ -0,0 +1,594 @@
+# loadtest.py
+# Нагрузочный прогон обработчиков бота без Discord и без сети.
+#
+#   python loadtest.py --rate 50 --duration 60
+#   python loadtest.py --rate 200 --mix ingest=80,approve=10,stats=10 --output run.json
+#   python loadtest.py --rest-api http://127.0.0.1:8787/api/v10 --mix approve=5,payments=1
+#   python loadtest.py --storage memory --rate 500   # хранилище в памяти вместо SQLite
+#
+# Бот импортируется как есть (main_discord_py.py), а вместо Discord ему передаются
+# поддельные сообщения, вложения, пользователи и взаимодействия. Ответы Discord и загрузка
+# вложений с CDN имитируются задержками. Работа идет во временном каталоге: своя база,
+# свой архив скриншотов и превью.
+#
+# С --rest-api личные сообщения игрокам, fetch_user и followup идут через HTTP-клиент
+# discord.py в локальную имитацию Discord (discord_standin.py) с ее лимитами и ошибками 403.
+import argparse
+import asyncio
+import datetime
+import hashlib
+import json
+import os
+import platform
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from collections import deque
+from typing import Optional
+
+import config
+
+LOAD_GUILD_ID = 1
+FIRST_DISCORD_ID = 400_000_000_000_000_000
+ADMIN_ID = 399_999_999_999_999_999
+
+# Доля точных повторов файлов (один и тот же скриншот отправлен повторно)
+DUPLICATE_SHARE = 0.03
+# Размер синтетических скриншотов
+IMAGE_SIZE = (480, 270)
+
+DEFAULT_MIX = "ingest=60,register=10,approve=15,reject=5,stats=10"
+
+class Simulator:
+    """Имитация задержек Discord API и CDN: равномерно от 0.5 до 1.5 заданного значения."""
+
+    def __init__(self, rng: random.Random, api_latency: float, cdn_latency: float):
+        self.rng = rng
+        self.api_latency = api_latency
+        self.cdn_latency = cdn_latency
+        self.api_calls = 0
+
+    async def api(self):
+        self.api_calls += 1
+        if self.api_latency:
+            await asyncio.sleep(self.api_latency * self.rng.uniform(0.5, 1.5))
+
+    async def cdn(self):
+        if self.cdn_latency:
+            await asyncio.sleep(self.cdn_latency * self.rng.uniform(0.5, 1.5))
+
+class FakeUser:
+    """Пользователь Discord: личные сообщения только считаются."""
+
+    def __init__(self, sim: Simulator, user_id: int, name: str, permissions):
+        self.sim = sim
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.mention = f"<@{user_id}>"
+        self.bot = False
+        self.roles = []
+        self.guild_permissions = permissions
+        self.sent = 0
+
+    def __str__(self):
+        return self.name
+
+    async def send(self, *args, **kwargs):
+        await self.sim.api()
+        self.sent += 1
+
+class FakeGuild:
+    def __init__(self, guild_id: int, members: dict):
+        self.id = guild_id
+        self.name = f"loadtest-{guild_id}"
+        self._members = members
+
+    def __str__(self):
+        return self.name
+
+    def get_member(self, user_id: int):
+        return self._members.get(user_id)
+
+    async def fetch_member(self, user_id: int):
+        return self._members[user_id]
+
+class FakeAttachment:
+    def __init__(self, attachment_id: int, filename: str, size: int):
+        self.id = attachment_id
+        self.filename = filename
+        self.size = size
+        self.url = f"https://cdn.loadtest.invalid/attachments/{attachment_id}/{filename}"
+        self.content_type = 'image/png'
+
+class FakeMessage:
+    def __init__(self, message_id: int, author: FakeUser, channel, attachments):
+        self.id = message_id
+        self.author = author
+        self.channel = channel
+        self.attachments = attachments
+        self.content = ''
+        self.guild = None
+
+class FakeResponse:
+    """interaction.response: как и в Discord, ответить на взаимодействие можно только один раз."""
+
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self._done = False
+        self.modal = None
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def _respond(self):
+        if self._done:
+            raise RuntimeError("на взаимодействие уже ответили")
+        self._done = True
+        await self.interaction.sim.api()
+
+    async def defer(self, **kwargs):
+        await self._respond()
+
+    async def send_message(self, content=None, **kwargs):
+        await self._respond()
+        self.interaction.record(content, kwargs)
+
+    async def edit_message(self, **kwargs):
+        await self._respond()
+
+    async def send_modal(self, modal):
+        await self._respond()
+        self.modal = modal
+
+class FakeFollowup:
+    """interaction.followup: имитация или настоящий вебхук discord.py (с --rest-api)."""
+
+    def __init__(self, interaction, webhook):
+        self.interaction = interaction
+        self.webhook = webhook
+
+    async def send(self, content=None, **kwargs):
+        if not self.interaction.response.is_done():
+            raise RuntimeError("followup без ответа на взаимодействие")
+        self.interaction.record(content, kwargs)
+        if self.webhook is None:
+            await self.interaction.sim.api()
+            return None
+        if content is not None:
+            kwargs['content'] = content
+        return await self.webhook.send(**kwargs)
+
+class FakeInteraction:
+    """Взаимодействие (слэш-команда, кнопка или модальное окно) на сервере ивента."""
+
+    def __init__(self, sim: Simulator, interaction_id: int, user: FakeUser, guild: FakeGuild, webhook=None):
+        self.sim = sim
+        self.id = interaction_id
+        self.user = user
+        self.guild = guild
+        self.guild_id = guild.id
+        self.channel = None
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self, webhook)
+        self.replies = []
+
+    def record(self, content, kwargs):
+        self.replies.append(_reply_text(content, kwargs))
+
+def _reply_text(content, kwargs) -> str:
+    """Текст ответа бота: сообщение или заголовок embed."""
+    if content is not None:
+        return str(content)
+    return getattr(kwargs.get('embed'), 'title', None) or ''
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+def make_png(rng: random.Random, width: int, height: int) -> bytes:
+    """Синтетический скриншот: градиент с шумом (у разных картинок разные перцептивные хеши)."""
+    base = [rng.randrange(256) for _ in range(3)]
+    step = [rng.uniform(-1, 1) for _ in range(3)]
+    rows = []
+    for y in range(height):
+        row = bytearray(b'\x00')
+        for x in range(width):
+            for c in range(3):
+                row.append(int(base[c] + step[c] * (x + y) / 2 + rng.randrange(16)) & 0xFF)
+        rows.append(bytes(row))
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + _png_chunk(b'IHDR', header)
+            + _png_chunk(b'IDAT', zlib.compress(b''.join(rows), 1)) + _png_chunk(b'IEND', b''))
+
+def unique_png(image: bytes, tag: int) -> bytes:
+    """Та же картинка с уникальным текстовым блоком: другой SHA-256 при том же изображении."""
+    return image[:-12] + _png_chunk(b'tEXt', b'loadtest\x00' + str(tag).encode()) + image[-12:]
+
+class LoadTest:
+    """Состояние прогона: игроки, администратор, очередь скриншотов на модерации и замеры."""
+
+    def __init__(self, bot_module, args, rng: random.Random):
+        self.bot = bot_module
+        self.args = args
+        self.rng = rng
+        self.sim = Simulator(rng, args.api_latency_ms / 1000, args.cdn_latency_ms / 1000)
+        self.users = {}
+        self.players = []
+        self.next_id = FIRST_DISCORD_ID
+        self.next_object_id = 1
+        self.pending = deque()
+        self.images = [make_png(rng, *IMAGE_SIZE) for _ in range(args.images)]
+        self.attachments = []
+        self.files = {}
+        self.latencies = {}
+        self.errors = {}
+        self.declined = {}
+        self.dropped = 0
+
+        admin_permissions = bot_module.discord.Permissions(administrator=True)
+        self.admin = self._add_user(ADMIN_ID, "loadtest-admin", admin_permissions)
+        self.guild = FakeGuild(LOAD_GUILD_ID, self.users)
+        self.dm_channel_type = self._dm_channel_type()
+
+    def _object_id(self) -> int:
+        self.next_object_id += 1
+        return self.next_object_id
+
+    def _add_user(self, user_id: int, name: str, permissions=None) -> FakeUser:
+        if permissions is None:
+            permissions = self.bot.discord.Permissions.none()
+        user = FakeUser(self.sim, user_id, name, permissions)
+        self.users[user_id] = user
+        return user
+
+    def _new_player(self) -> FakeUser:
+        self.next_id += 1
+        return self._add_user(self.next_id, f"player{self.next_id - FIRST_DISCORD_ID}")
+
+    def _dm_channel_type(self):
+        """Личный канал: on_message проверяет isinstance(message.channel, discord.DMChannel)."""
+        sim = self.sim
+
+        class FakeDMChannel(self.bot.discord.DMChannel):
+            def __init__(self, channel_id: int):
+                self.id = channel_id
+                self.replies = []
+
+            async def send(self, content=None, **kwargs):
+                await sim.api()
+                self.replies.append(_reply_text(content, kwargs))
+
+        return FakeDMChannel
+
+    def install(self):
+        """Подменяет сетевые части бота: кэш пользователей, загрузку вложений и разбор команд."""
+        bot = self.bot.bot
+        users = self.users
+        archive = self.bot.screenshot_archive
+
+        def get_user(user_id):
+            return users.get(user_id)
+
+        async def fetch_user(user_id):
+            await self.sim.api()
+            return users[user_id]
+
+        async def process_commands(message):
+            return None
+
+        bot.process_commands = process_commands
+        # С --rest-api пользователи запрашиваются и получают сообщения через имитацию Discord
+        if not self.args.rest_api:
+            bot.get_user = get_user
+            bot.fetch_user = fetch_user
+
+        async def download(url: str, tmp_path: str):
+            # Семафор архива сохраняется: очередь загрузок ведет себя как в боте
+            async with archive._semaphore:
+                await self.sim.cdn()
+                data = self.files[url]
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+            return hashlib.sha256(data).hexdigest(), len(data)
+
+        archive._download = download
+
+    def prepare(self):
+        """Создает базу, открывает ивент и регистрирует начальных игроков."""
+        database = self.bot.database
+        database.setup_database()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        database.update_guild_settings(
+            LOAD_GUILD_ID,
+            event_start_time=(now - datetime.timedelta(days=1)).isoformat(),
+            event_end_time=(now + datetime.timedelta(days=7)).isoformat()
+        )
+        for _ in range(self.args.players):
+            user = self._new_player()
+            database.register_player(LOAD_GUILD_ID, user.id, str(user.id % 10**6), user.name)
+            self.players.append(user)
+
+    def _interaction(self, user: FakeUser) -> FakeInteraction:
+        interaction_id = self._object_id()
+        webhook = None
+        if self.args.rest_api:
+            # Как Interaction.followup в discord.py: вебхук приложения с токеном взаимодействия
+            bot = self.bot.bot
+            webhook = self.bot.discord.Webhook.from_state(
+                data={'id': bot.application_id, 'type': 3, 'token': f"loadtest-{interaction_id}"},
+                state=bot._connection
+            )
+        return FakeInteraction(self.sim, interaction_id, user, self.guild, webhook)
+
+    def _next_pending(self):
+        if not self.pending:
+            self.pending.extend(self.bot.database.get_unposted_pending_submissions(LOAD_GUILD_ID))
+        return self.pending.popleft() if self.pending else None
+
+    # Операции нагрузки. Каждая возвращает взаимодействия/каналы, по ответам которых
+    # определяется, отказал ли бот, или None, если выполнять операцию было не с чем.
+
+    async def op_register(self):
+        user = self._new_player()
+        modal = self.bot.RegistrationModal()
+        modal.static_id._value = str(user.id % 10**6)
+        modal.nickname._value = user.name
+        interaction = self._interaction(user)
+        await modal.on_submit(interaction)
+        self.players.append(user)
+        return interaction
+
+    async def op_ingest(self):
+        if not self.players:
+            return None
+        user = self.rng.choice(self.players)
+        if self.attachments and self.rng.random() < DUPLICATE_SHARE:
+            attachment = self.rng.choice(self.attachments)
+        else:
+            attachment_id = self._object_id()
+            data = unique_png(self.rng.choice(self.images), attachment_id)
+            attachment = FakeAttachment(attachment_id, "screenshot.png", len(data))
+            self.files[attachment.url] = data
+            self.attachments.append(attachment)
+        channel = self.dm_channel_type(self._object_id())
+        message = FakeMessage(self._object_id(), user, channel, [attachment])
+        await self.bot.on_message(message)
+        return channel
+
+    async def op_approve(self):
+        submission_id = self._next_pending()
+        if submission_id is None:
+            return None
+        view = self.bot.ScreenshotModerationView(submission_id, None)
+        interaction = self._interaction(self.admin)
+        await view.approve_button.callback(interaction)
+        return interaction
+
+    async def op_reject(self):
+        submission_id = self._next_pending()
+        if submission_id is None:
+            return None
+        view = self.bot.ScreenshotModerationView(submission_id, None)
+        interaction = self._interaction(self.admin)
+        await view.reject_button.callback(interaction)
+        modal = interaction.response.modal
+        modal.reason._value = "Нагрузочный тест"
+        submit = self._interaction(self.admin)
+        await modal.on_submit(submit)
+        return submit
+
+    async def op_stats(self):
+        interaction = self._interaction(self.admin)
+        await self.bot.admin_stats.callback(interaction)
+        return interaction
+
+    async def op_payments(self):
+        interaction = self._interaction(self.admin)
+        await self.bot.calculate_payments.callback(interaction)
+        return interaction
+
+    async def run_operation(self, name: str, scheduled: float):
+        """Выполняет операцию; задержка считается от запланированного времени запуска."""
+        operation = getattr(self, f"op_{name}")
+        try:
+            target = await operation()
+        except Exception as e:
+            key = f"{name}: {type(e).__name__}: {e}"
+            self.errors[key] = self.errors.get(key, 0) + 1
+            return
+        elapsed = time.perf_counter() - scheduled
+        if target is None:
+            return
+        self.latencies.setdefault(name, []).append(elapsed)
+        # Сообщения бота об ошибках начинаются с ❌
+        if any(reply.startswith("❌") for reply in target.replies):
+            self.declined[name] = self.declined.get(name, 0) + 1
+
+    async def run(self, rate: float, duration: float, mix: dict, max_in_flight: int) -> float:
+        """
+        Открытая модель нагрузки: операции запускаются с пуассоновскими интервалами
+        независимо от того, успевает ли бот, поэтому задержки включают ожидание в очереди.
+        """
+        names = list(mix)
+        weights = [mix[name] for name in names]
+        tasks = set()
+        started = time.perf_counter()
+        deadline = started + duration
+        next_at = started
+
+        while next_at < deadline:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            scheduled = next_at
+            next_at += self.rng.expovariate(rate)
+
+            if len(tasks) >= max_in_flight:
+                self.dropped += 1
+                continue
+            name = self.rng.choices(names, weights)[0]
+            task = asyncio.create_task(self.run_operation(name, scheduled))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.wait(tasks)
+        return time.perf_counter() - started
+
+def _percentile(sorted_values, q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+def report(test: LoadTest, elapsed: float, args, rest_stats: Optional[dict]) -> dict:
+    operations = {}
+    for name, values in sorted(test.latencies.items()):
+        values.sort()
+        operations[name] = {
+            'count': len(values),
+            'ops_per_sec': round(len(values) / elapsed, 2),
+            'p50_ms': round(_percentile(values, 0.50) * 1000, 2),
+            'p95_ms': round(_percentile(values, 0.95) * 1000, 2),
+            'p99_ms': round(_percentile(values, 0.99) * 1000, 2),
+            'max_ms': round(values[-1] * 1000, 2),
+            'declined': test.declined.get(name, 0),
+        }
+
+    lag = test.bot.loop_watchdog.lag
+    completed = sum(len(values) for values in test.latencies.values())
+    return {
+        'meta': {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'rate': args.rate,
+            'duration_seconds': args.duration,
+            'mix': args.mix,
+            'players': args.players,
+            'api_latency_ms': args.api_latency_ms,
+            'cdn_latency_ms': args.cdn_latency_ms,
+            'rest_api': args.rest_api,
+            'storage': args.storage,
+        },
+        'elapsed_seconds': round(elapsed, 2),
+        'completed': completed,
+        'throughput_ops_per_sec': round(completed / elapsed, 2),
+        'errors': sum(test.errors.values()),
+        'error_types': test.errors,
+        'dropped': test.dropped,
+        'discord_api_calls': test.sim.api_calls,
+        'loop_lag_p99_ms': round(lag.quantile(0.99) * 1000, 2) if lag.count else None,
+        'dm_failures': {
+            reason: test.bot.dm_failures(reason).value for reason in ('forbidden', 'http', 'user_not_found', 'error')
+        },
+        'rest_api': rest_stats,
+        'operations': operations,
+    }
+
+def print_summary(result: dict):
+    print(f"{'операция':<10} {'кол-во':>7} {'оп/с':>8} {'p50 мс':>9} {'p95 мс':>9} {'p99 мс':>9}"
+          f" {'макс мс':>9} {'отказы':>7}", file=sys.stderr)
+    for name, row in result['operations'].items():
+        print(f"{name:<10} {row['count']:>7} {row['ops_per_sec']:>8} {row['p50_ms']:>9} {row['p95_ms']:>9}"
+              f" {row['p99_ms']:>9} {row['max_ms']:>9} {row['declined']:>7}", file=sys.stderr)
+    print(f"Итого: {result['completed']} операций за {result['elapsed_seconds']} с"
+          f" ({result['throughput_ops_per_sec']} оп/с), ошибок: {result['errors']},"
+          f" сброшено: {result['dropped']}, задержка цикла p99: {result['loop_lag_p99_ms']} мс", file=sys.stderr)
+    for error, count in result['error_types'].items():
+        print(f"  ❌ {count} × {error}", file=sys.stderr)
+    failures = {reason: count for reason, count in result['dm_failures'].items() if count}
+    if failures:
+        print(f"Неудачные DM: {failures}", file=sys.stderr)
+    for route, statuses in sorted((result['rest_api'] or {}).items()):
+        print(f"  {route:<70} {statuses}", file=sys.stderr)
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if not hasattr(LoadTest, f"op_{name}"):
+            raise argparse.ArgumentTypeError(f"неизвестная операция: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+async def _rest_stats(bot_module, api_base: str) -> Optional[dict]:
+    """Счетчики ответов имитации Discord по маршрутам (None, если это не discord_standin.py)."""
+    import aiohttp
+    url = api_base.split('/api/')[0] + '/_standin/stats'
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url) as response:
+                return await response.json() if response.status == 200 else None
+    except aiohttp.ClientError:
+        return None
+
+async def _main(args, bot_module) -> dict:
+    rng = random.Random(args.seed)
+    test = LoadTest(bot_module, args, rng)
+    test.install()
+    test.prepare()
+    if args.rest_api:
+        # Вход по токену без gateway: только HTTP-клиент discord.py
+        await bot_module.bot.login('loadtest')
+    bot_module.loop_watchdog.start()
+    try:
+        elapsed = await test.run(args.rate, args.duration, parse_mix(args.mix), args.max_in_flight)
+    finally:
+        bot_module.loop_watchdog.stop()
+        await bot_module.screenshot_archive.close()
+        if args.rest_api:
+            await bot_module.bot.http.close()
+    rest_stats = await _rest_stats(bot_module, args.rest_api) if args.rest_api else None
+    return report(test, elapsed, args, rest_stats)
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон обработчиков бота без Discord")
+    parser.add_argument('--rate', type=float, default=20.0, help="Операций в секунду")
+    parser.add_argument('--duration', type=float, default=30.0, help="Длительность, секунд")
+    parser.add_argument('--mix', default=DEFAULT_MIX, type=str,
+                        help=f"Веса операций ({', '.join(n[3:] for n in vars(LoadTest) if n.startswith('op_'))})")
+    parser.add_argument('--players', type=int, default=500, help="Игроков, зарегистрированных до начала")
+    parser.add_argument('--images', type=int, default=64, help="Разных синтетических скриншотов")
+    parser.add_argument('--api-latency-ms', type=float, default=80.0, help="Средняя задержка ответа Discord API")
+    parser.add_argument('--cdn-latency-ms', type=float, default=150.0, help="Средняя задержка загрузки вложения")
+    parser.add_argument('--max-in-flight', type=int, default=2000, help="Предел одновременных операций")
+    parser.add_argument('--rest-api', help="Адрес имитации REST API Discord (discord_standin.py)")
+    parser.add_argument('--storage', choices=('sqlite', 'memory'), default=config.STORAGE_ENGINE,
+                        help="Хранилище бота: sqlite (файл базы) или memory (в памяти, без ввода-вывода)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--log-level', default='WARNING', help="Уровень журнала бота во время прогона")
+    parser.add_argument('--keep', action='store_true', help="Не удалять временный каталог с базой и архивом")
+    parser.add_argument('--output', help="Файл для результатов JSON")
+    args = parser.parse_args()
+    try:
+        parse_mix(args.mix)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+
+    work_dir = tempfile.mkdtemp(prefix='photoevent-loadtest-')
+    output = os.path.abspath(args.output) if args.output else None
+    # Относительные пути бота (база, архив, превью, журналы) указывают во временный каталог
+    os.chdir(work_dir)
+    config.LOG_LEVEL = args.log_level
+    config.STORAGE_ENGINE = args.storage
+    if args.rest_api:
+        config.DISCORD_API_BASE = args.rest_api
+    try:
+        import main_discord_py
+        result = asyncio.run(_main(args, main_discord_py))
+    finally:
+        if args.keep:
+            print(f"Временный каталог: {work_dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_summary(result)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(result, ensure_ascii=False, indent=2) + "\n")
+
+if __name__ == "__main__":
+    main()
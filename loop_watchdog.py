@@ -0,0 +1,102 @@
+# loop_watchdog.py
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+import config
+import metrics
+from bot_logging import get_logger
+
+log = get_logger('watchdog')
+
+# Каталог проекта: по нему в стеке ищется обработчик, заблокировавший цикл
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Файлы, которые не считаются обработчиками (обертки, сам сторож и нагрузочный прогон)
+_SKIP_FILES = {os.path.join(PROJECT_DIR, name) for name in ('metrics.py', 'loop_watchdog.py', 'loadtest.py')}
+# Handle._run цикла событий - граница текущего шага задачи в стеке
+_ASYNCIO_EVENTS_FILE = os.path.abspath(asyncio.events.__file__)
+
+def _blocking_handler(frame) -> str:
+    """Самая внешняя функция проекта в текущем шаге задачи (обработчик, который блокирует цикл)."""
+    handler = '?'
+    while frame:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename == _ASYNCIO_EVENTS_FILE:
+            break
+        if filename.startswith(PROJECT_DIR) and filename not in _SKIP_FILES:
+            handler = frame.f_code.co_name
+        frame = frame.f_back
+    return handler
+
+class LoopWatchdog:
+    """
+    Сторож цикла событий.
+    Корутина-пульс каждые interval секунд отмечает время и записывает задержку цикла в метрики;
+    отдельный поток, если пульса нет дольше threshold секунд, снимает стек потока цикла
+    и записывает, какой обработчик его блокирует.
+    """
+
+    def __init__(self, interval: float, threshold: float):
+        self.interval = interval
+        self.threshold = threshold
+        self.lag = metrics.histogram("event_loop_lag_seconds", "Задержка цикла событий")
+        self._last_beat = time.monotonic()
+        self._reported_beat = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Запускает пульс и поток-сторож (вызывается из работающего цикла событий)."""
+        if self._task and not self._task.done():
+            return
+
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.lag.observe(max(0.0, now - expected))
+            self._last_beat = now
+
+    def _watch(self):
+        while not self._stopped.wait(self.threshold / 2):
+            last_beat = self._last_beat
+            stalled_for = time.monotonic() - last_beat - self.interval
+            # Один отчет на каждую остановку цикла
+            if stalled_for > self.threshold and self._reported_beat != last_beat:
+                self._reported_beat = last_beat
+                self._report(stalled_for)
+
+    def _report(self, stalled_for: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+
+        handler = _blocking_handler(frame)
+        stack = traceback.format_stack(frame, limit=config.LOOP_STALL_STACK_DEPTH)
+
+        metrics.counter("event_loop_stalls_total", "Блокировки цикла событий", handler=handler).inc()
+        log.warning("Цикл событий заблокирован", extra={
+            'stalled_ms': round(stalled_for * 1000),
+            'handler': handler,
+            'stack': "".join(stack).rstrip()
+        })
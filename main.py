@@ -279,15 +279,15 @@ class PlayerListView(discord.ui.View):
                 )
                 
                 # Основная информация
-                status = "❌ Дисквалифицирован" if player['is_disqualified'] else "✅ Активен"
+                status = "❌ Дисквалифицирован" if player.is_disqualified else "✅ Активен"
                 embed.add_field(
                     name="Основная информация",
-                    value=f"**Пользователь:** {user.mention}\n**Никнейм:** {player['nickname']}\n**StaticID:** {player['static_id']}\n**Статус:** {status}",
+                    value=f"**Пользователь:** {user.mention}\n**Никнейм:** {player.nickname}\n**StaticID:** {player.static_id}\n**Статус:** {status}",
                     inline=False
                 )
                 
                 # Статистика скриншотов
-                valid_screenshots = len([s for s in screenshots if s['is_valid']])
+                valid_screenshots = len([s for s in screenshots if s.is_valid])
                 embed.add_field(
                     name="📸 Статистика скриншотов",
                     value=f"Всего отправлено: **{len(screenshots)}**\nВалидных: **{valid_screenshots}**",
@@ -297,7 +297,7 @@ class PlayerListView(discord.ui.View):
                 # Дата регистрации
                 embed.add_field(
                     name="📅 Регистрация",
-                    value=f"<t:{int(player['registration_time'])}:F>",
+                    value=f"<t:{player.registration_ms // 1000}:F>",
                     inline=True
                 )
                 
@@ -315,23 +315,12 @@ async def admin_stats(interaction: discord.Interaction):
         return
     
     # Получаем полный список игроков с дополнительной информацией
-    import sqlite3
-    conn = sqlite3.connect('event_data.db')
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT p.discord_id, p.nickname, p.static_id, 
-               COUNT(CASE WHEN s.is_valid = 1 THEN 1 END) as screenshot_count,
-               p.is_disqualified
-        FROM players p
-        LEFT JOIN submissions s ON p.discord_id = s.player_id
-        GROUP BY p.discord_id, p.nickname, p.static_id, p.is_disqualified
-        ORDER BY screenshot_count DESC, p.nickname ASC
-    """)
-    
-    players_data = cursor.fetchall()
+    players_data = [
+        (p.discord_id, p.nickname, p.static_id, valid_submissions, p.is_disqualified)
+        for p, valid_submissions in database.list_players(interaction.guild_id)
+    ]
+    players_data.sort(key=lambda p: (-p[3], p[1]))
     total_players = len(players_data)
-    conn.close()
     
     embed = discord.Embed(
         title="📊 Статистика ивента",
@@ -421,8 +410,8 @@ class ScreenshotPaginator(discord.ui.View):
         if current_screenshots:
             screenshot_links = []
             for i, screenshot in enumerate(current_screenshots, start_idx + 1):
-                status = "✅" if screenshot['is_valid'] else "❌"
-                screenshot_links.append(f"{status} [{i}. Скриншот]({screenshot['screenshot_url']})")
+                status = "✅" if screenshot.is_valid else "❌"
+                screenshot_links.append(f"{status} [{i}. Скриншот]({screenshot.screenshot_url})")
             
             embed.add_field(
                 name=f"**Скриншоты (страница {self.current_page + 1}/{self.max_page + 1})**",
@@ -481,18 +470,18 @@ async def admin_profile(interaction: discord.Interaction, user: discord.Member):
     else:
         # Создаем простой Embed без пагинации
         embed = discord.Embed(
-            title=f"👤 Профиль игрока: {player['nickname']}",
+            title=f"👤 Профиль игрока: {player.nickname}",
             color=config.RASPBERRY_COLOR
         )
         
-        status = "❌ Дисквалифицирован" if player['is_disqualified'] else "✅ Активен"
+        status = "❌ Дисквалифицирован" if player.is_disqualified else "✅ Активен"
         embed.add_field(
             name="Основная информация",
-            value=f"**Пользователь:** {user.mention}\n**Никнейм:** {player['nickname']}\n**StaticID:** {player['static_id']}\n**Статус:** {status}",
+            value=f"**Пользователь:** {user.mention}\n**Никнейм:** {player.nickname}\n**StaticID:** {player.static_id}\n**Статус:** {status}",
             inline=False
         )
         
-        valid_screenshots = len([s for s in screenshots if s['is_valid']])
+        valid_screenshots = len([s for s in screenshots if s.is_valid])
         embed.add_field(
             name="📸 Статистика скриншотов",
             value=f"Всего отправлено: **{len(screenshots)}**\nВалидных: **{valid_screenshots}**",
@@ -501,15 +490,15 @@ async def admin_profile(interaction: discord.Interaction, user: discord.Member):
         
         embed.add_field(
             name="📅 Регистрация",
-            value=f"<t:{int(player['registration_time'])}:F>",
+            value=f"<t:{player.registration_ms // 1000}:F>",
             inline=True
         )
         
         if screenshots:
             screenshot_links = []
             for i, screenshot in enumerate(screenshots, 1):
-                status = "✅" if screenshot['is_valid'] else "❌"
-                screenshot_links.append(f"{status} [{i}. Скриншот]({screenshot['screenshot_url']})")
+                status = "✅" if screenshot.is_valid else "❌"
+                screenshot_links.append(f"{status} [{i}. Скриншот]({screenshot.screenshot_url})")
             
             embed.add_field(
                 name="🖼️ Скриншоты",
@@ -539,13 +528,13 @@ async def admin_disqualify(interaction: discord.Interaction, user: discord.Membe
         return
     
     # Проверяем, не дисквалифицирован ли уже
-    if player['is_disqualified']:
+    if player.is_disqualified:
         await interaction.response.send_message("❌ Этот игрок уже дисквалифицирован.", ephemeral=True)
         return
     
     # Дисквалифицируем игрока
     if database.disqualify_player(user.id):
-        await interaction.response.send_message(f"✅ Игрок {user.mention} ({player['nickname']}) успешно дисквалифицирован.", ephemeral=True)
+        await interaction.response.send_message(f"✅ Игрок {user.mention} ({player.nickname}) успешно дисквалифицирован.", ephemeral=True)
         
         # Пытаемся отправить уведомление игроку в ЛС
         try:
@@ -1,40 +1,96 @@
 import os
+import asyncio
+import tempfile
 import discord
 from discord.ext import commands
 from discord import app_commands
 import datetime
 import pytz
+from typing import Dict, Optional
 from dotenv import load_dotenv
 
 # Импортируем наши модули
 import database
+import storage
 import config
+import metrics
+import data_export
+from backup import BackupScheduler
+from replication import WalReplicator
+from bot_logging import setup_logging, get_logger, bind
+from event_files import event_archiver, unarchived_event_files
+from moderation_inbox import ModerationInbox
+from screenshot_archive import ScreenshotArchive, image_for_embed, original_link
+from thumbnails import preview_cache
+from perceptual_hash import PerceptualIndex
+from loop_watchdog import LoopWatchdog
 
 load_dotenv()
+setup_logging()
+
+log = get_logger('bot')
+dm_log = get_logger('dm')
+ingest_log = get_logger('ingest')
+moderation_log = get_logger('moderation')
 
 # Настройка интентов для бота
 intents = discord.Intents.default()
 intents.message_content = True
 intents.dm_messages = True
 
-# Создание экземпляра бота для discord.py
-bot = commands.Bot(command_prefix='!', intents=intents)
+# REST-запросы бота можно направить в локальную имитацию Discord (discord_standin.py)
+if config.DISCORD_API_BASE:
+    discord.http.Route.BASE = config.DISCORD_API_BASE
+
+# Создание экземпляра бота для discord.py (шардирование включается автоматически при росте числа серверов)
+bot = commands.AutoShardedBot(command_prefix='!', intents=intents)
+# Время и ошибки всех запросов к Discord API (личные сообщения, fetch_user, отправка в каналы)
+metrics.instrument_http(bot.http)
+# Ответы на взаимодействия и followup идут через общий адаптер вебхуков, а не через bot.http
+metrics.instrument_http(discord.webhook.async_.async_context.get())
+
+# Локальный архив файлов скриншотов
+screenshot_archive = ScreenshotArchive(config.SCREENSHOT_ARCHIVE_DIR, config.ARCHIVE_DOWNLOAD_CONCURRENCY)
+# Индекс похожих скриншотов (перцептивные хеши)
+perceptual_index = PerceptualIndex(config.PHASH_WORKERS)
+# Сторож блокировок цикла событий
+loop_watchdog = LoopWatchdog(config.LOOP_WATCHDOG_INTERVAL, config.LOOP_STALL_THRESHOLD)
+# Резервные копии базы текущего ивента
+backup_scheduler = BackupScheduler(config.BACKUP_INTERVAL_SECONDS)
+# Непрерывная реплика WAL
+replicator = WalReplicator(config.REPLICATION_INTERVAL)
+
+# HTTP endpoint метрик (запускается один раз в on_ready)
+metrics_server = None
 
-def is_event_active() -> bool:
-    """Проверяет, активен ли ивент в настоящее время."""
+# Кэш настроек ивента по серверам: guild_id -> настройки из database.get_guild_settings
+guild_settings_cache: Dict[int, dict] = {}
+
+def get_guild_settings(guild_id: int) -> dict:
+    """Возвращает настройки ивента сервера из кэша, загружая их из базы при первом обращении."""
+    settings = guild_settings_cache.get(guild_id)
+    if settings is None:
+        settings = database.get_guild_settings(guild_id)
+        guild_settings_cache[guild_id] = settings
+    return settings
+
+def is_event_active(guild_id: int) -> bool:
+    """Проверяет, активен ли ивент сервера в настоящее время."""
     try:
-        start_time = datetime.datetime.fromisoformat(config.EVENT_START_TIME.replace('Z', '+00:00'))
-        end_time = datetime.datetime.fromisoformat(config.EVENT_END_TIME.replace('Z', '+00:00'))
+        settings = get_guild_settings(guild_id)
+        start_time = datetime.datetime.fromisoformat(settings['event_start_time'].replace('Z', '+00:00'))
+        end_time = datetime.datetime.fromisoformat(settings['event_end_time'].replace('Z', '+00:00'))
         current_time = datetime.datetime.now(pytz.UTC)
         return start_time <= current_time <= end_time
     except Exception:
         return False
 
-def format_event_dates() -> str:
-    """Форматирует даты начала и конца ивента для отображения."""
+def format_event_dates(guild_id: int) -> str:
+    """Форматирует даты начала и конца ивента сервера для отображения."""
     try:
-        start_time = datetime.datetime.fromisoformat(config.EVENT_START_TIME.replace('Z', '+00:00'))
-        end_time = datetime.datetime.fromisoformat(config.EVENT_END_TIME.replace('Z', '+00:00'))
+        settings = get_guild_settings(guild_id)
+        start_time = datetime.datetime.fromisoformat(settings['event_start_time'].replace('Z', '+00:00'))
+        end_time = datetime.datetime.fromisoformat(settings['event_end_time'].replace('Z', '+00:00'))
         start_str = start_time.strftime("%d.%m.%Y в %H:%M")
         end_str = end_time.strftime("%d.%m.%Y в %H:%M")
         return f"{start_str} до {end_str}"
@@ -52,6 +108,132 @@ def get_user_tag(user_id: int) -> str:
     except:
         return f"ID:{user_id}"
 
+def dm_failures(reason: str) -> metrics.Counter:
+    """Счетчик неудачных личных сообщений игрокам по причине."""
+    return metrics.counter("dm_failures_total", "Неудачные личные сообщения игрокам", reason=reason)
+
+async def send_approval_notification(submission_id: int):
+    """Отправляет игроку личное сообщение об одобрении скриншота."""
+    submission = database.get_submission_by_id(submission_id)
+    bind(submission_id=submission_id, player_id=submission.discord_id)
+    
+    # Уведомляем игрока
+    try:
+        dm_log.debug("Поиск пользователя для DM об одобрении")
+        user = bot.get_user(submission.discord_id)
+        if user:
+            screenshot_number = database.get_player_screenshot_number(submission.discord_id, submission_id)
+            embed = discord.Embed(
+                title="🎉 Скриншот одобрен!",
+                description=f"**Отличная работа!** Ваш скриншот #{screenshot_number} успешно прошел модерацию.\n\n"
+                           f"✅ **Статус:** Одобрено\n"
+                           f"📊 **Прогресс:** Скриншот засчитан в вашу статистику\n\n"
+                           f"**Продолжайте в том же духе!**\n\n"
+                           f"{original_link(submission)}",
+                color=config.RASPBERRY_COLOR
+            )
+            image_url, files = image_for_embed(submission)
+            embed.set_image(url=image_url)
+            embed.set_footer(text="Спасибо за участие в ивенте!")
+            await user.send(embed=embed, files=files)
+            dm_log.info("DM об одобрении отправлено")
+        else:
+            dm_log.debug("Пользователя нет в кэше, запрашиваем через fetch_user")
+            # Попробуем найти через fetch_user
+            try:
+                user = await bot.fetch_user(submission.discord_id)
+                screenshot_number = database.get_player_screenshot_number(submission.discord_id, submission_id)
+                embed = discord.Embed(
+                    title="🎉 Скриншот одобрен!",
+                    description=f"**Отличная работа!** Ваш скриншот #{screenshot_number} успешно прошел модерацию.\n\n"
+                               f"✅ **Статус:** Одобрено\n"
+                               f"📊 **Прогресс:** Скриншот засчитан в вашу статистику\n\n"
+                               f"**Продолжайте в том же духе!**\n\n"
+                               f"{original_link(submission)}",
+                    color=config.RASPBERRY_COLOR
+                )
+                image_url, files = image_for_embed(submission)
+                embed.set_image(url=image_url)
+                embed.set_footer(text="Спасибо за участие в ивенте!")
+                await user.send(embed=embed, files=files)
+                dm_log.info("DM об одобрении отправлено", extra={'via_fetch': True})
+            except Exception as fetch_e:
+                dm_failures('user_not_found').inc()
+                dm_log.warning("Не удалось отправить DM пользователю, полученному через fetch_user",
+                               extra={'error': repr(fetch_e)})
+    except discord.Forbidden:
+        dm_failures('forbidden').inc()
+        dm_log.warning("DM не отправлено: закрыты личные сообщения")
+    except discord.HTTPException as e:
+        dm_failures('http').inc()
+        dm_log.warning("DM не отправлено: ошибка HTTP", extra={'error': repr(e)})
+    except Exception:
+        dm_failures('error').inc()
+        dm_log.exception("DM не отправлено: неожиданная ошибка")
+
+async def send_rejection_notification(submission_id: int, reason: str):
+    """Отправляет игроку личное сообщение об отклонении скриншота с указанной причиной."""
+    submission = database.get_submission_by_id(submission_id)
+    bind(submission_id=submission_id, player_id=submission.discord_id)
+    
+    # Уведомляем игрока
+    try:
+        dm_log.debug("Поиск пользователя для DM об отклонении")
+        user = bot.get_user(submission.discord_id)
+        if user:
+            screenshot_number = database.get_player_screenshot_number(submission.discord_id, submission_id)
+            embed = discord.Embed(
+                title="⚠️ Скриншот отклонен",
+                description=f"К сожалению, ваш скриншот #{screenshot_number} не прошел модерацию.\n\n"
+                           f"❌ **Статус:** Отклонено\n"
+                           f"📝 **Причина отклонения:**\n{reason}\n\n"
+                           f"💡 **Что делать:**\n"
+                           f"Изучите причину отклонения и отправьте новый скриншот, учитывая указанные замечания.\n\n"
+                           f"**Удачи в следующих попытках!**\n\n"
+                           f"{original_link(submission)}",
+                color=config.RASPBERRY_COLOR
+            )
+            image_url, files = image_for_embed(submission)
+            embed.set_image(url=image_url)
+            embed.set_footer(text="Не расстраивайтесь! Попробуйте еще раз с учетом замечаний.")
+            await user.send(embed=embed, files=files)
+            dm_log.info("DM об отклонении отправлено")
+        else:
+            dm_log.debug("Пользователя нет в кэше, запрашиваем через fetch_user")
+            # Попробуем найти через fetch_user
+            try:
+                user = await bot.fetch_user(submission.discord_id)
+                screenshot_number = database.get_player_screenshot_number(submission.discord_id, submission_id)
+                embed = discord.Embed(
+                    title="⚠️ Скриншот отклонен",
+                    description=f"К сожалению, ваш скриншот #{screenshot_number} не прошел модерацию.\n\n"
+                               f"❌ **Статус:** Отклонено\n"
+                               f"📝 **Причина отклонения:**\n{reason}\n\n"
+                               f"💡 **Что делать:**\n"
+                               f"Изучите причину отклонения и отправьте новый скриншот, учитывая указанные замечания.\n\n"
+                               f"**Удачи в следующих попытках!**\n\n"
+                               f"{original_link(submission)}",
+                    color=config.RASPBERRY_COLOR
+                )
+                image_url, files = image_for_embed(submission)
+                embed.set_image(url=image_url)
+                embed.set_footer(text="Не расстраивайтесь! Попробуйте еще раз с учетом замечаний.")
+                await user.send(embed=embed, files=files)
+                dm_log.info("DM об отклонении отправлено", extra={'via_fetch': True})
+            except Exception as fetch_e:
+                dm_failures('user_not_found').inc()
+                dm_log.warning("Не удалось отправить DM пользователю, полученному через fetch_user",
+                               extra={'error': repr(fetch_e)})
+    except discord.Forbidden:
+        dm_failures('forbidden').inc()
+        dm_log.warning("DM не отправлено: закрыты личные сообщения")
+    except discord.HTTPException as e:
+        dm_failures('http').inc()
+        dm_log.warning("DM не отправлено: ошибка HTTP", extra={'error': repr(e)})
+    except Exception:
+        dm_failures('error').inc()
+        dm_log.exception("DM не отправлено: неожиданная ошибка")
+
 # Модальное окно для регистрации (discord.py версия)
 class RegistrationModal(discord.ui.Modal):
     def __init__(self):
@@ -73,15 +255,23 @@ class RegistrationModal(discord.ui.Modal):
         )
         self.add_item(self.nickname)
 
+    @metrics.timed('view')
     async def on_submit(self, interaction: discord.Interaction):
         """Обработка отправки формы регистрации."""
+        bind(interaction=interaction)
         await interaction.response.defer(ephemeral=True)
+        guild_id = interaction.guild_id
+        
+        # Регистрация всегда относится к серверу, на котором открыта форма
+        if guild_id is None:
+            await interaction.followup.send("❌ Регистрация доступна только на сервере ивента.", ephemeral=True)
+            return
         
         # Проверяем, активен ли ивент
-        if not is_event_active():
+        if not is_event_active(guild_id):
             embed = discord.Embed(
                 title="❌ Регистрация недоступна",
-                description=f"Ивент не активен.\n\nИвент проходит: {format_event_dates()}",
+                description=f"Ивент не активен.\n\nИвент проходит: {format_event_dates(guild_id)}",
                 color=config.RASPBERRY_COLOR
             )
             await interaction.followup.send(embed=embed, ephemeral=True)
@@ -89,12 +279,14 @@ class RegistrationModal(discord.ui.Modal):
         
         # Пытаемся зарегистрировать игрока
         success = database.register_player(
+            guild_id=guild_id,
             discord_id=interaction.user.id,
             static_id=self.static_id.value.strip(),
             nickname=self.nickname.value.strip()
         )
         
         if success:
+            log.info("Игрок зарегистрирован")
             embed = discord.Embed(
                 title="✅ Регистрация успешна!",
                 description=f"Добро пожаловать на ивент!\n\n"
@@ -115,16 +307,18 @@ class RegistrationModal(discord.ui.Modal):
                                f"• С каждой уникальной локации принимается только один скриншот.\n"
                                f"• Жульничество, передача скриншотов или обман = полная дисквалификация и обнуление всего вашего прогресса.\n\n"
                                f"**Сроки проведения:**\n"
-                               f"Скриншоты принимаются {format_event_dates()}.\n\n"
+                               f"Скриншоты принимаются {format_event_dates(guild_id)}.\n\n"
                                f"**Удачи в поисках!**",
                     color=config.RASPBERRY_COLOR
                 )
                 await interaction.user.send(embed=dm_embed)
-                print(f"✅ Уведомление о регистрации отправлено пользователю {interaction.user}")
+                dm_log.info("DM о регистрации отправлено")
             except discord.Forbidden:
-                print(f"❌ Не удалось отправить DM пользователю {interaction.user.id} - закрыты личные сообщения")
-            except Exception as e:
-                print(f"❌ Ошибка при отправке DM регистрации: {e}")
+                dm_failures('forbidden').inc()
+                dm_log.warning("DM о регистрации не отправлено: закрыты личные сообщения")
+            except Exception:
+                dm_failures('error').inc()
+                dm_log.exception("DM о регистрации не отправлено")
         else:
             embed = discord.Embed(
                 title="❌ Ошибка регистрации",
@@ -140,59 +334,121 @@ class RegistrationView(discord.ui.View):
         super().__init__(timeout=None)
 
     @discord.ui.button(label='Регистрация', style=discord.ButtonStyle.primary, emoji='📝')
+    @metrics.timed('view')
     async def register_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         """Кнопка для начала регистрации."""
         modal = RegistrationModal()
         await interaction.response.send_modal(modal)
 
-# Выпадающий список для выбора скриншотов
+def describe_duplicate(submission: storage.Submission) -> Optional[str]:
+    """Описывает, копией какого скриншота является данный (None, если файл уникален)."""
+    if not submission.duplicate_of:
+        return None
+    
+    original = database.get_submission_by_id(submission.duplicate_of)
+    if not original:
+        return None
+    
+    original_number = database.get_player_screenshot_number(original.discord_id, original.submission_id)
+    if original.discord_id == submission.discord_id:
+        return f"Этот же файл уже отправлен игроком как скриншот #{original_number}."
+    return f"Этот же файл уже отправлен игроком {get_user_tag(original.discord_id)} (скриншот #{original_number})."
+
+def describe_similar(submission: storage.Submission) -> Optional[str]:
+    """Перечисляет похожие скриншоты этого же игрока и других игроков (None, если похожих нет)."""
+    same_player, other_players = perceptual_index.find_similar(submission)
+    lines = []
+    
+    for distance, submission_id in same_player:
+        number = database.get_player_screenshot_number(submission.discord_id, submission_id)
+        lines.append(f"• Этот же игрок, скриншот #{number} (отличие: {distance}/64)")
+    
+    for distance, submission_id, player_id in other_players:
+        number = database.get_player_screenshot_number(player_id, submission_id)
+        lines.append(f"• {get_user_tag(player_id)}, скриншот #{number} (отличие: {distance}/64)")
+    
+    return "\n".join(lines) if lines else None
+
+def describe_moderation_history(submission_id: int) -> Optional[str]:
+    """Последние решения модерации по скриншоту: кто, когда и почему (None, если решений не было)."""
+    history = database.get_moderation_history(submission_id)
+    lines = []
+    
+    for entry in history[-5:]:
+        moderator = get_user_tag(entry.moderator_id) if entry.moderator_id else "неизвестно"
+        if entry.approved is None:
+            decision = "↩️ вернул на модерацию"
+        else:
+            decision = "✅ одобрил" if entry.approved else "❌ отклонил"
+        line = f"• {entry.decided_at:%Y-%m-%d %H:%M} - {moderator} {decision}"
+        if entry.reason:
+            line += f": {entry.reason[:150]}"
+        lines.append(line)
+    
+    return "\n".join(lines) if lines else None
+
+# Выпадающий список для выбора скриншотов одной страницы. Открытый список хранит только ID игрока:
+# скриншот и игрок заново читаются из базы при выборе
 class ScreenshotSelect(discord.ui.Select):
-    def __init__(self, submissions, player_info):
-        self.submissions = submissions
-        self.player_info = player_info
+    def __init__(self, guild_id, discord_id, submissions, page=0):
+        self.guild_id = guild_id
+        self.discord_id = discord_id
         
         options = []
-        for i, submission in enumerate(submissions[:25]):  # Discord ограничивает до 25 опций
-            status_emoji = "✅" if submission.get('is_approved') == 1 else "❌" if submission.get('is_approved') == 0 else "⏳"
-            screenshot_number = database.get_player_screenshot_number(player_info['discord_id'], submission['submission_id'])
+        for submission in submissions[:25]:  # Discord ограничивает до 25 опций
+            status_emoji = "✅" if submission.is_approved == 1 else "❌" if submission.is_approved == 0 else "⏳"
             options.append(discord.SelectOption(
-                label=f"Скриншот #{screenshot_number}",
-                description=f"{status_emoji} Отправлен: {submission['submission_time'][:16]}",
-                value=str(submission['submission_id'])
+                label=f"Скриншот #{submission.seq}",
+                description=f"{status_emoji} Отправлен: {submission.submission_time:%Y-%m-%d %H:%M}",
+                value=str(submission.submission_id)
             ))
         
-        super().__init__(placeholder="Выберите скриншот для модерации...", options=options, min_values=1, max_values=1)
+        super().__init__(placeholder=f"Выберите скриншот для модерации (стр. {page+1})...", options=options,
+                         min_values=1, max_values=1, row=1)
 
+    @metrics.timed('view')
     async def callback(self, interaction: discord.Interaction):
         submission_id = int(self.values[0])
         submission = database.get_submission_by_id(submission_id)
+        player = database.get_player(self.guild_id, self.discord_id)
         
-        if not submission:
+        if not submission or not player:
             await interaction.response.send_message("❌ Скриншот не найден.", ephemeral=True)
             return
         
-        screenshot_number = database.get_player_screenshot_number(self.player_info['discord_id'], submission_id)
-        status_text = "✅ Одобрен" if submission.get('is_approved') == 1 else "❌ Отклонен" if submission.get('is_approved') == 0 else "⏳ На модерации"
+        screenshot_number = database.get_player_screenshot_number(self.discord_id, submission_id)
+        status_text = "✅ Одобрен" if submission.is_approved == 1 else "❌ Отклонен" if submission.is_approved == 0 else "⏳ На модерации"
         
         embed = discord.Embed(
-            title=f"Скриншот #{screenshot_number} - {self.player_info['nickname']}",
-            description=f"**Игрок:** @{get_user_tag(self.player_info['discord_id'])}\n"
-                       f"**StaticID:** {self.player_info['static_id']}\n"
-                       f"**Время отправки:** {submission['submission_time']}\n"
-                       f"**Статус:** {status_text}",
+            title=f"Скриншот #{screenshot_number} - {player.nickname}",
+            description=f"**Игрок:** @{get_user_tag(self.discord_id)}\n"
+                       f"**StaticID:** {player.static_id}\n"
+                       f"**Время отправки:** {submission.submission_time:%Y-%m-%d %H:%M:%S}\n"
+                       f"**Статус:** {status_text}\n"
+                       f"{original_link(submission)}",
             color=config.RASPBERRY_COLOR
         )
-        embed.set_image(url=submission['screenshot_url'])
+        duplicate_text = describe_duplicate(submission)
+        if duplicate_text:
+            embed.add_field(name="⚠️ Точный дубликат", value=duplicate_text, inline=False)
+        similar_text = describe_similar(submission)
+        if similar_text:
+            embed.add_field(name="🔍 Похожие скриншоты", value=similar_text, inline=False)
+        history_text = describe_moderation_history(submission_id)
+        if history_text:
+            embed.add_field(name="📝 История модерации", value=history_text, inline=False)
+        image_url, files = image_for_embed(submission)
+        embed.set_image(url=image_url)
         
-        view = ScreenshotModerationView(submission_id, submission.get('is_approved'))
-        await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
+        view = ScreenshotModerationView(submission_id, submission.is_approved)
+        await interaction.response.send_message(embed=embed, view=view, files=files, ephemeral=True)
 
 # Модальное окно для причины отклонения
 class RejectReasonModal(discord.ui.Modal):
     def __init__(self, submission_id, view):
         super().__init__(title='Причина отклонения')
         self.submission_id = submission_id
-        self.parent_view = view
+        self.parent_view = view  # None, если модальное окно открыто из канала модерации
         
         self.reason = discord.ui.TextInput(
             label='Причина отклонения скриншота',
@@ -203,68 +459,19 @@ class RejectReasonModal(discord.ui.Modal):
         )
         self.add_item(self.reason)
 
+    @metrics.timed('view')
     async def on_submit(self, interaction: discord.Interaction):
-        success = database.reject_screenshot(self.submission_id)
+        bind(interaction=interaction, submission_id=self.submission_id)
+        success = database.reject_screenshot(self.submission_id, interaction.user.id, self.reason.value)
         
         if success:
-            submission = database.get_submission_by_id(self.submission_id)
-            player = database.get_player(submission['discord_id'])
-            
-            # Уведомляем игрока
-            try:
-                print(f"🔍 Поиск пользователя с ID: {submission['discord_id']} для отклонения")
-                user = bot.get_user(submission['discord_id'])
-                if user:
-                    print(f"✅ Пользователь найден: {user.name}")
-                    screenshot_number = database.get_player_screenshot_number(submission['discord_id'], self.submission_id)
-                    embed = discord.Embed(
-                        title="⚠️ Скриншот отклонен",
-                        description=f"К сожалению, ваш скриншот #{screenshot_number} не прошел модерацию.\n\n"
-                                   f"❌ **Статус:** Отклонено\n"
-                                   f"📝 **Причина отклонения:**\n{self.reason.value}\n\n"
-                                   f"💡 **Что делать:**\n"
-                                   f"Изучите причину отклонения и отправьте новый скриншот, учитывая указанные замечания.\n\n"
-                                   f"**Удачи в следующих попытках!**",
-                        color=config.RASPBERRY_COLOR
-                    )
-                    embed.set_image(url=submission['screenshot_url'])
-                    embed.set_footer(text="Не расстраивайтесь! Попробуйте еще раз с учетом замечаний.")
-                    print(f"📨 Отправка DM об отклонении пользователю {user.name}...")
-                    await user.send(embed=embed)
-                    print(f"✅ Уведомление об отклонении отправлено пользователю {user.name}")
-                else:
-                    print(f"❌ Пользователь с ID {submission['discord_id']} не найден через bot.get_user()")
-                    # Попробуем найти через fetch_user
-                    try:
-                        user = await bot.fetch_user(submission['discord_id'])
-                        print(f"✅ Пользователь найден через fetch_user: {user.name}")
-                        screenshot_number = database.get_player_screenshot_number(submission['discord_id'], self.submission_id)
-                        embed = discord.Embed(
-                            title="⚠️ Скриншот отклонен",
-                            description=f"К сожалению, ваш скриншот #{screenshot_number} не прошел модерацию.\n\n"
-                                       f"❌ **Статус:** Отклонено\n"
-                                       f"📝 **Причина отклонения:**\n{self.reason.value}\n\n"
-                                       f"💡 **Что делать:**\n"
-                                       f"Изучите причину отклонения и отправьте новый скриншот, учитывая указанные замечания.\n\n"
-                                       f"**Удачи в следующих попытках!**",
-                            color=config.RASPBERRY_COLOR
-                        )
-                        embed.set_image(url=submission['screenshot_url'])
-                        embed.set_footer(text="Не расстраивайтесь! Попробуйте еще раз с учетом замечаний.")
-                        print(f"📨 Отправка DM об отклонении пользователю {user.name} через fetch_user...")
-                        await user.send(embed=embed)
-                        print(f"✅ Уведомление об отклонении отправлено пользователю {user.name}")
-                    except Exception as fetch_e:
-                        print(f"❌ Не удалось найти пользователя через fetch_user: {fetch_e}")
-            except discord.Forbidden:
-                print(f"❌ Не удалось отправить DM пользователю {submission['discord_id']} - закрыты личные сообщения")
-            except discord.HTTPException as e:
-                print(f"❌ Ошибка HTTP при отправке DM: {e}")
-            except Exception as e:
-                print(f"❌ Неожиданная ошибка при отправке DM: {e}")
+            moderation_log.info("Скриншот отклонен", extra={'reason': self.reason.value})
+            await send_rejection_notification(self.submission_id, self.reason.value)
             
             await interaction.response.send_message("✅ Скриншот отклонен, игрок уведомлен.", ephemeral=True)
-            await self.parent_view.update_parent_stats_if_needed(interaction)
+            if self.parent_view:
+                await self.parent_view.update_parent_stats_if_needed(interaction)
+            await refresh_inbox_card(self.submission_id)
         else:
             await interaction.response.send_message("❌ Ошибка при отклонении скриншота.", ephemeral=True)
 
@@ -284,147 +491,300 @@ class ScreenshotModerationView(discord.ui.View):
             pass
 
     @discord.ui.button(label='✅ Одобрить', style=discord.ButtonStyle.success)
+    @metrics.timed('view')
     async def approve_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        success = database.approve_screenshot(self.submission_id)
+        bind(interaction=interaction, submission_id=self.submission_id)
+        success = database.approve_screenshot(self.submission_id, interaction.user.id)
         
         if success:
-            submission = database.get_submission_by_id(self.submission_id)
-            player = database.get_player(submission['discord_id'])
-            
-            # Уведомляем игрока
-            try:
-                print(f"🔍 Поиск пользователя с ID: {submission['discord_id']}")
-                user = bot.get_user(submission['discord_id'])
-                if user:
-                    print(f"✅ Пользователь найден: {user.name}")
-                    screenshot_number = database.get_player_screenshot_number(submission['discord_id'], self.submission_id)
-                    embed = discord.Embed(
-                        title="🎉 Скриншот одобрен!",
-                        description=f"**Отличная работа!** Ваш скриншот #{screenshot_number} успешно прошел модерацию.\n\n"
-                                   f"✅ **Статус:** Одобрено\n"
-                                   f"📊 **Прогресс:** Скриншот засчитан в вашу статистику\n\n"
-                                   f"**Продолжайте в том же духе!**",
-                        color=config.RASPBERRY_COLOR
-                    )
-                    embed.set_image(url=submission['screenshot_url'])
-                    embed.set_footer(text="Спасибо за участие в ивенте!")
-                    print(f"📨 Отправка DM пользователю {user.name}...")
-                    await user.send(embed=embed)
-                    print(f"✅ Уведомление об одобрении отправлено пользователю {user.name}")
-                else:
-                    print(f"❌ Пользователь с ID {submission['discord_id']} не найден через bot.get_user()")
-                    # Попробуем найти через fetch_user
-                    try:
-                        user = await bot.fetch_user(submission['discord_id'])
-                        print(f"✅ Пользователь найден через fetch_user: {user.name}")
-                        screenshot_number = database.get_player_screenshot_number(submission['discord_id'], self.submission_id)
-                        embed = discord.Embed(
-                            title="🎉 Скриншот одобрен!",
-                            description=f"**Отличная работа!** Ваш скриншот #{screenshot_number} успешно прошел модерацию.\n\n"
-                                       f"✅ **Статус:** Одобрено\n"
-                                       f"📊 **Прогресс:** Скриншот засчитан в вашу статистику\n\n"
-                                       f"**Продолжайте в том же духе!**",
-                            color=config.RASPBERRY_COLOR
-                        )
-                        embed.set_image(url=submission['screenshot_url'])
-                        embed.set_footer(text="Спасибо за участие в ивенте!")
-                        print(f"📨 Отправка DM пользователю {user.name} через fetch_user...")
-                        await user.send(embed=embed)
-                        print(f"✅ Уведомление об одобрении отправлено пользователю {user.name}")
-                    except Exception as fetch_e:
-                        print(f"❌ Не удалось найти пользователя через fetch_user: {fetch_e}")
-            except discord.Forbidden:
-                print(f"❌ Не удалось отправить DM пользователю {submission['discord_id']} - закрыты личные сообщения")
-            except discord.HTTPException as e:
-                print(f"❌ Ошибка HTTP при отправке DM: {e}")
-            except Exception as e:
-                print(f"❌ Неожиданная ошибка при отправке DM: {e}")
+            moderation_log.info("Скриншот одобрен")
+            await send_approval_notification(self.submission_id)
             
             await interaction.response.send_message("✅ Скриншот одобрен, игрок уведомлен.", ephemeral=True)
             await self.update_parent_stats_if_needed(interaction)
+            await refresh_inbox_card(self.submission_id)
         else:
             await interaction.response.send_message("❌ Ошибка при одобрении скриншота.", ephemeral=True)
 
     @discord.ui.button(label='❌ Отклонить', style=discord.ButtonStyle.danger)
+    @metrics.timed('view')
     async def reject_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         modal = RejectReasonModal(self.submission_id, self)
         await interaction.response.send_modal(modal)
 
-# Выпадающий список игроков с пагинацией
+# Постоянные кнопки карточек канала модерации (работают и после перезапуска бота)
+class InboxApproveButton(discord.ui.DynamicItem[discord.ui.Button], template=r'inbox:approve:(?P<id>[0-9]+)'):
+    def __init__(self, submission_id: int, row: Optional[int] = None):
+        super().__init__(discord.ui.Button(
+            label=f'✅ {submission_id}',
+            style=discord.ButtonStyle.success,
+            custom_id=f'inbox:approve:{submission_id}',
+            row=row
+        ))
+        self.submission_id = submission_id
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(int(match['id']))
+
+    @metrics.timed('view')
+    async def callback(self, interaction: discord.Interaction):
+        bind(interaction=interaction, submission_id=self.submission_id)
+        if not await has_admin_permissions(interaction):
+            await interaction.response.send_message("❌ У вас нет прав для модерации скриншотов.", ephemeral=True)
+            return
+        
+        submission = database.get_submission_by_id(self.submission_id)
+        if not submission or submission.is_approved is not None:
+            await interaction.response.send_message("ℹ️ Этот скриншот уже прошел модерацию.", ephemeral=True)
+            await refresh_inbox_card(self.submission_id)
+            return
+        
+        if not database.approve_screenshot(self.submission_id, interaction.user.id):
+            await interaction.response.send_message("❌ Ошибка при одобрении скриншота.", ephemeral=True)
+            return
+        moderation_log.info("Скриншот одобрен", extra={'source': 'inbox'})
+        
+        # Карточка обновляется прямо ответом на нажатие кнопки; если канал модерации
+        # успели отключить или сменить, модератор получает обычное подтверждение
+        inbox = get_inbox(submission.guild_id)
+        if inbox:
+            embeds, files, view = inbox.render_message(self.submission_id)
+            await interaction.response.edit_message(embeds=embeds, attachments=files, view=view)
+        else:
+            await interaction.response.send_message("✅ Скриншот одобрен, игрок уведомлен.", ephemeral=True)
+        await send_approval_notification(self.submission_id)
+
+class InboxRejectButton(discord.ui.DynamicItem[discord.ui.Button], template=r'inbox:reject:(?P<id>[0-9]+)'):
+    def __init__(self, submission_id: int, row: Optional[int] = None):
+        super().__init__(discord.ui.Button(
+            label=f'❌ {submission_id}',
+            style=discord.ButtonStyle.danger,
+            custom_id=f'inbox:reject:{submission_id}',
+            row=row
+        ))
+        self.submission_id = submission_id
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(int(match['id']))
+
+    @metrics.timed('view')
+    async def callback(self, interaction: discord.Interaction):
+        bind(interaction=interaction, submission_id=self.submission_id)
+        if not await has_admin_permissions(interaction):
+            await interaction.response.send_message("❌ У вас нет прав для модерации скриншотов.", ephemeral=True)
+            return
+        
+        submission = database.get_submission_by_id(self.submission_id)
+        if not submission or submission.is_approved is not None:
+            await interaction.response.send_message("ℹ️ Этот скриншот уже прошел модерацию.", ephemeral=True)
+            await refresh_inbox_card(self.submission_id)
+            return
+        
+        await interaction.response.send_modal(RejectReasonModal(self.submission_id, None))
+
+def build_inbox_view(submissions) -> discord.ui.View:
+    """Создает вид с кнопками для карточек, которые еще ждут модерации (по две карточки в ряд)."""
+    view = discord.ui.View(timeout=None)
+    pending = [s for s in submissions if s.is_approved is None]
+    for i, submission in enumerate(pending):
+        view.add_item(InboxApproveButton(submission.submission_id, row=i // 2))
+        view.add_item(InboxRejectButton(submission.submission_id, row=i // 2))
+    return view
+
+# Каналы модерации серверов: guild_id -> ModerationInbox (только для серверов с настроенным каналом)
+inboxes: Dict[int, ModerationInbox] = {}
+
+metrics.gauge(
+    "moderation_inbox_queue_depth", "Скриншоты, ожидающие публикации в канале модерации",
+    lambda: [({'guild_id': guild_id}, inbox.queue.qsize()) for guild_id, inbox in inboxes.items()]
+)
+metrics.gauge(
+    "background_tasks", "Незавершенные фоновые задачи обработки скриншотов",
+    lambda: [
+        ({'kind': 'archive_download'}, screenshot_archive.in_flight),
+        ({'kind': 'thumbnail'}, preview_cache.pending),
+        ({'kind': 'phash'}, perceptual_index.pending),
+        ({'kind': 'event_archive'}, event_archiver.pending),
+    ]
+)
+
+def get_inbox(guild_id: int) -> Optional[ModerationInbox]:
+    """Возвращает канал модерации сервера, создавая и запуская его при первом обращении."""
+    channel_id = get_guild_settings(guild_id)['moderation_channel_id']
+    inbox = inboxes.get(guild_id)
+    
+    if inbox and inbox.channel_id != channel_id:
+        inbox.stop()
+        inbox = None
+    
+    if inbox is None and channel_id:
+        inbox = ModerationInbox(bot, guild_id, channel_id, build_inbox_view)
+        inbox.start()
+        inboxes[guild_id] = inbox
+    
+    return inbox
+
+async def refresh_inbox_card(submission_id: int):
+    """Обновляет карточку скриншота в канале модерации, если он включен."""
+    submission = database.get_submission_by_id(submission_id)
+    inbox = get_inbox(submission.guild_id) if submission else None
+    if inbox:
+        await inbox.refresh(submission_id)
+
+# Выпадающий список игроков с пагинацией (данные игроков страницы читаются при ее показе)
 class PlayerSelect(discord.ui.Select):
-    def __init__(self, players_data, page=0):
-        self.players_data = players_data
+    def __init__(self, guild_id, discord_ids, page=0):
+        self.guild_id = guild_id
         self.page = page
         self.per_page = 25
         
         start_idx = page * self.per_page
         end_idx = start_idx + self.per_page
-        current_players = players_data[start_idx:end_idx]
         
         options = []
-        for player in current_players:
-            discord_id, nickname, total_screenshots, approved_count = player
+        for discord_id in discord_ids[start_idx:end_idx]:
+            player = database.get_player(guild_id, discord_id)
+            nickname = player.nickname if player else "—"
             user_tag = get_user_tag(discord_id)
             
             # Получаем реальную статистику для каждого игрока
-            submissions = database.get_player_submissions(discord_id)
-            approved_count_real = sum(1 for s in submissions if s.get('is_approved') == 1)
-            rejected_count_real = sum(1 for s in submissions if s.get('is_approved') == 0)
-            pending_count_real = sum(1 for s in submissions if s.get('is_approved') is None)
+            counts = database.get_player_submission_counts(guild_id, discord_id)
             
             options.append(discord.SelectOption(
                 label=f"{user_tag} - {nickname}",
-                description=f"✅{approved_count_real} ❌{rejected_count_real} ⏳{pending_count_real}",
+                description=f"✅{counts['approved']} ❌{counts['rejected']} ⏳{counts['pending']}",
                 value=str(discord_id)
             ))
         
         super().__init__(placeholder=f"Выберите игрока (стр. {page+1})...", options=options, min_values=1, max_values=1)
 
+    @metrics.timed('view')
     async def callback(self, interaction: discord.Interaction):
         discord_id = int(self.values[0])
-        player = database.get_player(discord_id)
-        submissions = database.get_player_submissions(discord_id)
+        player = database.get_player(self.guild_id, discord_id)
         
         if not player:
             await interaction.response.send_message("❌ Игрок не найден.", ephemeral=True)
             return
         
-        user_tag = get_user_tag(discord_id)
-        approved_count = sum(1 for s in submissions if s.get('is_approved') == 1)
-        rejected_count = sum(1 for s in submissions if s.get('is_approved') == 0)
-        pending_count = sum(1 for s in submissions if s.get('is_approved') is None)
-        
-        embed = discord.Embed(
-            title=f"Профиль игрока: {player['nickname']}",
-            description=f"**Discord:** {user_tag}\n"
-                       f"**StaticID:** {player['static_id']}\n"
-                       f"**Дата регистрации:** {player['registration_time'][:16]}\n\n"
-                       f"**Статистика скриншотов:**\n"
-                       f"✅ Одобрено: {approved_count}\n"
-                       f"❌ Отклонено: {rejected_count}\n"
-                       f"⏳ На модерации: {pending_count}\n"
-                       f"📊 Всего: {len(submissions)}",
-            color=config.RASPBERRY_COLOR
-        )
+        counts = database.get_player_submission_counts(self.guild_id, discord_id)
+        embed = player_profile_embed(player, counts)
         
-        view = PlayerProfileView(submissions, player)
+        view = PlayerProfileView(self.guild_id, discord_id)
         await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
 
-# Вид профиля игрока
+def player_profile_embed(player: storage.Player, counts: Dict[str, int]) -> discord.Embed:
+    """Профиль игрока со статистикой скриншотов по статусам."""
+    return discord.Embed(
+        title=f"Профиль игрока: {player.nickname}",
+        description=f"**Discord:** {get_user_tag(player.discord_id)}\n"
+                   f"**StaticID:** {player.static_id}\n"
+                   f"**Дата регистрации:** {player.registration_time:%Y-%m-%d %H:%M}\n\n"
+                   f"**Статистика скриншотов:**\n"
+                   f"✅ Одобрено: {counts['approved']}\n"
+                   f"❌ Отклонено: {counts['rejected']}\n"
+                   f"⏳ На модерации: {counts['pending']}\n"
+                   f"📊 Всего: {sum(counts.values())}",
+        color=config.RASPBERRY_COLOR
+    )
+
+# Отбор скриншотов в профиле игрока по статусу
+class ScreenshotStatusSelect(discord.ui.Select):
+    LABELS = {'all': "Все скриншоты", 'pending': "⏳ На модерации", 'approved': "✅ Одобренные",
+              'rejected': "❌ Отклоненные"}
+    
+    def __init__(self, status):
+        options = [
+            discord.SelectOption(label=label, value=value, default=(value == (status or 'all')))
+            for value, label in self.LABELS.items()
+        ]
+        super().__init__(placeholder="Статус скриншотов", options=options, min_values=1, max_values=1, row=0)
+
+    @metrics.timed('view')
+    async def callback(self, interaction: discord.Interaction):
+        await self.view.show_status(interaction, None if self.values[0] == 'all' else self.values[0])
+
+# Вид профиля игрока: скриншоты листаются страницами по 25, страница читается из базы
+# при показе. Хранятся только ID игрока, отбор по статусу и начала открытых страниц (seq)
 class PlayerProfileView(discord.ui.View):
-    def __init__(self, submissions, player_info):
+    PER_PAGE = 25
+    
+    def __init__(self, guild_id, discord_id, status=None):
         super().__init__(timeout=300)
-        self.add_item(ScreenshotSelect(submissions, player_info))
+        self.guild_id = guild_id
+        self.discord_id = discord_id
+        self.status = status
+        self.page_starts = [None]  # before_seq открытых страниц: последняя - текущая
+        self.load_page()
+
+    def load_page(self):
+        """Читает текущую страницу (и признак следующей) и пересобирает элементы вида."""
+        submissions = database.get_player_submissions_page(
+            self.guild_id, self.discord_id, self.status, self.page_starts[-1], self.PER_PAGE + 1
+        )
+        has_next = len(submissions) > self.PER_PAGE
+        submissions = submissions[:self.PER_PAGE]
+        self.next_start = submissions[-1].seq if has_next else None
+        
+        self.clear_items()
+        self.add_item(ScreenshotStatusSelect(self.status))
+        if submissions:
+            self.add_item(ScreenshotSelect(self.guild_id, self.discord_id, submissions, len(self.page_starts) - 1))
+        
+        if len(self.page_starts) > 1 or has_next:
+            prev_button = discord.ui.Button(
+                label='◀️ Новее',
+                style=discord.ButtonStyle.secondary,
+                disabled=(len(self.page_starts) == 1),
+                row=2
+            )
+            prev_button.callback = self.prev_page
+            self.add_item(prev_button)
+            
+            next_button = discord.ui.Button(
+                label='Старше ▶️',
+                style=discord.ButtonStyle.secondary,
+                disabled=not has_next,
+                row=2
+            )
+            next_button.callback = self.next_page
+            self.add_item(next_button)
+
+    async def show_status(self, interaction: discord.Interaction, status):
+        """Переключает отбор по статусу и возвращается к самым новым скриншотам."""
+        self.status = status
+        self.page_starts = [None]
+        self.load_page()
+        await interaction.response.edit_message(view=self)
+
+    @metrics.timed('view')
+    async def prev_page(self, interaction: discord.Interaction):
+        """Переход к более новым скриншотам"""
+        if len(self.page_starts) > 1:
+            self.page_starts.pop()
+        self.load_page()
+        await interaction.response.edit_message(view=self)
+
+    @metrics.timed('view')
+    async def next_page(self, interaction: discord.Interaction):
+        """Переход к более старым скриншотам"""
+        if self.next_start is not None:
+            self.page_starts.append(self.next_start)
+        self.load_page()
+        await interaction.response.edit_message(view=self)
 
-# Основной вид со списком игроков
+# Основной вид со списком игроков: хранит только ID игроков в порядке лидерборда
 class PlayerListView(discord.ui.View):
-    def __init__(self, players_data):
+    def __init__(self, guild_id, discord_ids):
         super().__init__(timeout=300)
-        self.players_data = players_data
+        self.guild_id = guild_id
+        self.discord_ids = discord_ids
         self.current_page = 0
-        self.max_page = (len(players_data) - 1) // 25
+        self.max_page = (len(discord_ids) - 1) // 25
         
-        self.add_item(PlayerSelect(players_data, self.current_page))
+        self.add_item(PlayerSelect(guild_id, discord_ids, self.current_page))
         self.update_navigation_buttons()
 
     def update_navigation_buttons(self):
@@ -452,12 +812,14 @@ class PlayerListView(discord.ui.View):
             next_button.callback = self.next_page
             self.add_item(next_button)
 
+    @metrics.timed('view')
     async def prev_page(self, interaction: discord.Interaction):
         """Переход на предыдущую страницу"""
         if self.current_page > 0:
             self.current_page -= 1
             await self.update_page(interaction)
 
+    @metrics.timed('view')
     async def next_page(self, interaction: discord.Interaction):
         """Переход на следующую страницу"""
         if self.current_page < self.max_page:
@@ -471,37 +833,71 @@ class PlayerListView(discord.ui.View):
             if isinstance(item, PlayerSelect):
                 self.remove_item(item)
         
-        self.add_item(PlayerSelect(self.players_data, self.current_page))
+        self.add_item(PlayerSelect(self.guild_id, self.discord_ids, self.current_page))
         self.update_navigation_buttons()
         
         await interaction.response.edit_message(view=self)
 
+def storage_in_files() -> bool:
+    """Данные в файлах SQLite: только для них работают архивация ивентов, резервные копии и репликация."""
+    return isinstance(database.current_storage, database.SQLiteStorage)
+
 @bot.event
 async def on_ready():
     """Событие готовности бота."""
-    print(f"{bot.user} подключен к Discord!")
+    global metrics_server
+    log.info("Бот подключен к Discord", extra={'bot_user': str(bot.user)})
     database.setup_database()
-    print("База данных инициализирована.")
+    log.info("База данных инициализирована", extra={'path': database.DATABASE_NAME, 'storage': config.STORAGE_ENGINE})
+    
+    # Файлы прошлых ивентов, архивация которых не завершилась до перезапуска
+    if storage_in_files():
+        for path in unarchived_event_files():
+            event_archiver.schedule(path)
+    
+    loop_watchdog.start()
+    if config.BACKUP_INTERVAL_SECONDS and storage_in_files():
+        backup_scheduler.start()
+    if config.REPLICA_DIR and storage_in_files():
+        replicator.start()
+    if metrics_server is None and config.METRICS_PORT:
+        try:
+            metrics_server = await metrics.start_http_server(config.METRICS_HOST, config.METRICS_PORT)
+        except OSError as e:
+            log.error("Не удалось запустить endpoint метрик", extra={'error': repr(e)})
+    
+    log.info("Серверы и шарды", extra={'guilds': len(bot.guilds), 'shards': bot.shard_count})
+    
+    bot.add_dynamic_items(InboxApproveButton, InboxRejectButton)
+    for guild in bot.guilds:
+        if get_inbox(guild.id):
+            log.info("Канал модерации сервера", extra={'guild_id': guild.id, 'channel_id': inboxes[guild.id].channel_id})
     
     # Синхронизируем слэш-команды с Discord
     try:
-        if config.GUILD_ID:
-            guild = discord.Object(id=config.GUILD_ID)
-            bot.tree.copy_global_to(guild=guild)
-            await bot.tree.sync(guild=guild)
-            print(f"Команды синхронизированы для сервера {config.GUILD_ID}")
+        if config.GUILD_IDS:
+            for guild_id in config.GUILD_IDS:
+                guild = discord.Object(id=guild_id)
+                bot.tree.copy_global_to(guild=guild)
+                await bot.tree.sync(guild=guild)
+                log.info("Команды синхронизированы для сервера", extra={'guild_id': guild_id})
         else:
             await bot.tree.sync()
-            print("Команды синхронизированы глобально")
-    except Exception as e:
-        print(f"Ошибка синхронизации команд: {e}")
+            log.info("Команды синхронизированы глобально")
+    except Exception:
+        log.exception("Ошибка синхронизации команд")
 
 @bot.tree.command(name="start", description="Начать регистрацию на ивент")
+@metrics.timed('command', name='start')
 async def start_registration(interaction: discord.Interaction):
     """Команда для начала регистрации на ивент."""
+    if interaction.guild_id is None:
+        await interaction.response.send_message("❌ Используйте эту команду на сервере ивента.", ephemeral=True)
+        return
+    
     embed = discord.Embed(
         title="🎮 Добро пожаловать на ивент!",
-        description=f"**Период проведения:** {format_event_dates()}\n\n"
+        description=f"**Период проведения:** {format_event_dates(interaction.guild_id)}\n\n"
                    f"Для участия в ивенте нажмите кнопку ниже и заполните форму регистрации.",
         color=config.RASPBERRY_COLOR
     )
@@ -510,8 +906,10 @@ async def start_registration(interaction: discord.Interaction):
     await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
 
 @bot.tree.command(name="test_dm", description="Тест отправки личного сообщения")
+@metrics.timed('command', name='test_dm')
 async def test_dm(interaction: discord.Interaction):
     """Тестовая команда для проверки отправки DM."""
+    bind(interaction=interaction)
     try:
         embed = discord.Embed(
             title="🧪 Тест личного сообщения",
@@ -520,18 +918,30 @@ async def test_dm(interaction: discord.Interaction):
         )
         await interaction.user.send(embed=embed)
         await interaction.response.send_message("✅ Тестовое сообщение отправлено в ваши личные сообщения!", ephemeral=True)
-        print(f"✅ Тестовое DM отправлено пользователю {interaction.user}")
+        dm_log.info("Тестовое DM отправлено")
     except discord.Forbidden:
         await interaction.response.send_message("❌ Не удалось отправить личное сообщение. У вас закрыты DM от участников сервера.", ephemeral=True)
-        print(f"❌ DM заблокированы для пользователя {interaction.user.id}")
+        dm_log.warning("Тестовое DM не отправлено: закрыты личные сообщения")
     except discord.HTTPException as e:
         await interaction.response.send_message(f"❌ Ошибка HTTP при отправке сообщения: {e}", ephemeral=True)
-        print(f"❌ Ошибка HTTP при отправке DM: {e}")
+        dm_log.warning("Тестовое DM не отправлено: ошибка HTTP", extra={'error': repr(e)})
     except Exception as e:
         await interaction.response.send_message(f"❌ Неожиданная ошибка: {e}", ephemeral=True)
-        print(f"❌ Неожиданная ошибка при отправке DM: {e}")
+        dm_log.exception("Тестовое DM не отправлено: неожиданная ошибка")
+
+def resolve_player_guild(discord_id: int) -> Optional[int]:
+    """
+    Определяет сервер, к ивенту которого относится личное сообщение игрока.
+    Предпочитается сервер с активным ивентом, при нескольких - с последней регистрацией.
+    """
+    guild_ids = database.get_player_guilds(discord_id)
+    for guild_id in guild_ids:
+        if is_event_active(guild_id):
+            return guild_id
+    return guild_ids[0] if guild_ids else None
 
 @bot.event
+@metrics.timed('event')
 async def on_message(message):
     """Обработка сообщений в личных сообщениях (прием скриншотов)."""
     # Игнорируем сообщения от ботов
@@ -543,8 +953,12 @@ async def on_message(message):
         await bot.process_commands(message)
         return
     
+    # Определяем сервер, к ивенту которого относится скриншот
+    guild_id = resolve_player_guild(message.author.id)
+    bind(user_id=message.author.id, message_id=message.id, guild_id=guild_id)
+    
     # Проверяем, зарегистрирован ли игрок
-    player = database.get_player(message.author.id)
+    player = database.get_player(guild_id, message.author.id) if guild_id else None
     if not player:
         embed = discord.Embed(
             title="❌ Не зарегистрирован",
@@ -555,7 +969,7 @@ async def on_message(message):
         return
     
     # Проверяем, не дисквалифицирован ли игрок
-    if database.is_player_disqualified(message.author.id):
+    if player.is_disqualified:
         embed = discord.Embed(
             title="❌ Дисквалификация",
             description="Вы дисквалифицированы и не можете отправлять скриншоты.",
@@ -565,10 +979,10 @@ async def on_message(message):
         return
     
     # Проверяем, активен ли ивент
-    if not is_event_active():
+    if not is_event_active(guild_id):
         embed = discord.Embed(
             title="❌ Ивент неактивен",
-            description=f"Ивент не активен в данный момент.\n\nИвент проходит: {format_event_dates()}",
+            description=f"Ивент не активен в данный момент.\n\nИвент проходит: {format_event_dates(guild_id)}",
             color=config.RASPBERRY_COLOR
         )
         await message.channel.send(embed=embed)
@@ -597,21 +1011,50 @@ async def on_message(message):
         await message.channel.send(embed=embed)
         return
     
+    # Сохраняем файл в локальный архив и проверяем, что это действительно изображение
+    archived = None
+    if attachment.size <= config.ARCHIVE_MAX_FILE_SIZE:
+        try:
+            archived = await screenshot_archive.archive(attachment.url)
+            if archived is None:
+                embed = discord.Embed(
+                    title="❌ Неверный формат",
+                    description="Файл не является изображением. Пожалуйста, отправьте изображение (PNG, JPG, JPEG, GIF, WEBP).",
+                    color=config.RASPBERRY_COLOR
+                )
+                await message.channel.send(embed=embed)
+                return
+        except Exception as e:
+            # Скриншот все равно принимаем - модераторы увидят его по ссылке Discord
+            ingest_log.warning("Не удалось сохранить скриншот в архив",
+                               extra={'url': attachment.url, 'error': repr(e)})
+    
     # Сохраняем скриншот в базу данных
-    success = database.add_submission(player['discord_id'], attachment.url)
+    submission_id = database.add_submission(
+        guild_id, player.discord_id, attachment.url,
+        file_sha256=archived['sha256'] if archived else None
+    )
     
-    if success:
-        submissions_count = len(database.get_player_submissions(message.author.id))
+    if submission_id:
+        bind(submission_id=submission_id)
+        ingest_log.info("Скриншот принят", extra={'sha256': archived['sha256'] if archived else None})
+        if archived:
+            preview_cache.schedule(archived['sha256'], archived['path'])
+            perceptual_index.schedule(submission_id, guild_id, player.discord_id, archived)
+        inbox = get_inbox(guild_id)
+        if inbox:
+            inbox.submit(submission_id)
+        screenshot_number = database.get_player_screenshot_number(message.author.id, submission_id)
         embed = discord.Embed(
             title="✅ Скриншот принят на модерацию!",
-            description=f"**Скриншот #{submissions_count}** успешно получен и отправлен на проверку.\n\n"
+            description=f"**Скриншот #{screenshot_number}** успешно получен и отправлен на проверку.\n\n"
                        f"📋 **Статус:** На модерации ⏳\n"
                        f"🔔 **Уведомления:** Вы получите сообщение о результатах проверки\n\n"
                        f"**Спасибо за участие в ивенте!**",
             color=config.RASPBERRY_COLOR
         )
         embed.set_image(url=attachment.url)
-        embed.set_footer(text=f"Игрок: {player['nickname']} | StaticID: {player['static_id']}")
+        embed.set_footer(text=f"Игрок: {player.nickname} | StaticID: {player.static_id}")
     else:
         embed = discord.Embed(
             title="❌ Ошибка при сохранении",
@@ -658,6 +1101,7 @@ async def has_admin_permissions(interaction: discord.Interaction) -> bool:
     return False
 
 @bot.tree.command(name="admin_stats", description="Получить статистику ивента (только для админов)")
+@metrics.timed('command', name='admin_stats')
 async def admin_stats(interaction: discord.Interaction):
     """Команда для получения статистики ивента."""
     # Диагностическая информация
@@ -684,9 +1128,8 @@ async def admin_stats(interaction: discord.Interaction):
     await interaction.response.defer(ephemeral=True)
     
     # Получаем статистику
-    total_players = database.get_all_players_stats()
-    approved_stats = database.get_approved_screenshots_stats()
-    leaderboard = database.get_leaderboard_by_approved()
+    total_players = database.get_all_players_stats(interaction.guild_id)
+    leaderboard = database.get_leaderboard_by_approved(interaction.guild_id)
     
     # Формируем топ-5 игроков
     top_players_text = ""
@@ -700,20 +1143,21 @@ async def admin_stats(interaction: discord.Interaction):
     embed = discord.Embed(
         title="📊 Статистика ивента",
         description=f"**Всего участников:** {total_players}\n"
-                   f"**Период ивента:** {format_event_dates()}\n"
-                   f"**Статус:** {'🟢 Активен' if is_event_active() else '🔴 Неактивен'}\n\n"
+                   f"**Период ивента:** {format_event_dates(interaction.guild_id)}\n"
+                   f"**Статус:** {'🟢 Активен' if is_event_active(interaction.guild_id) else '🔴 Неактивен'}\n\n"
                    f"**Топ-5 игроков:**\n{top_players_text}",
         color=config.RASPBERRY_COLOR
     )
     
     # Добавляем выпадающий список только если есть игроки
     if leaderboard:
-        view = PlayerListView(leaderboard)
+        view = PlayerListView(interaction.guild_id, [row[0] for row in leaderboard])
         await interaction.followup.send(embed=embed, view=view, ephemeral=True)
     else:
         await interaction.followup.send(embed=embed, ephemeral=True)
 
 @bot.tree.command(name="admin_profile", description="Просмотреть профиль игрока (только для админов)")
+@metrics.timed('command', name='admin_profile')
 async def admin_profile(interaction: discord.Interaction, user: discord.Member):
     """Команда для просмотра профиля игрока."""
     if not await has_admin_permissions(interaction):
@@ -722,38 +1166,22 @@ async def admin_profile(interaction: discord.Interaction, user: discord.Member):
     
     await interaction.response.defer(ephemeral=True)
     
-    player = database.get_player(user.id)
+    player = database.get_player(interaction.guild_id, user.id)
     if not player:
         await interaction.followup.send("❌ Пользователь не зарегистрирован на ивент.", ephemeral=True)
         return
     
-    submissions = database.get_player_submissions(user.id)
-    user_tag = get_user_tag(user.id)
+    counts = database.get_player_submission_counts(interaction.guild_id, user.id)
+    embed = player_profile_embed(player, counts)
     
-    approved_count = sum(1 for s in submissions if s.get('is_approved') == 1)
-    rejected_count = sum(1 for s in submissions if s.get('is_approved') == 0)
-    pending_count = sum(1 for s in submissions if s.get('is_approved') is None)
-    
-    embed = discord.Embed(
-        title=f"Профиль игрока: {player['nickname']}",
-        description=f"**Discord:** {user_tag}\n"
-                   f"**StaticID:** {player['static_id']}\n"
-                   f"**Дата регистрации:** {player['registration_time'][:16]}\n\n"
-                   f"**Статистика скриншотов:**\n"
-                   f"✅ Одобрено: {approved_count}\n"
-                   f"❌ Отклонено: {rejected_count}\n"
-                   f"⏳ На модерации: {pending_count}\n"
-                   f"📊 Всего: {len(submissions)}",
-        color=config.RASPBERRY_COLOR
-    )
-    
-    if submissions:
-        view = PlayerProfileView(submissions, player)
+    if any(counts.values()):
+        view = PlayerProfileView(interaction.guild_id, user.id)
         await interaction.followup.send(embed=embed, view=view, ephemeral=True)
     else:
         await interaction.followup.send(embed=embed, ephemeral=True)
 
 @bot.tree.command(name="admin_disqualify", description="Дисквалификация/восстановление игрока (только для админов)")
+@metrics.timed('command', name='admin_disqualify')
 async def admin_disqualify(interaction: discord.Interaction, user: discord.Member, action: str):
     """Команда для дисквалификации/снятия дисквалификации игрока."""
     if not await has_admin_permissions(interaction):
@@ -764,23 +1192,25 @@ async def admin_disqualify(interaction: discord.Interaction, user: discord.Membe
         await interaction.response.send_message("❌ Неверное действие. Используйте 'disqualify' или 'cancel'.", ephemeral=True)
         return
     
-    player = database.get_player(user.id)
+    bind(interaction=interaction, player_id=user.id)
+    player = database.get_player(interaction.guild_id, user.id)
     if not player:
         await interaction.response.send_message("❌ Пользователь не зарегистрирован на ивент.", ephemeral=True)
         return
     
     if action == "disqualify":
-        success = database.disqualify_player(user.id)
+        success = database.disqualify_player(interaction.guild_id, user.id)
         action_text = "дисквалифицирован"
         notification_title = "❌ Вы дисквалифицированы"
         notification_desc = "Вы были дисквалифицированы с ивента. Ваши скриншоты больше не засчитываются."
     else:
-        success = database.cancel_disqualification(user.id)
+        success = database.cancel_disqualification(interaction.guild_id, user.id)
         action_text = "восстановлен"
         notification_title = "✅ Дисквалификация снята"
         notification_desc = "Ваша дисквалификация была снята. Вы можете продолжить участие в ивенте."
     
     if success:
+        moderation_log.info("Статус дисквалификации изменен", extra={'action': action})
         # Уведомляем игрока
         try:
             embed_notification = discord.Embed(
@@ -789,19 +1219,70 @@ async def admin_disqualify(interaction: discord.Interaction, user: discord.Membe
                 color=config.RASPBERRY_COLOR
             )
             await user.send(embed=embed_notification)
-            print(f"✅ Уведомление о {action_text} отправлено пользователю {user}")
+            dm_log.info("DM о дисквалификации отправлено", extra={'action': action})
         except discord.Forbidden:
-            print(f"❌ Не удалось отправить DM пользователю {user.id} - закрыты личные сообщения")
+            dm_failures('forbidden').inc()
+            dm_log.warning("DM о дисквалификации не отправлено: закрыты личные сообщения")
         except discord.HTTPException as e:
-            print(f"❌ Ошибка HTTP при отправке DM: {e}")
-        except Exception as e:
-            print(f"❌ Неожиданная ошибка при отправке DM: {e}")
+            dm_failures('http').inc()
+            dm_log.warning("DM о дисквалификации не отправлено: ошибка HTTP", extra={'error': repr(e)})
+        except Exception:
+            dm_failures('error').inc()
+            dm_log.exception("DM о дисквалификации не отправлено: неожиданная ошибка")
         
         await interaction.response.send_message(f"✅ Игрок {user.mention} {action_text}.", ephemeral=True)
     else:
         await interaction.response.send_message("❌ Ошибка при выполнении операции.", ephemeral=True)
 
+@bot.tree.command(name="admin_event_settings", description="Настройки ивента этого сервера (только для админов)")
+@app_commands.describe(
+    start="Начало ивента в формате ISO 8601, например 2025-07-10T18:00:00+03:00",
+    end="Конец ивента в формате ISO 8601",
+    channel="Канал модерации для карточек новых скриншотов"
+)
+@metrics.timed('command', name='admin_event_settings')
+async def admin_event_settings(interaction: discord.Interaction, start: Optional[str] = None,
+                               end: Optional[str] = None, channel: Optional[discord.TextChannel] = None):
+    """Команда для изменения расписания ивента и канала модерации сервера."""
+    if not await has_admin_permissions(interaction):
+        await interaction.response.send_message("❌ У вас нет прав для использования этой команды.", ephemeral=True)
+        return
+    
+    for value in (start, end):
+        if value:
+            try:
+                datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+            except ValueError:
+                await interaction.response.send_message(f"❌ Неверный формат даты: `{value}`", ephemeral=True)
+                return
+    
+    success = database.update_guild_settings(
+        interaction.guild_id,
+        event_start_time=start,
+        event_end_time=end,
+        moderation_channel_id=channel.id if channel else None
+    )
+    if not success:
+        await interaction.response.send_message("❌ Ошибка при сохранении настроек.", ephemeral=True)
+        return
+    
+    # Сбрасываем кэш только этого сервера; канал модерации пересоздается при необходимости
+    guild_settings_cache.pop(interaction.guild_id, None)
+    settings = get_guild_settings(interaction.guild_id)
+    get_inbox(interaction.guild_id)
+    
+    channel_text = f"<#{settings['moderation_channel_id']}>" if settings['moderation_channel_id'] else "не задан"
+    embed = discord.Embed(
+        title="⚙️ Настройки ивента",
+        description=f"**Период ивента:** {format_event_dates(interaction.guild_id)}\n"
+                   f"**Статус:** {'🟢 Активен' if is_event_active(interaction.guild_id) else '🔴 Неактивен'}\n"
+                   f"**Канал модерации:** {channel_text}",
+        color=config.RASPBERRY_COLOR
+    )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
 @bot.tree.command(name="calculate_payments", description="Расчет выплат игрокам (только для админов)")
+@metrics.timed('command', name='calculate_payments')
 async def calculate_payments(interaction: discord.Interaction):
     """Команда для расчета выплат."""
     if not await has_admin_permissions(interaction):
@@ -810,7 +1291,7 @@ async def calculate_payments(interaction: discord.Interaction):
     
     await interaction.response.defer(ephemeral=True)
     
-    approved_stats = database.get_approved_screenshots_stats()
+    approved_stats = database.get_approved_screenshots_stats(interaction.guild_id)
     
     if not approved_stats:
         embed = discord.Embed(
@@ -881,7 +1362,165 @@ async def calculate_payments(interaction: discord.Interaction):
         
         await interaction.followup.send(embed=chunk_embed, ephemeral=True)
 
+@bot.tree.command(name="admin_metrics", description="Время выполнения команд и запросов (только для админов)")
+@metrics.timed('command', name='admin_metrics')
+async def admin_metrics(interaction: discord.Interaction):
+    """Команда для просмотра сводки метрик бота."""
+    if not await has_admin_permissions(interaction):
+        await interaction.response.send_message("❌ У вас нет прав для использования этой команды.", ephemeral=True)
+        return
+    
+    rows = metrics.summary()
+    if rows:
+        lines = [f"{'операция':<38} {'вызовов':>7} {'p50 мс':>8} {'p99 мс':>8}"]
+        for name, count, p50, p99, _ in rows:
+            lines.append(f"{name[:38]:<38} {count:>7} {p50:>8.1f} {p99:>8.1f}")
+        table = "```\n" + "\n".join(lines) + "\n```"
+    else:
+        table = "Метрик пока нет."
+    
+    embed = discord.Embed(
+        title="📈 Метрики бота",
+        description=table,
+        color=config.RASPBERRY_COLOR
+    )
+    
+    queue_depth = sum(inbox.queue.qsize() for inbox in inboxes.values())
+    embed.add_field(name="Очередь канала модерации", value=str(queue_depth), inline=True)
+    embed.add_field(name="Скачиваются", value=str(screenshot_archive.in_flight), inline=True)
+    
+    failures = []
+    for reason in ('forbidden', 'http', 'user_not_found', 'error'):
+        count = dm_failures(reason).value
+        if count:
+            failures.append(f"{reason}: {count}")
+    embed.add_field(name="Неудачные DM", value=", ".join(failures) or "0", inline=True)
+    embed.add_field(
+        name="Задержка цикла событий",
+        value=f"p50 {loop_watchdog.lag.quantile(0.5) * 1000:.1f} мс, p99 {loop_watchdog.lag.quantile(0.99) * 1000:.1f} мс",
+        inline=False
+    )
+    if config.METRICS_PORT:
+        embed.set_footer(text=f"Полные метрики: http://{config.METRICS_HOST}:{config.METRICS_PORT}/metrics")
+    
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+# Строк в таблице /admin_analytics: период делится на ANALYTICS_ROWS равных интервалов
+ANALYTICS_ROWS = 24
+
+def hourly_report(guild_id: int, hours: int, now: datetime.datetime) -> discord.Embed:
+    """Скриншоты, решения, регистрации и очередь модерации за последние hours часов - только из сводок по часам."""
+    current_hour = now.replace(minute=0, second=0, microsecond=0)
+    window_start = current_hour - datetime.timedelta(hours=hours - 1)
+    day_start = current_hour.replace(hour=0)
+    backlog, rows = database.get_hourly_stats(guild_id, min(window_start, day_start))
+    
+    step = datetime.timedelta(hours=hours // ANALYTICS_ROWS)
+    lines = [f"{'UTC':<11} {'скрин':>5} {'одобр':>5} {'откл':>5} {'рег':>4} {'очередь':>7}"]
+    totals = dict.fromkeys(('submissions', 'approved', 'rejected', 'registrations'), 0)
+    today = dict.fromkeys(('submissions', 'registrations'), 0)
+    index = 0
+    start = window_start
+    while start <= current_hour:
+        bucket = dict.fromkeys(totals, 0)
+        while index < len(rows) and rows[index]['hour'] < start + step:
+            row = rows[index]
+            if row['hour'] >= day_start:
+                for field in today:
+                    today[field] += row[field]
+            if row['hour'] >= start:
+                for field in bucket:
+                    bucket[field] += row[field]
+            backlog = row['pending']
+            index += 1
+        for field in totals:
+            totals[field] += bucket[field]
+        lines.append(f"{start:%d.%m %H:%M} {bucket['submissions']:>5} {bucket['approved']:>5} "
+                     f"{bucket['rejected']:>5} {bucket['registrations']:>4} {backlog:>7}")
+        start += step
+    
+    embed = discord.Embed(
+        title=f"📈 Активность за {hours} ч",
+        description="```\n" + "\n".join(lines) + "\n```",
+        color=config.RASPBERRY_COLOR
+    )
+    embed.add_field(
+        name="За период",
+        value=f"Скриншотов: **{totals['submissions']}**\nРешений: ✅{totals['approved']} ❌{totals['rejected']}\n"
+              f"Регистраций: **{totals['registrations']}**",
+        inline=True
+    )
+    embed.add_field(
+        name="Сегодня (UTC)",
+        value=f"Скриншотов: **{today['submissions']}**\nРегистраций: **{today['registrations']}**",
+        inline=True
+    )
+    embed.add_field(name="Ждут модерации", value=str(backlog), inline=True)
+    embed.set_footer(text="Очередь - скриншоты без решения на конец интервала")
+    return embed
+
+@bot.tree.command(name="admin_analytics", description="Скриншоты, модерация и регистрации по часам (только для админов)")
+@app_commands.describe(hours="Период: последние 24 часа, 3 дня или неделя")
+@app_commands.choices(hours=[
+    app_commands.Choice(name="24 часа", value=24),
+    app_commands.Choice(name="3 дня", value=72),
+    app_commands.Choice(name="7 дней", value=168),
+])
+@metrics.timed('command', name='admin_analytics')
+async def admin_analytics(interaction: discord.Interaction, hours: int = 24):
+    """Команда для просмотра активности ивента по часам."""
+    if not await has_admin_permissions(interaction):
+        await interaction.response.send_message("❌ У вас нет прав для использования этой команды.", ephemeral=True)
+        return
+    
+    embed = hourly_report(interaction.guild_id, hours, datetime.datetime.utcnow())
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="admin_export", description="Выгрузить игроков или скриншоты ивента в файл (только для админов)")
+@app_commands.describe(
+    table="Что выгрузить",
+    file_format="Формат файла (CSV и JSONL сжимаются gzip)"
+)
+@app_commands.choices(
+    table=[
+        app_commands.Choice(name="Скриншоты", value="submissions"),
+        app_commands.Choice(name="Игроки", value="players"),
+    ],
+    file_format=[app_commands.Choice(name=fmt, value=fmt) for fmt in data_export.FORMATS]
+)
+@metrics.timed('command', name='admin_export')
+async def admin_export(interaction: discord.Interaction, table: str = "submissions", file_format: str = "csv"):
+    """Команда для выгрузки данных ивента сервера файлом."""
+    if not await has_admin_permissions(interaction):
+        await interaction.response.send_message("❌ У вас нет прав для использования этой команды.", ephemeral=True)
+        return
+    
+    await interaction.response.defer(ephemeral=True)
+    
+    filename = f"{table}_{interaction.guild_id}.{file_format}" + ("" if file_format == "parquet" else ".gz")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, filename)
+        try:
+            # Выгрузка идет порциями в отдельном потоке и не блокирует цикл событий
+            count = await asyncio.to_thread(data_export.export, table, path, file_format, interaction.guild_id)
+        except Exception as e:
+            log.exception("Ошибка выгрузки", extra={'table': table, 'format': file_format})
+            await interaction.followup.send(f"❌ Ошибка выгрузки: {e}", ephemeral=True)
+            return
+        
+        size = os.path.getsize(path)
+        if size > config.EXPORT_MAX_UPLOAD_BYTES:
+            await interaction.followup.send(
+                f"❌ Файл слишком большой для Discord ({size / 1024 / 1024:.1f} МБ). "
+                f"Используйте `python data_export.py {table} --guild {interaction.guild_id} --format {file_format}`.",
+                ephemeral=True
+            )
+            return
+        
+        await interaction.followup.send(f"📦 Выгружено строк: {count}", file=discord.File(path, filename=filename), ephemeral=True)
+
 @bot.tree.command(name="reset_stats", description="Сброс всех статистик (только для админов)")
+@metrics.timed('command', name='reset_stats')
 async def reset_statistics(interaction: discord.Interaction):
     """Команда для сброса всех статистик."""
     if not await has_admin_permissions(interaction):
@@ -890,8 +1529,8 @@ async def reset_statistics(interaction: discord.Interaction):
     
     view = ResetConfirmationView()
     await interaction.response.send_message(
-        "⚠️ **ВНИМАНИЕ!** Вы собираетесь удалить все статистики и профили игроков.\n"
-        "Это действие необратимо. Вы уверены?",
+        "⚠️ **ВНИМАНИЕ!** Вы собираетесь начать новый ивент: все статистики и профили игроков будут сброшены.\n"
+        "Данные текущего ивента сохранятся в архиве только для чтения. Вы уверены?",
         view=view,
         ephemeral=True
     )
@@ -901,15 +1540,25 @@ class ResetConfirmationView(discord.ui.View):
         super().__init__(timeout=30)
 
     @discord.ui.button(label='✅ Да, сбросить', style=discord.ButtonStyle.danger)
+    @metrics.timed('view')
     async def confirm_reset(self, interaction: discord.Interaction, button: discord.ui.Button):
-        success = database.reset_all_statistics()
+        # Новый ивент начинается в новом файле базы, прошлый сжимается в архив в фоне
+        old_path = database.start_new_event(interaction.guild_id)
+        perceptual_index.forget_guild(interaction.guild_id)
         
-        if success:
-            await interaction.response.send_message("✅ Все статистики успешно сброшены.", ephemeral=True)
+        if old_path:
+            log.info("Начат новый ивент", extra={'path': database.DATABASE_NAME, 'previous': old_path})
+            await interaction.response.send_message("✅ Все статистики успешно сброшены, прошлый ивент сохранен в архиве.", ephemeral=True)
+            if storage_in_files():
+                if config.REPLICA_DIR:
+                    # Репликатор дописывает последние кадры прошлого файла и отпускает его до архивации
+                    await asyncio.to_thread(replicator.sync)
+                event_archiver.schedule(old_path)
         else:
             await interaction.response.send_message("❌ Ошибка при сбросе статистик.", ephemeral=True)
 
     @discord.ui.button(label='❌ Отмена', style=discord.ButtonStyle.secondary)
+    @metrics.timed('view')
     async def cancel_reset(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.send_message("Сброс отменен.", ephemeral=True)
 
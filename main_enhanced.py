@@ -128,7 +128,7 @@ class ScreenshotSelect(discord.ui.Select):
         
         options = []
         for i, sub in enumerate(submissions[:25]):  # Discord limit 25
-            timestamp = datetime.datetime.fromisoformat(sub['submission_time'])
+            timestamp = sub['submission_time']
             date_str = timestamp.strftime("%d.%m %H:%M")
             
             status_emoji = "✅" if sub['is_approved'] else ("⏳" if sub['is_valid'] else "❌")
@@ -160,7 +160,7 @@ class ScreenshotSelect(discord.ui.Select):
             await interaction.response.send_message("❌ Скриншот не найден.", ephemeral=True)
             return
         
-        timestamp = datetime.datetime.fromisoformat(submission['submission_time'])
+        timestamp = submission['submission_time']
         date_str = timestamp.strftime("%d.%m.%Y в %H:%M")
         
         status_text = "✅ Одобрен" if submission['is_approved'] else ("⏳ На модерации" if submission['is_valid'] else "❌ Отклонен")
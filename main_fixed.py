@@ -139,7 +139,7 @@ class ScreenshotSelect(discord.ui.Select):
         
         options = []
         for i, sub in enumerate(submissions[:25]):  # Discord limit 25
-            timestamp = datetime.datetime.fromisoformat(sub['submission_time'])
+            timestamp = sub['submission_time']
             date_str = timestamp.strftime("%d.%m %H:%M")
             
             # Проверяем статус одобрения
@@ -182,7 +182,7 @@ class ScreenshotSelect(discord.ui.Select):
                 await interaction.response.send_message("❌ Скриншот не найден.", ephemeral=True)
                 return
             
-            timestamp = datetime.datetime.fromisoformat(submission['submission_time'])
+            timestamp = submission['submission_time']
             date_str = timestamp.strftime("%d.%m.%Y в %H:%M")
             
             # Проверяем статус одобрения
@@ -0,0 +1,473 @@
+# memory_storage.py
+# Хранилище в памяти процесса (config.STORAGE_ENGINE = "memory"): те же операции и те же
+# результаты, что у SQLite (database.SQLiteStorage), но без файлов и без SQL.
+# Для тестов и нагрузочных прогонов: данные пропадают при завершении процесса.
+import copy
+import datetime
+from typing import Dict, List, Optional, Tuple
+
+import config
+import storage
+
+def _now() -> Tuple[int, int]:
+    """Текущее время в миллисекундах Unix, как в базе, и начало часа."""
+    now = storage.to_epoch_ms(datetime.datetime.utcnow())
+    return now, _hour(now)
+
+def _hour(value: int) -> int:
+    return value // storage.HOUR_MS * storage.HOUR_MS
+
+_HOURLY_FIELDS = ('submissions', 'approved', 'rejected', 'moderated', 'registrations')
+
+class MemoryStorage(storage.Storage):
+    """
+    Строки таблиц - словари, как в SQLite: флаги хранятся числами 1/0, время - миллисекундами Unix.
+    Наружу строки отдаются записями storage.py (копиями), поэтому изменения хранилища их не затрагивают.
+    Индексы повторяют индексы базы, поэтому операции одного сервера не перебирают чужие строки.
+    Вызовы идут из одного потока (цикла событий бота), блокировок нет.
+    """
+
+    def __init__(self):
+        self._settings: Dict[int, dict] = {}
+        # guild_id -> discord_id -> игрок
+        self._players: Dict[int, Dict[int, dict]] = {}
+        self._submissions: Dict[int, dict] = {}
+        # guild_id -> ID скриншотов сервера по возрастанию (словарь как упорядоченное множество)
+        self._guild_submissions: Dict[int, Dict[int, None]] = {}
+        # (guild_id, player_id) -> ID скриншотов игрока по возрастанию
+        self._player_submissions: Dict[Tuple[int, int], List[int]] = {}
+        # (guild_id, file_sha256) -> ID первого скриншота с этим файлом
+        self._first_by_sha: Dict[Tuple[int, str], int] = {}
+        # Последний выданный ID скриншота (как sqlite_sequence у AUTOINCREMENT)
+        self._sequence = 0
+        self._cards: Dict[int, Tuple[int, int]] = {}
+        self._card_messages: Dict[int, Dict[int, None]] = {}
+        self._log: Dict[int, dict] = {}
+        self._log_by_submission: Dict[int, List[dict]] = {}
+        self._files: Dict[str, dict] = {}
+        # guild_id -> начало часа -> счетчики сводки
+        self._hourly: Dict[int, Dict[int, dict]] = {}
+        # Завершенные ивенты: имя -> хранилище с их данными (как файлы прошлых ивентов)
+        self.previous_events: Dict[str, 'MemoryStorage'] = {}
+
+    def setup_database(self):
+        pass
+
+    def get_guild_settings(self, guild_id: int) -> dict:
+        result = self._settings.get(guild_id) or {}
+        default_channel = config.MODERATION_CHANNEL_ID if guild_id == config.GUILD_ID else None
+        return {
+            'guild_id': guild_id,
+            'event_start_time': result.get('event_start_time') or config.EVENT_START_TIME,
+            'event_end_time': result.get('event_end_time') or config.EVENT_END_TIME,
+            'moderation_channel_id': result.get('moderation_channel_id') or default_channel
+        }
+
+    def update_guild_settings(self, guild_id: int, event_start_time: Optional[str] = None,
+                              event_end_time: Optional[str] = None,
+                              moderation_channel_id: Optional[int] = None) -> bool:
+        settings = self._settings.setdefault(
+            guild_id, {'event_start_time': None, 'event_end_time': None, 'moderation_channel_id': None})
+        for field, value in (('event_start_time', event_start_time), ('event_end_time', event_end_time),
+                             ('moderation_channel_id', moderation_channel_id)):
+            if value is not None:
+                settings[field] = value
+        return True
+
+    def register_player(self, guild_id: int, discord_id: int, static_id: str, nickname: str) -> bool:
+        players = self._players.setdefault(guild_id, {})
+        if discord_id in players:
+            return False
+        registration_time, hour = _now()
+        players[discord_id] = {
+            'guild_id': guild_id,
+            'discord_id': discord_id,
+            'static_id': static_id,
+            'nickname': nickname,
+            'registration_time': registration_time,
+            'is_disqualified': 0
+        }
+        self._add_hourly(guild_id, hour, registrations=1)
+        return True
+
+    @staticmethod
+    def _player_record(player: dict) -> storage.Player:
+        return storage.Player(player['discord_id'], player['static_id'], player['nickname'],
+                              player['registration_time'], player['is_disqualified'], player['guild_id'])
+
+    def _is_valid(self, s: dict) -> int:
+        """Действительность скриншота с учетом дисквалификации игрока (флаг хранится только у игрока)."""
+        player = self._players.get(s['guild_id'], {}).get(s['player_id'])
+        return 0 if player and player['is_disqualified'] else s['is_valid']
+
+    def _submission_record(self, s: dict) -> storage.Submission:
+        return storage.Submission(s['submission_id'], s['player_id'], s['guild_id'], s['screenshot_url'],
+                                  s['submission_time'], self._is_valid(s), s['is_approved'], s['file_sha256'],
+                                  s['duplicate_of'])
+
+    def get_player(self, guild_id: int, discord_id: int) -> Optional[storage.Player]:
+        player = self._players.get(guild_id, {}).get(discord_id)
+        return self._player_record(player) if player else None
+
+    def get_player_guilds(self, discord_id: int) -> List[int]:
+        registrations = [players[discord_id] for players in self._players.values() if discord_id in players]
+        registrations.sort(key=lambda player: player['registration_time'], reverse=True)
+        return [player['guild_id'] for player in registrations]
+
+    def _valid_count(self, guild_id: int, discord_id: int) -> int:
+        player = self._players.get(guild_id, {}).get(discord_id)
+        if player and player['is_disqualified']:
+            return 0
+        return sum(self._submissions[submission_id]['is_valid']
+                   for submission_id in self._player_submissions.get((guild_id, discord_id), ()))
+
+    def list_players(self, guild_id: Optional[int] = None) -> List[Tuple[storage.Player, int]]:
+        guild_ids = sorted(self._players) if guild_id is None else [guild_id]
+        results = []
+        for current_guild in guild_ids:
+            players = self._players.get(current_guild, {})
+            for discord_id in sorted(players):
+                results.append((self._player_record(players[discord_id]),
+                                self._valid_count(current_guild, discord_id)))
+        return results
+
+    def _insert_submission(self, submission: dict):
+        """Добавляет строку скриншота и ее индексы."""
+        submission_id = submission['submission_id']
+        guild_id = submission['guild_id']
+        self._submissions[submission_id] = submission
+        self._guild_submissions.setdefault(guild_id, {})[submission_id] = None
+        self._player_submissions.setdefault((guild_id, submission['player_id']), []).append(submission_id)
+        if submission['file_sha256']:
+            self._first_by_sha.setdefault((guild_id, submission['file_sha256']), submission_id)
+        self._sequence = max(self._sequence, submission_id)
+
+    def add_submission(self, guild_id: int, player_id: int, screenshot_url: str,
+                       file_sha256: Optional[str] = None) -> Optional[int]:
+        duplicate_of = self._first_by_sha.get((guild_id, file_sha256)) if file_sha256 else None
+        submission_id = self._sequence + 1
+        # Скриншоты игрока хранятся в порядке добавления: номер продолжает номер последнего
+        previous = self._player_submissions.get((guild_id, player_id))
+        seq = self._submissions[previous[-1]]['seq'] + 1 if previous else 1
+        submission_time, hour = _now()
+        self._add_hourly(guild_id, hour, submissions=1)
+        self._insert_submission({
+            'submission_id': submission_id,
+            'guild_id': guild_id,
+            'player_id': player_id,
+            'screenshot_url': screenshot_url,
+            'submission_time': submission_time,
+            'is_valid': 1,
+            'is_approved': None,
+            'file_sha256': file_sha256,
+            'duplicate_of': duplicate_of,
+            'seq': seq
+        })
+        return submission_id
+
+    def _player_submission_record(self, s: dict) -> storage.PlayerSubmission:
+        return storage.PlayerSubmission(s['submission_id'], s['screenshot_url'], s['submission_time'],
+                                        self._is_valid(s), s['is_approved'], s['seq'])
+
+    def get_player_submissions(self, guild_id: int, discord_id: int) -> List[storage.PlayerSubmission]:
+        return [self._player_submission_record(self._submissions[submission_id])
+                for submission_id in reversed(self._player_submissions.get((guild_id, discord_id), ()))]
+
+    def get_player_submissions_page(self, guild_id: int, discord_id: int, status: Optional[str] = None,
+                                    before_seq: Optional[int] = None,
+                                    limit: int = 25) -> List[storage.PlayerSubmission]:
+        approved = storage.SUBMISSION_STATUSES[status] if status is not None else None
+        page = []
+        for submission_id in reversed(self._player_submissions.get((guild_id, discord_id), ())):
+            if len(page) == limit:
+                break
+            s = self._submissions[submission_id]
+            if before_seq is not None and s['seq'] >= before_seq:
+                continue
+            if status is None or s['is_approved'] == approved:
+                page.append(self._player_submission_record(s))
+        return page
+
+    def get_player_submission_counts(self, guild_id: int, discord_id: int) -> Dict[str, int]:
+        counts = dict.fromkeys(storage.SUBMISSION_STATUSES, 0)
+        statuses = {value: status for status, value in storage.SUBMISSION_STATUSES.items()}
+        for submission_id in self._player_submissions.get((guild_id, discord_id), ()):
+            counts[statuses[self._submissions[submission_id]['is_approved']]] += 1
+        return counts
+
+    def _active_players(self, guild_id: int) -> List[dict]:
+        """Недисквалифицированные игроки сервера по возрастанию discord_id (порядок группировки в SQLite)."""
+        players = self._players.get(guild_id, {})
+        return [players[discord_id] for discord_id in sorted(players) if not players[discord_id]['is_disqualified']]
+
+    def _valid_submissions(self, guild_id: int, discord_id: int) -> List[dict]:
+        submissions = (self._submissions[submission_id]
+                       for submission_id in self._player_submissions.get((guild_id, discord_id), ()))
+        return [s for s in submissions if s['is_valid']]
+
+    def get_leaderboard(self, guild_id: int) -> List[Tuple[int, str, int]]:
+        results = [
+            (player['discord_id'], player['nickname'], self._valid_count(guild_id, player['discord_id']))
+            for player in self._active_players(guild_id)
+        ]
+        results.sort(key=lambda row: row[2], reverse=True)
+        return results
+
+    def get_all_players_stats(self, guild_id: int) -> int:
+        return len(self._players.get(guild_id, {}))
+
+    def _set_disqualified(self, guild_id: int, discord_id: int, disqualified: bool) -> bool:
+        player = self._players.get(guild_id, {}).get(discord_id)
+        if player:
+            player['is_disqualified'] = int(disqualified)
+        return True
+
+    def disqualify_player(self, guild_id: int, discord_id: int) -> bool:
+        return self._set_disqualified(guild_id, discord_id, True)
+
+    def cancel_disqualification(self, guild_id: int, discord_id: int) -> bool:
+        return self._set_disqualified(guild_id, discord_id, False)
+
+    def is_player_disqualified(self, guild_id: int, discord_id: int) -> bool:
+        player = self._players.get(guild_id, {}).get(discord_id)
+        return bool(player['is_disqualified']) if player else False
+
+    def _append_log(self, entry: dict):
+        self._log[entry['log_id']] = entry
+        self._log_by_submission.setdefault(entry['submission_id'], []).append(entry)
+
+    def record_moderation_decisions(self, decisions: List[Tuple[int, Optional[bool], Optional[int], Optional[str]]]
+                                    ) -> int:
+        decided_at, hour = _now()
+        recorded = 0
+        reopened = False
+        for submission_id, approved, moderator_id, reason in decisions:
+            submission = self._submissions.get(submission_id)
+            if submission is None:
+                continue
+            # log_id как у INTEGER PRIMARY KEY: наибольший существующий + 1
+            log_id = next(reversed(self._log), 0) + 1
+            self._append_log({
+                'log_id': log_id,
+                'submission_id': submission_id,
+                'guild_id': submission['guild_id'],
+                'moderator_id': moderator_id,
+                'approved': None if approved is None else int(bool(approved)),
+                'reason': reason,
+                'decided_at': decided_at
+            })
+            if approved is None:
+                reopened = True
+            else:
+                self._add_hourly(submission['guild_id'], hour, approved=int(bool(approved)),
+                                 rejected=int(not approved), moderated=int(submission['is_approved'] is None))
+            submission['is_approved'] = None if approved is None else int(bool(approved))
+            recorded += 1
+        if reopened:
+            # Возврат на модерацию меняет час ухода из очереди - сводка пересчитывается целиком
+            self.rebuild_hourly_stats()
+        return recorded
+
+    def get_moderation_history(self, submission_id: int) -> List[storage.ModerationDecision]:
+        return [
+            storage.ModerationDecision(entry['moderator_id'], entry['approved'], entry['reason'], entry['decided_at'])
+            for entry in self._log_by_submission.get(submission_id, ())
+        ]
+
+    def get_moderation_log(self, guild_id: Optional[int] = None) -> List[Tuple[int, Optional[int], int]]:
+        return [
+            (entry['submission_id'], entry['approved'], entry['decided_at'])
+            for entry in self._log.values() if guild_id is None or entry['guild_id'] == guild_id
+        ]
+
+    def reopen_unmoderated_rejections(self) -> int:
+        reopened = 0
+        for submission_id, submission in self._submissions.items():
+            if submission['is_approved'] == 0 and not self._log_by_submission.get(submission_id):
+                submission['is_approved'] = None
+                reopened += 1
+        if reopened:
+            self.rebuild_hourly_stats()
+        return reopened
+
+    def get_approved_screenshots_stats(self, guild_id: int) -> List[Tuple[int, str, str, int]]:
+        results = []
+        for player in self._active_players(guild_id):
+            approved = sum(1 for s in self._valid_submissions(guild_id, player['discord_id'])
+                           if s['is_approved'] == 1)
+            if approved > 0:
+                results.append((player['discord_id'], player['nickname'], player['static_id'], approved))
+        results.sort(key=lambda row: row[3], reverse=True)
+        return results
+
+    def get_submission_by_id(self, submission_id: int) -> Optional[storage.Submission]:
+        s = self._submissions.get(submission_id)
+        return self._submission_record(s) if s else None
+
+    def get_leaderboard_by_approved(self, guild_id: int) -> List[Tuple[int, str, int, int]]:
+        results = []
+        for player in self._active_players(guild_id):
+            valid = self._valid_submissions(guild_id, player['discord_id'])
+            if valid:
+                approved = sum(1 for s in valid if s['is_approved'] == 1)
+                results.append((player['discord_id'], player['nickname'], len(valid), approved))
+        results.sort(key=lambda row: (row[3], row[2]), reverse=True)
+        return results
+
+    def get_player_screenshot_number(self, discord_id: int, submission_id: int) -> int:
+        submission = self._submissions.get(submission_id)
+        if submission is None or submission['player_id'] != discord_id:
+            return 1
+        return submission['seq']
+
+    def _add_hourly(self, guild_id: int, hour: int, **counts):
+        row = self._hourly.setdefault(guild_id, {}).get(hour)
+        if row is None:
+            row = self._hourly[guild_id][hour] = dict.fromkeys(_HOURLY_FIELDS, 0)
+        for field, value in counts.items():
+            row[field] += value
+
+    def get_hourly_stats(self, guild_id: int, since: datetime.datetime) -> Tuple[int, List[dict]]:
+        since_hour = storage.hour_bucket(since)
+        hours = self._hourly.get(guild_id, {})
+        pending = sum(row['submissions'] - row['moderated'] for hour, row in hours.items() if hour < since_hour)
+        backlog = pending
+        rows = []
+        for hour in sorted(hour for hour in hours if hour >= since_hour):
+            row = hours[hour]
+            pending += row['submissions'] - row['moderated']
+            rows.append(dict(row, hour=storage.from_epoch_ms(hour), pending=pending))
+        return backlog, rows
+
+    def rebuild_hourly_stats(self):
+        self._hourly = {}
+        for guild_id, players in self._players.items():
+            for player in players.values():
+                self._add_hourly(guild_id, _hour(player['registration_time']), registrations=1)
+        for entry in self._log.values():
+            self._add_hourly(entry['guild_id'], _hour(entry['decided_at']),
+                             approved=int(entry['approved'] not in (None, 0)), rejected=int(entry['approved'] == 0))
+        for submission_id, submission in self._submissions.items():
+            guild_id = submission['guild_id']
+            self._add_hourly(guild_id, _hour(submission['submission_time']), submissions=1)
+            if submission['is_approved'] is not None:
+                # Из очереди - при первом решении после последнего возврата на модерацию
+                decided_at = submission['submission_time']
+                for entry in reversed(self._log_by_submission.get(submission_id, ())):
+                    if entry['approved'] is None:
+                        break
+                    decided_at = entry['decided_at']
+                self._add_hourly(guild_id, _hour(decided_at), moderated=1)
+
+    def number_submissions(self) -> int:
+        # Номер выдается каждому скриншоту при добавлении
+        return 0
+
+    def reset_all_statistics(self, guild_id: int) -> bool:
+        for submission_id in self._guild_submissions.pop(guild_id, {}):
+            card = self._cards.pop(submission_id, None)
+            if card:
+                self._card_messages[card[1]].pop(submission_id, None)
+            for entry in self._log_by_submission.pop(submission_id, ()):
+                del self._log[entry['log_id']]
+            del self._submissions[submission_id]
+        for key in [key for key in self._player_submissions if key[0] == guild_id]:
+            del self._player_submissions[key]
+        for key in [key for key in self._first_by_sha if key[0] == guild_id]:
+            del self._first_by_sha[key]
+        self._players.pop(guild_id, None)
+        self._hourly.pop(guild_id, None)
+        return True
+
+    def start_new_event(self, guild_id: int) -> Optional[str]:
+        # Данные прошлого ивента остаются в отдельном хранилище, текущее собирается заново
+        previous = copy.copy(self)
+        previous.previous_events = {}
+        name = f"memory:event_{len(self.previous_events) + 1}"
+        self.previous_events[name] = previous
+        sequence = self._sequence
+        events = self.previous_events
+        self.__init__()
+        self._sequence = sequence
+        self.previous_events = events
+
+        self._settings = copy.deepcopy(previous._settings)
+        for other_guild, players in previous._players.items():
+            if other_guild != guild_id:
+                self._players[other_guild] = copy.deepcopy(players)
+        for submission_id in sorted(previous._submissions):
+            submission = previous._submissions[submission_id]
+            if submission['guild_id'] != guild_id:
+                self._insert_submission(dict(submission))
+        for submission_id, (channel_id, message_id) in previous._cards.items():
+            if submission_id in self._submissions:
+                self._cards[submission_id] = (channel_id, message_id)
+                self._card_messages.setdefault(message_id, {})[submission_id] = None
+        for entry in previous._log.values():
+            if entry['guild_id'] != guild_id:
+                self._append_log(dict(entry))
+        for other_guild, hours in previous._hourly.items():
+            if other_guild != guild_id:
+                self._hourly[other_guild] = copy.deepcopy(hours)
+        # Файлы архива скриншотов нужны только перенесенным скриншотам
+        for submission in self._submissions.values():
+            sha256 = submission['file_sha256']
+            if sha256 in previous._files and sha256 not in self._files:
+                self._files[sha256] = dict(previous._files[sha256])
+        return name
+
+    def save_moderation_cards(self, channel_id: int, message_id: int, submission_ids: List[int]) -> bool:
+        for submission_id in submission_ids:
+            card = self._cards.get(submission_id)
+            if card:
+                self._card_messages[card[1]].pop(submission_id, None)
+            self._cards[submission_id] = (channel_id, message_id)
+            self._card_messages.setdefault(message_id, {})[submission_id] = None
+        return True
+
+    def get_moderation_card_group(self, submission_id: int) -> Optional[Tuple[int, int, List[int]]]:
+        card = self._cards.get(submission_id)
+        if card is None:
+            return None
+        channel_id, message_id = card
+        return channel_id, message_id, sorted(self._card_messages[message_id])
+
+    def get_unposted_pending_submissions(self, guild_id: int) -> List[int]:
+        results = []
+        for submission_id in self._guild_submissions.get(guild_id, ()):
+            submission = self._submissions[submission_id]
+            if submission['is_approved'] is None and self._is_valid(submission) and submission_id not in self._cards:
+                results.append(submission_id)
+        return results
+
+    def save_screenshot_file(self, sha256: str, path: str, image_format: str, width: int, height: int,
+                             size_bytes: int) -> bool:
+        self._files.setdefault(sha256, {
+            'sha256': sha256,
+            'path': path,
+            'format': image_format,
+            'width': width,
+            'height': height,
+            'size_bytes': size_bytes,
+            'phash': None
+        })
+        return True
+
+    def get_screenshot_file(self, sha256: str) -> Optional[storage.ScreenshotFile]:
+        file = self._files.get(sha256)
+        return storage.ScreenshotFile(**file) if file else None
+
+    def save_perceptual_hash(self, sha256: str, phash: int) -> bool:
+        file = self._files.get(sha256)
+        if file:
+            file['phash'] = phash & ((1 << 64) - 1)
+        return True
+
+    def get_guild_perceptual_hashes(self, guild_id: int) -> List[Tuple[int, int, int]]:
+        results = []
+        for submission_id in self._guild_submissions.get(guild_id, ()):
+            submission = self._submissions[submission_id]
+            file = self._files.get(submission['file_sha256'])
+            if file and file['phash'] is not None:
+                results.append((submission_id, submission['player_id'], file['phash']))
+        return results
@@ -0,0 +1,251 @@
+# metrics.py
+import asyncio
+import bisect
+import functools
+import inspect
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import tracing
+from bot_logging import get_logger
+
+log = get_logger('metrics')
+
+# Границы корзин гистограмм задержек в секундах
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def _labels_key(labels: dict) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+class Counter:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами: запись - один bisect и три сложения."""
+    __slots__ = ('counts', 'count', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля по корзинам (линейная интерполяция внутри корзины)."""
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = LATENCY_BUCKETS[i - 1] if i > 0 else 0.0
+                upper = LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else LATENCY_BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return LATENCY_BUCKETS[-1]
+
+# Все метрики процесса: имя -> {метки -> значение}
+_counters: Dict[str, Dict[Labels, Counter]] = {}
+_histograms: Dict[str, Dict[Labels, Histogram]] = {}
+_gauges: Dict[str, Callable[[], Dict[Labels, float]]] = {}
+_http_routes: Dict[str, Histogram] = {}
+_help: Dict[str, str] = {}
+
+def counter(name: str, help_text: str = "", /, **labels) -> Counter:
+    """Возвращает (создавая при необходимости) счетчик с указанными метками."""
+    _help.setdefault(name, help_text)
+    series = _counters.setdefault(name, {})
+    key = _labels_key(labels)
+    if key not in series:
+        series[key] = Counter()
+    return series[key]
+
+def histogram(name: str, help_text: str = "", /, **labels) -> Histogram:
+    """Возвращает (создавая при необходимости) гистограмму с указанными метками."""
+    _help.setdefault(name, help_text)
+    series = _histograms.setdefault(name, {})
+    key = _labels_key(labels)
+    if key not in series:
+        series[key] = Histogram()
+    return series[key]
+
+def gauge(name: str, help_text: str, read: Callable[[], Iterable[Tuple[dict, float]]]):
+    """
+    Регистрирует показатель, значение которого читается в момент выгрузки.
+    read() возвращает список пар (метки, значение).
+    """
+    _help[name] = help_text
+    _gauges[name] = lambda: {_labels_key(labels): value for labels, value in read()}
+
+# Виды span трассировки для видов timed: обработчики взаимодействий и событий начинают трассу
+_SPAN_KINDS = {'command': tracing.SERVER, 'view': tracing.SERVER, 'event': tracing.SERVER, 'db': tracing.CLIENT}
+
+def timed(kind: str, name: Optional[str] = None):
+    """
+    Декоратор: считает вызовы, ошибки и время выполнения функции (синхронной или async)
+    и записывает вызов как span трассировки.
+    Метрики создаются один раз при декорировании, поэтому запись почти ничего не стоит.
+    """
+    def decorator(func):
+        label = name or func.__qualname__
+        latency = histogram(f"{kind}_duration_seconds", f"Время выполнения ({kind})", name=label)
+        errors = counter(f"{kind}_errors_total", f"Исключения ({kind})", name=label)
+        span_name = f"{kind} {label}"
+        span_kind = _SPAN_KINDS.get(kind, tracing.INTERNAL)
+        root = span_kind == tracing.SERVER
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                with tracing.span(span_name, span_kind, root):
+                    try:
+                        return await func(*args, **kwargs)
+                    except BaseException:
+                        errors.inc()
+                        raise
+                    finally:
+                        latency.observe(time.perf_counter() - started)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            with tracing.span(span_name, span_kind, root):
+                try:
+                    return func(*args, **kwargs)
+                except BaseException:
+                    errors.inc()
+                    raise
+                finally:
+                    latency.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+def instrument_http(http):
+    """
+    Замеряет все запросы discord.py к REST API (user.send, fetch_user, tree.sync и т.д.)
+    с меткой маршрута, например "POST /channels/{channel_id}/messages".
+    Подходит и для адаптера вебхуков, через который идут ответы на взаимодействия.
+    """
+    original_request = http.request
+
+    @functools.wraps(original_request)
+    async def request(route, *args, **kwargs):
+        route_label = f"{route.method} {route.path}"
+        latency = _http_routes.get(route_label)
+        if latency is None:
+            latency = _http_routes[route_label] = histogram(
+                "discord_http_duration_seconds", "Время запросов к Discord API", route=route_label)
+
+        started = time.perf_counter()
+        with tracing.span(f"discord {route_label}", tracing.CLIENT) as span:
+            try:
+                return await original_request(route, *args, **kwargs)
+            except Exception as e:
+                span.set(error_type=type(e).__name__, status=getattr(e, 'status', 0))
+                counter("discord_http_errors_total", "Ошибки запросов к Discord API",
+                        route=route_label, error=type(e).__name__).inc()
+                raise
+            finally:
+                latency.observe(time.perf_counter() - started)
+
+    http.request = request
+
+def render_prometheus() -> str:
+    """Выгружает все метрики в текстовом формате Prometheus."""
+    lines = []
+
+    for name, series in sorted(_counters.items()):
+        lines.append(f"# HELP {name} {_help.get(name, '')}")
+        lines.append(f"# TYPE {name} counter")
+        for labels, value in series.items():
+            lines.append(f"{name}{_format_labels(labels)} {value.value}")
+
+    for name, read in sorted(_gauges.items()):
+        lines.append(f"# HELP {name} {_help.get(name, '')}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in read().items():
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for name, series in sorted(_histograms.items()):
+        lines.append(f"# HELP {name} {_help.get(name, '')}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, value in series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS, value.counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(labels, ('le', str(bound)))} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {value.count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {value.sum}")
+            lines.append(f"{name}_count{_format_labels(labels)} {value.count}")
+
+    return "\n".join(lines) + "\n"
+
+def summary(limit: int = 15) -> List[Tuple[str, int, float, float, float]]:
+    """
+    Самые затратные операции по суммарному времени.
+    Возвращает список кортежей: (метрика/имя, вызовов, p50 мс, p99 мс, всего секунд)
+    """
+    rows = []
+    for name, series in _histograms.items():
+        for labels, value in series.items():
+            if not value.count:
+                continue
+            label = dict(labels).get('name') or dict(labels).get('route') or ''
+            kind = name.replace('_duration_seconds', '')
+            rows.append((f"{kind}:{label}", value.count, value.quantile(0.5) * 1000,
+                         value.quantile(0.99) * 1000, value.sum))
+
+    rows.sort(key=lambda row: row[4], reverse=True)
+    return rows[:limit]
+
+async def _handle_http(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        # Заголовки запроса не нужны, но их нужно дочитать
+        while (await asyncio.wait_for(reader.readline(), timeout=5)).strip():
+            pass
+
+        parts = request_line.decode('latin-1').split()
+        if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+            status, body = "200 OK", render_prometheus().encode('utf-8')
+        else:
+            status, body = "404 Not Found", b"not found\n"
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode('latin-1') + body
+        )
+        await writer.drain()
+    except Exception:
+        pass
+    finally:
+        writer.close()
+
+async def start_http_server(host: str, port: int):
+    """Запускает локальный HTTP endpoint /metrics для Prometheus."""
+    server = await asyncio.start_server(_handle_http, host, port)
+    log.info("Endpoint метрик запущен", extra={'url': f"http://{host}:{port}/metrics"})
+    return server
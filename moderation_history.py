@@ -0,0 +1,102 @@
+# moderation_history.py
+# Журнал решений модерации (таблица moderation_log): просмотр и восстановление статусов скриншотов.
+#
+#   python moderation_history.py show 1234
+#   python moderation_history.py replay --guild 123456789 --until 2025-07-10T18:30:00 --dry-run
+#
+# Статусы скриншотов (и все счетчики и лидерборды, которые из них считаются) восстанавливаются
+# одним последовательным проходом по журналу: после ошибочной массовой модерации достаточно
+# воспроизвести журнал до момента ошибки, не восстанавливая всю базу из резервной копии.
+# Восстановление само записывается в журнал компенсирующими решениями (без модератора),
+# поэтому следующий просмотр или воспроизведение журнала не вернут отмененные решения.
+import argparse
+import datetime
+import sys
+from typing import Dict, Optional
+
+import database
+import storage
+
+def _parse_time(value: str) -> datetime.datetime:
+    """Время в UTC без часового пояса, как его принимают операции хранилища."""
+    moment = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return moment
+
+def decisions_as_of(guild_id: Optional[int] = None,
+                    until: Optional[datetime.datetime] = None) -> Dict[int, Optional[bool]]:
+    """
+    Статус каждого скриншота из журнала на момент until (None - все решения): последнее решение
+    или None, если скриншот был возвращен на модерацию или все решения по нему приняты позже until.
+    Журнал читается в порядке записи одним проходом; время решений сравнивается в миллисекундах Unix.
+    """
+    limit = storage.to_epoch_ms(until) if until is not None else None
+
+    state = {}
+    for submission_id, approved, decided_ms in database.get_moderation_log(guild_id):
+        if limit is None or decided_ms <= limit:
+            state[submission_id] = None if approved is None else bool(approved)
+        else:
+            state.setdefault(submission_id, None)
+    return state
+
+def replay(guild_id: Optional[int] = None, until: Optional[datetime.datetime] = None,
+           dry_run: bool = False) -> dict:
+    """
+    Возвращает скриншотам статусы по журналу на момент until. Скриншоты без решений в журнале
+    не меняются; скриншоты, все решения по которым приняты позже until, возвращаются на модерацию.
+    Изменения записываются одной транзакцией как решения без модератора с причиной
+    "восстановлено по журналу". Возвращает число скриншотов в журнале и число измененных статусов
+    (при ошибке записи - 0, ошибка уходит в журнал бота).
+    """
+    state = decisions_as_of(guild_id, until)
+    reason = f"восстановлено по журналу на {until:%Y-%m-%d %H:%M:%S}" if until else "восстановлено по журналу"
+    changes = []
+    for submission_id, approved in state.items():
+        submission = database.get_submission_by_id(submission_id)
+        if submission is None:
+            continue
+        current = None if submission.is_approved is None else bool(submission.is_approved)
+        if current != approved:
+            changes.append((submission_id, approved, None, reason))
+    changed = len(changes)
+    if changes and not dry_run:
+        changed = database.record_moderation_decisions(changes)
+    return {'submissions': len(state), 'changed': changed}
+
+def _decision_text(entry: storage.ModerationDecision) -> str:
+    if entry.approved is None:
+        text = "↩️ возвращен на модерацию"
+    else:
+        text = "✅ одобрен" if entry.approved else "❌ отклонен"
+    if entry.reason:
+        text += f": {entry.reason}"
+    return text
+
+def main():
+    parser = argparse.ArgumentParser(description="Журнал решений модерации скриншотов")
+    commands = parser.add_subparsers(dest='command', required=True)
+    show_parser = commands.add_parser('show', help="Решения по скриншоту")
+    show_parser.add_argument('submission_id', type=int)
+    replay_parser = commands.add_parser('replay', help="Восстановить статусы скриншотов по журналу")
+    replay_parser.add_argument('--guild', type=int, help="Только этот сервер")
+    replay_parser.add_argument('--until', help="Учитывать решения до этого момента (ISO 8601, без пояса - UTC)")
+    replay_parser.add_argument('--dry-run', action='store_true', help="Только показать, сколько статусов изменится")
+    args = parser.parse_args()
+
+    if args.command == 'show':
+        for entry in database.get_moderation_history(args.submission_id):
+            print(f"{entry.decided_at:%Y-%m-%d %H:%M:%S}\t{entry.moderator_id or '-'}\t{_decision_text(entry)}")
+        return
+
+    try:
+        result = replay(args.guild, _parse_time(args.until) if args.until else None, args.dry_run)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    action = "изменится" if args.dry_run else "изменено"
+    print(f"Скриншотов в журнале: {result['submissions']}, статусов {action}: {result['changed']}")
+
+if __name__ == "__main__":
+    main()
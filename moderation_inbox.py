@@ -0,0 +1,211 @@
+# moderation_inbox.py
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional
+
+import discord
+
+import config
+import database
+import storage
+import tracing
+from bot_logging import get_logger
+from screenshot_archive import image_for_embed, original_link
+
+log = get_logger('inbox')
+
+# Discord принимает не более 10 embed в одном сообщении
+MAX_CARDS_PER_MESSAGE = 10
+
+class RateLimiter:
+    """Token bucket: не более rate отправок за per секунд."""
+
+    def __init__(self, rate: int, per: float):
+        self.rate = rate
+        self.per = per
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Ждет, пока в ведре появится токен, и забирает его."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) * self.per / self.rate)
+
+def build_card(submission: storage.Submission, player: Optional[storage.Player]):
+    """
+    Собирает компактную карточку скриншота для канала модерации.
+    Возвращает (embed, files) - файлы архива, которые нужно приложить к сообщению.
+    """
+    screenshot_number = database.get_player_screenshot_number(submission.discord_id, submission.submission_id)
+    nickname = player.nickname if player else "неизвестный игрок"
+    static_id = player.static_id if player else "—"
+
+    if submission.is_approved is None:
+        status_text = "⏳ На модерации"
+    elif submission.is_approved:
+        status_text = "✅ Одобрен"
+    else:
+        status_text = "❌ Отклонен"
+
+    embed = discord.Embed(
+        title=f"📥 Скриншот #{screenshot_number} - {nickname}",
+        description=f"**Игрок:** <@{submission.discord_id}>\n"
+                   f"**StaticID:** {static_id}\n"
+                   f"**Время отправки:** {submission.submission_time:%Y-%m-%d %H:%M}\n"
+                   f"**Статус:** {status_text}\n"
+                   f"{original_link(submission)}",
+        color=config.RASPBERRY_COLOR
+    )
+    if submission.duplicate_of:
+        embed.add_field(name="⚠️ Точный дубликат", value=f"Файл совпадает со скриншотом ID {submission.duplicate_of}", inline=False)
+    image_url, files = image_for_embed(submission)
+    embed.set_thumbnail(url=image_url)
+    embed.set_footer(text=f"ID скриншота: {submission.submission_id}")
+    return embed, files
+
+class ModerationInbox:
+    """
+    Публикует карточки новых скриншотов сервера в его канал модерации.
+    Скриншоты, пришедшие подряд, объединяются в одно сообщение (до 10 карточек),
+    а отправка и редактирование сообщений ограничены RateLimiter.
+    """
+
+    def __init__(self, bot, guild_id: int, channel_id: int,
+                 view_factory: Callable[[List[storage.Submission]], discord.ui.View]):
+        self.bot = bot
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        # view_factory получает записи скриншотов сообщения (storage.Submission) и возвращает вид с кнопками
+        self.view_factory = view_factory
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.limiter = RateLimiter(config.MODERATION_INBOX_RATE, config.MODERATION_INBOX_PER)
+        self._task: Optional[asyncio.Task] = None
+        # submission_id -> span обработчика, поставившего скриншот в очередь (для трассировки)
+        self._origins: Dict[int, tracing.Span] = {}
+
+    def start(self):
+        """Запускает фоновую отправку и ставит в очередь скриншоты, не опубликованные до перезапуска."""
+        if self._task and not self._task.done():
+            return
+
+        for submission_id in database.get_unposted_pending_submissions(self.guild_id):
+            self.queue.put_nowait(submission_id)
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        """Останавливает фоновую отправку (например, при смене канала модерации)."""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def submit(self, submission_id: int):
+        """Ставит новый скриншот в очередь публикации."""
+        origin = tracing.current()
+        if origin is not None:
+            self._origins[submission_id] = origin
+        self.queue.put_nowait(submission_id)
+
+    async def _get_channel(self):
+        channel = self.bot.get_channel(self.channel_id)
+        if channel is None:
+            channel = await self.bot.fetch_channel(self.channel_id)
+        return channel
+
+    async def _collect_batch(self) -> List[int]:
+        """Ждет первый скриншот и добирает следующие в течение окна объединения."""
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + config.MODERATION_INBOX_COALESCE_SECONDS
+
+        while len(batch) < MAX_CARDS_PER_MESSAGE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    def _render(self, submission_ids: List[int]):
+        """
+        Возвращает (submissions, embeds, files, view) для сообщения с карточками указанных скриншотов.
+        Превью прикладываются заново и при редактировании, чтобы имена вложений совпадали с embed.
+        """
+        submissions = []
+        embeds = []
+        files = []
+        for submission_id in submission_ids:
+            submission = database.get_submission_by_id(submission_id)
+            if not submission:
+                continue
+            submissions.append(submission)
+            player = database.get_player(submission.guild_id, submission.discord_id)
+            embed, card_files = build_card(submission, player)
+            embeds.append(embed)
+            files.extend(card_files)
+
+        return submissions, embeds, files, self.view_factory(submissions)
+
+    async def _run(self):
+        while True:
+            batch = await self._collect_batch()
+            waited = time.monotonic()
+            await self.limiter.acquire()
+            waited = time.monotonic() - waited
+
+            # Пока ждали лимит, могли прийти еще скриншоты - добираем их в то же сообщение
+            while len(batch) < MAX_CARDS_PER_MESSAGE and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            # Публикация продолжает трассу приема первого скриншота и ссылается на остальные
+            origins = [self._origins.pop(i) for i in batch if i in self._origins]
+            with tracing.span("inbox.post", tracing.CONSUMER, root=True,
+                              parent=origins[0] if origins else None, links=origins[1:],
+                              guild_id=self.guild_id, cards=len(batch),
+                              rate_limit_wait_ms=round(waited * 1000, 1)):
+                try:
+                    submissions, embeds, files, view = self._render(batch)
+                    if not submissions:
+                        continue
+
+                    channel = await self._get_channel()
+                    message = await channel.send(embeds=embeds, files=files, view=view)
+                    database.save_moderation_cards(channel.id, message.id, [s.submission_id for s in submissions])
+                    log.info("Карточки отправлены в канал модерации",
+                             extra={'guild_id': self.guild_id, 'submission_ids': [s.submission_id for s in submissions]})
+                except Exception:
+                    # Неотправленные скриншоты будут поставлены в очередь снова при следующем запуске
+                    log.exception("Ошибка при отправке карточек в канал модерации",
+                                  extra={'guild_id': self.guild_id, 'submission_ids': batch})
+
+    def render_message(self, submission_id: int):
+        """Возвращает (embeds, files, view) для сообщения, в котором опубликована карточка скриншота."""
+        group = database.get_moderation_card_group(submission_id)
+        submission_ids = group[2] if group else [submission_id]
+        _, embeds, files, view = self._render(submission_ids)
+        return embeds, files, view
+
+    async def refresh(self, submission_id: int):
+        """Перерисовывает сообщение с карточкой скриншота после решения модератора."""
+        group = database.get_moderation_card_group(submission_id)
+        if not group:
+            return
+
+        channel_id, message_id, submission_ids = group
+        try:
+            _, embeds, files, view = self._render(submission_ids)
+            await self.limiter.acquire()
+            channel = self.bot.get_channel(channel_id) or await self.bot.fetch_channel(channel_id)
+            await channel.get_partial_message(message_id).edit(embeds=embeds, attachments=files, view=view)
+        except Exception:
+            log.exception("Ошибка при обновлении карточки скриншота", extra={'submission_id': submission_id})
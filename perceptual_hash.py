@@ -0,0 +1,200 @@
+# perceptual_hash.py
+import asyncio
+import math
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import config
+import database
+import storage
+import tracing
+from bot_logging import get_logger
+
+log = get_logger('phash')
+
+try:
+    from PIL import Image
+except ImportError:  # Без Pillow поиск похожих скриншотов отключен
+    Image = None
+
+# pHash: DCT по картинке 32x32, берутся коэффициенты левого верхнего блока 8x8
+PHASH_IMAGE_SIZE = 32
+PHASH_LOW_FREQ = 8
+
+_DCT_COS = [
+    [math.cos((2 * x + 1) * u * math.pi / (2 * PHASH_IMAGE_SIZE)) for x in range(PHASH_IMAGE_SIZE)]
+    for u in range(PHASH_LOW_FREQ)
+]
+
+def compute_phash(path: str) -> Optional[int]:
+    """
+    Считает 64-битный перцептивный хеш (pHash) изображения.
+    Выполняется в отдельном процессе пула, возвращает None, если файл не удалось прочитать.
+    """
+    try:
+        with Image.open(path) as image:
+            image = image.convert('L').resize((PHASH_IMAGE_SIZE, PHASH_IMAGE_SIZE), Image.LANCZOS)
+            pixels = list(image.getdata())
+    except Exception:
+        return None
+
+    size = PHASH_IMAGE_SIZE
+    # Двумерное DCT-II считается раздельно: сначала по строкам, затем по столбцам
+    rows = [
+        [sum(pixels[y * size + x] * _DCT_COS[u][x] for x in range(size)) for u in range(PHASH_LOW_FREQ)]
+        for y in range(size)
+    ]
+    coefficients = [
+        sum(_DCT_COS[v][y] * rows[y][u] for y in range(size))
+        for v in range(PHASH_LOW_FREQ)
+        for u in range(PHASH_LOW_FREQ)
+    ]
+
+    median = sorted(coefficients)[len(coefficients) // 2]
+    phash = 0
+    for coefficient in coefficients:
+        phash = (phash << 1) | (1 if coefficient > median else 0)
+    return phash
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+class BKTree:
+    """
+    BK-дерево по расстоянию Хэмминга: поиск всех хешей в радиусе r
+    обходит только ветви с расстоянием до узла в диапазоне [d - r, d + r].
+    Узел - список [hash, items, children].
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, phash: int, item):
+        self.size += 1
+        if self.root is None:
+            self.root = [phash, [item], {}]
+            return
+
+        node = self.root
+        while True:
+            distance = hamming_distance(phash, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [phash, [item], {}]
+                return
+            node = child
+
+    def search(self, phash: int, max_distance: int) -> List[Tuple[int, object]]:
+        """Возвращает [(distance, item)] для всех хешей на расстоянии не больше max_distance."""
+        if self.root is None:
+            return []
+
+        results = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(phash, node[0])
+            if distance <= max_distance:
+                results.extend((distance, item) for item in node[1])
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+
+        results.sort(key=lambda result: result[0])
+        return results
+
+class PerceptualIndex:
+    """
+    Индекс похожих скриншотов по серверам.
+    Хеши считаются в пуле процессов и хранятся в screenshot_files (event_data.db);
+    BK-дерево сервера строится из базы при первом обращении и дальше пополняется на лету.
+    """
+
+    def __init__(self, workers: int):
+        self.enabled = Image is not None
+        self._workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._trees: Dict[int, BKTree] = {}
+        self._tasks = set()
+        if not self.enabled:
+            log.warning("Pillow не установлен - поиск похожих скриншотов отключен")
+
+    @property
+    def pending(self) -> int:
+        """Сколько скриншотов ждут расчета хеша."""
+        return len(self._tasks)
+
+    def _get_tree(self, guild_id: int) -> BKTree:
+        tree = self._trees.get(guild_id)
+        if tree is None:
+            tree = BKTree()
+            for submission_id, player_id, phash in database.get_guild_perceptual_hashes(guild_id):
+                tree.add(phash, (submission_id, player_id))
+            self._trees[guild_id] = tree
+        return tree
+
+    def schedule(self, submission_id: int, guild_id: int, player_id: int, archived: dict):
+        """Ставит расчет хеша нового скриншота в фон (ответ игроку его не ждет)."""
+        if not self.enabled:
+            return
+        task = asyncio.create_task(self._index_submission(submission_id, guild_id, player_id, archived))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _index_submission(self, submission_id: int, guild_id: int, player_id: int, archived: dict):
+        try:
+            stored = database.get_screenshot_file(archived['sha256'])
+            phash = stored.phash if stored else None
+
+            # Хеш файла считается один раз, повторная отправка того же файла его переиспользует
+            if phash is None:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self._workers)
+                loop = asyncio.get_running_loop()
+                with tracing.span("phash.compute", submission_id=submission_id):
+                    phash = await loop.run_in_executor(self._pool, compute_phash, archived['path'])
+                if phash is None:
+                    log.warning("Не удалось посчитать перцептивный хеш", extra={'submission_id': submission_id})
+                    return
+                database.save_perceptual_hash(archived['sha256'], phash)
+
+            # Если дерево сервера еще не загружено, хеш попадет в него при загрузке из базы
+            tree = self._trees.get(guild_id)
+            if tree is not None:
+                tree.add(phash, (submission_id, player_id))
+        except Exception:
+            log.exception("Ошибка при индексации скриншота", extra={'submission_id': submission_id})
+
+    def find_similar(self, submission: storage.Submission) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int, int]]]:
+        """
+        Ищет похожие скриншоты того же сервера.
+        Возвращает (same_player, other_players): [(distance, submission_id)] и [(distance, submission_id, player_id)],
+        не более config.PHASH_MAX_MATCHES в каждом списке.
+        """
+        if not self.enabled or not submission.file_sha256:
+            return [], []
+
+        stored = database.get_screenshot_file(submission.file_sha256)
+        if not stored or stored.phash is None:
+            return [], []
+
+        same_player = []
+        other_players = []
+        for distance, (submission_id, player_id) in self._get_tree(submission.guild_id).search(
+                stored.phash, config.PHASH_MAX_DISTANCE):
+            if submission_id == submission.submission_id:
+                continue
+            if player_id == submission.discord_id:
+                same_player.append((distance, submission_id))
+            else:
+                other_players.append((distance, submission_id, player_id))
+
+        return same_player[:config.PHASH_MAX_MATCHES], other_players[:config.PHASH_MAX_MATCHES]
+
+    def forget_guild(self, guild_id: int):
+        """Сбрасывает дерево сервера (например, после сброса статистики)."""
+        self._trees.pop(guild_id, None)
@@ -0,0 +1,206 @@
+# query_log.py
+import json
+import logging
+import logging.handlers
+import sqlite3
+import sys
+import time
+import weakref
+from typing import List, Optional
+
+import config
+import metrics
+from bot_logging import queued
+
+# Операции плана запроса, означающие полный просмотр таблицы (без индекса)
+FULL_SCAN_PREFIX = "SCAN "
+INDEXED_SCAN_MARKERS = ("USING INDEX", "USING COVERING INDEX", "USING INTEGER PRIMARY KEY")
+
+# Выражения, для которых EXPLAIN QUERY PLAN не имеет смысла
+_NO_PLAN_PREFIXES = ("CREATE", "ALTER", "DROP", "PRAGMA", "BEGIN", "COMMIT", "ROLLBACK", "EXPLAIN")
+
+_logger: Optional[logging.Logger] = None
+
+def _get_logger() -> logging.Logger:
+    """Отдельный логгер с ротацией файла для медленных запросов (строка JSON на запрос)."""
+    global _logger
+    if _logger is None:
+        _logger = logging.getLogger('photoevent.slow_queries')
+        _logger.setLevel(logging.INFO)
+        _logger.propagate = False
+        handler = logging.handlers.RotatingFileHandler(
+            config.SLOW_QUERY_LOG_FILE,
+            maxBytes=config.SLOW_QUERY_LOG_MAX_BYTES,
+            backupCount=config.SLOW_QUERY_LOG_BACKUPS,
+            encoding='utf-8'
+        )
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        # Запись в файл идет в фоновом потоке, как и остальной журнал бота
+        _logger.addHandler(queued(handler))
+    return _logger
+
+def explain(conn: sqlite3.Connection, sql: str, parameters=()) -> List[str]:
+    """Возвращает строки EXPLAIN QUERY PLAN для запроса (пустой список для DDL и служебных команд)."""
+    if sql.lstrip().upper().startswith(_NO_PLAN_PREFIXES):
+        return []
+    # Обычный курсор, чтобы план не попадал в собственный журнал
+    cursor = sqlite3.Cursor(conn)
+    try:
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, parameters)
+        return [row[3] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+def full_scans(plan: List[str]) -> List[str]:
+    """Шаги плана, которые просматривают таблицу целиком, например "SCAN submissions"."""
+    return [
+        step for step in plan
+        if step.startswith(FULL_SCAN_PREFIX) and not any(marker in step for marker in INDEXED_SCAN_MARKERS)
+    ]
+
+def _caller() -> str:
+    """Имя функции database.py, выполнившей запрос (ищется только для медленных запросов)."""
+    frame = sys._getframe(1)
+    while frame:
+        if frame.f_globals.get('__name__') == 'database':
+            return frame.f_code.co_name
+        frame = frame.f_back
+    return '?'
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Курсор, замеряющий каждое выражение: время выполнения вместе с чтением строк,
+    число возвращенных строк и число шагов виртуальной машины SQLite (оценка объема
+    просмотренных данных). Итог по выражению подводится при следующем execute или закрытии.
+    """
+
+    def __init__(self, connection):
+        super().__init__(connection)
+        self._sql = None
+        self._parameters = ()
+        self._elapsed = 0.0
+        self._rows = 0
+        self._ticks_start = 0
+
+    def _begin(self, sql: str, parameters):
+        self._finish()
+        conn = self.connection
+        self._sql = sql
+        self._parameters = parameters
+        self._elapsed = 0.0
+        self._rows = 0
+        self._ticks_start = conn._ticks
+        conn._statement_started = time.perf_counter()
+        conn._statement_is_read = sql.lstrip().upper().startswith(("SELECT", "WITH"))
+
+    def _finish(self):
+        if self._sql is None:
+            return
+        sql, self._sql = self._sql, None
+        conn = self.connection
+        conn._statement_is_read = False
+        conn._on_statement(sql, self._parameters, self._elapsed, self._rows,
+                           (conn._ticks - self._ticks_start) * config.QUERY_PROGRESS_STEPS)
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._elapsed += time.perf_counter() - started
+
+    def execute(self, sql, parameters=()):
+        self._begin(sql, parameters)
+        self._timed(super().execute, sql, parameters)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        # Для EXPLAIN QUERY PLAN достаточно первого набора параметров
+        seq_of_parameters = list(seq_of_parameters)
+        self._begin(sql, seq_of_parameters[0] if seq_of_parameters else ())
+        self._timed(super().executemany, sql, seq_of_parameters)
+        return self
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is not None:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, size if size is not None else self.arraysize)
+        self._rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._rows += len(rows)
+        return rows
+
+    def __next__(self):
+        row = self._timed(super().__next__)
+        self._rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+class InstrumentedConnection(sqlite3.Connection):
+    """
+    Соединение, через которое database.py работает при включенном журнале медленных запросов.
+    Обработчик прогресса SQLite считает шаги выражений и прерывает чтение,
+    которое выполняется дольше config.QUERY_MAX_READ_SECONDS.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._ticks = 0
+        self._statement_started = 0.0
+        self._statement_is_read = False
+        self._cursors = weakref.WeakSet()
+        self.set_progress_handler(self._progress, config.QUERY_PROGRESS_STEPS)
+
+    def _progress(self) -> int:
+        self._ticks += 1
+        if self._statement_is_read and config.QUERY_MAX_READ_SECONDS:
+            if time.perf_counter() - self._statement_started > config.QUERY_MAX_READ_SECONDS:
+                metrics.counter("db_aborted_queries_total", "Чтения, прерванные по времени").inc()
+                return 1  # SQLite прерывает выражение с ошибкой "interrupted"
+        return 0
+
+    def cursor(self, factory=InstrumentedCursor):
+        cursor = super().cursor(factory)
+        self._cursors.add(cursor)
+        return cursor
+
+    def _on_statement(self, sql: str, parameters, elapsed: float, rows: int, vm_steps: int):
+        if elapsed * 1000 < config.SLOW_QUERY_THRESHOLD_MS:
+            return
+
+        try:
+            plan = explain(self, sql, parameters)
+        except sqlite3.Error as e:
+            plan = [f"EXPLAIN недоступен: {e}"]
+
+        metrics.counter("db_slow_queries_total", "Выражения дольше порога журнала").inc()
+        _get_logger().info(json.dumps({
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'function': _caller(),
+            'duration_ms': round(elapsed * 1000, 3),
+            'rows_returned': rows,
+            'vm_steps': vm_steps,
+            'full_scans': full_scans(plan),
+            'plan': plan,
+            'sql': ' '.join(sql.split()),
+        }, ensure_ascii=False))
+
+    def close(self):
+        # Подводим итог выражений, курсоры которых не были закрыты явно
+        for cursor in list(self._cursors):
+            cursor._finish()
+        super().close()
+
+def connect(database: str) -> sqlite3.Connection:
+    """Открывает соединение с журналом медленных запросов."""
+    return sqlite3.connect(database, factory=InstrumentedConnection)
@@ -0,0 +1,483 @@
+# replication.py
+# Непрерывная репликация базы текущего ивента: новые кадры WAL копируются в каталог реплики
+# (локальная замена объектного хранилища), а restore собирает базу на любой момент времени.
+#
+#   python replication.py generations
+#   python replication.py restore --output restored.db --time 2025-07-10T18:30:00+03:00
+#
+# Реплика базы: <REPLICA_DIR>/<имя файла базы>/<поколение>/snapshot.db.gz - снимок,
+# с которого начинается поколение, и wal/<цикл WAL>_<смещение>_<время, мс>.gz - сегменты WAL.
+# Цикл WAL - содержимое файла -wal между двумя сбросами при контрольной точке;
+# каждый сегмент заканчивается кадром фиксации транзакции.
+import argparse
+import array
+import datetime
+import glob
+import gzip
+import json
+import os
+import random
+import shutil
+import sqlite3
+import struct
+import sys
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import config
+import database
+import metrics
+from backup import copy_database
+from bot_logging import get_logger
+
+log = get_logger('replication')
+
+WAL_HEADER_SIZE = 32
+WAL_FRAME_HEADER_SIZE = 24
+WAL_MAGIC = (0x377f0682, 0x377f0683)
+
+SNAPSHOT_NAME = "snapshot.db.gz"
+GENERATION_META = "generation.json"
+
+def _checksum(data: bytes, s0: int, s1: int, big_endian: bool) -> Tuple[int, int]:
+    """Контрольная сумма WAL (как walChecksumBytes в SQLite), продолжающая (s0, s1)."""
+    words = array.array('I', data)
+    if big_endian != (sys.byteorder == 'big'):
+        words.byteswap()
+    it = iter(words)
+    for x0 in it:
+        x1 = next(it)
+        s0 = (s0 + x0 + s1) & 0xFFFFFFFF
+        s1 = (s1 + x1 + s0) & 0xFFFFFFFF
+    return s0, s1
+
+def _parse_header(header: bytes) -> Optional[dict]:
+    """Заголовок файла WAL или None, если он еще не записан или поврежден."""
+    if len(header) < WAL_HEADER_SIZE:
+        return None
+    magic, _, page_size, _, salt1, salt2, c1, c2 = struct.unpack('>8I', header[:WAL_HEADER_SIZE])
+    if magic not in WAL_MAGIC:
+        return None
+    big_endian = bool(magic & 1)
+    if _checksum(header[:24], 0, 0, big_endian) != (c1, c2):
+        return None
+    return {'page_size': page_size, 'salt': (salt1, salt2), 'checksum': (c1, c2), 'big_endian': big_endian}
+
+def _committed_frames(data: bytes, header: dict, checksum: Tuple[int, int]):
+    """
+    Проходит по кадрам data (начиная с границы кадра) и возвращает
+    (длина до последнего кадра фиксации, контрольная сумма на нем).
+    Кадр с чужой солью (остаток прошлого цикла) или неверной суммой (еще пишется) завершает проход.
+    """
+    frame_size = WAL_FRAME_HEADER_SIZE + header['page_size']
+    position = 0
+    committed = (0, checksum)
+    while position + frame_size <= len(data):
+        _, commit_size, salt1, salt2, c1, c2 = struct.unpack_from('>6I', data, position)
+        if (salt1, salt2) != header['salt']:
+            break
+        checksum = _checksum(data[position:position + 8], *checksum, header['big_endian'])
+        checksum = _checksum(data[position + WAL_FRAME_HEADER_SIZE:position + frame_size], *checksum,
+                             header['big_endian'])
+        if checksum != (c1, c2):
+            break
+        # Подсчет сумм идет на Python: после каждого кадра GIL отдается циклу событий бота
+        time.sleep(0)
+        position += frame_size
+        if commit_size:
+            committed = (position, checksum)
+    return committed
+
+def _replica_root(db_path: str) -> str:
+    return os.path.join(config.REPLICA_DIR, os.path.basename(db_path))
+
+class WalReplicator:
+    """
+    Копирует кадры WAL базы текущего ивента в реплику раз в interval секунд (в отдельном потоке).
+
+    Свое соединение держит открытую транзакцию чтения, поэтому контрольные точки бота
+    не могут начать WAL заново, пока кадры не скопированы. Когда текущий цикл WAL больше
+    config.REPLICATION_CHECKPOINT_BYTES, репликатор переносит его в базу и начинает заново сам.
+    Если позиция в WAL потеряна (перезапуск бота, сброс WAL в обход репликатора),
+    начинается новое поколение со снимка базы.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.path: Optional[str] = None
+        self.generation: Optional[str] = None
+        self.last_sync: Optional[float] = None
+        self._generation_started = 0.0
+        self._pin: Optional[sqlite3.Connection] = None
+        self._wal_index = 0
+        self._offset = 0
+        self._header: Optional[dict] = None
+        self._checksum = (0, 0)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.shipped_bytes = metrics.counter("replication_shipped_bytes_total", "Байт WAL, скопированных в реплику")
+        self.errors = metrics.counter("replication_errors_total", "Ошибки репликации")
+        metrics.gauge(
+            "replication_lag_seconds", "Сколько секунд назад реплика догоняла базу",
+            lambda: [({}, time.time() - self.last_sync)] if self.last_sync else []
+        )
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='wal-replicator', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Копирует последние кадры и останавливает поток."""
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            if self.generation:
+                self._ship()
+            self._release()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.sync()
+
+    def sync(self):
+        """
+        Копирует новые зафиксированные кадры WAL. Вызывается потоком репликатора и после
+        смены ивента (чтобы дописать последние кадры прошлого файла и отпустить его).
+        """
+        with self._lock:
+            try:
+                self._sync()
+                self.last_sync = time.time()
+            except (sqlite3.Error, OSError):
+                self.errors.inc()
+                log.exception("Ошибка репликации", extra={'path': self.path, 'generation': self.generation})
+                # Позиция могла разойтись с репликой - следующая синхронизация начнет новое поколение
+                self._release()
+                self.generation = None
+
+    def _sync(self):
+        path = database.DATABASE_NAME
+        if path != self.path and self.generation:
+            # Ивент сменился: дописываем последние кадры прошлого файла
+            self._ship()
+        if path != self.path or self.generation is None:
+            if self.path is None:
+                reason = 'start'
+            else:
+                reason = 'new_event' if path != self.path else 'error'
+            self._new_generation(path, reason)
+            return
+
+        # Закрепление переносится на последний снимок, иначе контрольные точки бота
+        # не смогут перенести в базу кадры новее закрепленного
+        self._repin()
+        if not self._ship():
+            self._new_generation(path, 'wal_position_lost')
+            return
+
+        if time.time() - self._generation_started > config.REPLICATION_SNAPSHOT_INTERVAL_SECONDS:
+            self._new_generation(path, 'snapshot_interval')
+        elif self._offset > config.REPLICATION_CHECKPOINT_BYTES:
+            # Размер файла WAL не подходит: после начала нового цикла файл не укорачивается
+            if not self._checkpoint():
+                self._new_generation(path, 'wal_position_lost')
+
+    def _repin(self):
+        """Новая транзакция чтения открывается до закрытия старой, чтобы WAL был закреплен все время."""
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        conn.execute("BEGIN")
+        conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        self._release()
+        self._pin = conn
+
+    def _release(self):
+        if self._pin is not None:
+            self._pin.close()
+            self._pin = None
+
+    def _ship(self, tail: bool = False) -> bool:
+        """
+        Копирует кадры от текущей позиции до последней фиксации. False - позиция в WAL потеряна.
+        tail - докопировать хвост цикла после контрольной точки: файл WAL мог уже начаться
+        заново, но дальше скопированного кадры прошлого цикла еще не затерты.
+        """
+        try:
+            with open(self.path + '-wal', 'rb') as f:
+                raw_header = f.read(WAL_HEADER_SIZE)
+                header = _parse_header(raw_header)
+                if tail:
+                    pass
+                elif header is None:
+                    # Файл WAL пуст или заголовок еще пишется
+                    return self._offset == 0
+                elif self._offset == 0:
+                    self._header = header
+                    self._checksum = header['checksum']
+                elif header['salt'] != self._header['salt']:
+                    if header['salt'][0] != (self._header['salt'][0] + 1) & 0xFFFFFFFF:
+                        return False
+                    # Бот начал WAL заново после своей контрольной точки. Пока WAL закреплен, это
+                    # возможно, только если все кадры прошлого цикла уже перенесены в базу и
+                    # скопированы, и только один раз до следующего закрепления
+                    self._wal_index += 1
+                    self._offset = 0
+                    self._header = header
+                    self._checksum = header['checksum']
+
+                start = max(self._offset, WAL_HEADER_SIZE)
+                f.seek(start)
+                data = f.read()
+        except FileNotFoundError:
+            return self._offset == 0
+
+        length, checksum = _committed_frames(data, self._header, self._checksum)
+        if not length:
+            return True
+
+        # Первый сегмент цикла начинается с заголовка WAL
+        segment = raw_header + data[:length] if self._offset == 0 else data[:length]
+
+        name = f"{self._wal_index:08d}_{self._offset:012d}_{int(time.time() * 1000)}.gz"
+        wal_dir = os.path.join(_replica_root(self.path), self.generation, 'wal')
+        tmp_path = os.path.join(wal_dir, name + '.tmp')
+        with gzip.open(tmp_path, 'wb', compresslevel=config.REPLICATION_COMPRESSLEVEL) as f:
+            f.write(segment)
+        os.replace(tmp_path, os.path.join(wal_dir, name))
+
+        self._offset = start + length
+        self._checksum = checksum
+        self.shipped_bytes.inc(len(segment))
+        return True
+
+    def _checkpoint(self) -> bool:
+        """
+        Переносит WAL в базу и начинает его с начала. False - позиция в WAL потеряна.
+
+        После wal_checkpoint(RESTART) первая же запись начинает WAL сначала, а кадры, которые бот
+        зафиксировал между копированием и контрольной точкой, еще не скопированы. Поэтому сразу
+        после контрольной точки репликатор берет блокировку записи и докопирует хвост прошлого
+        цикла: новый цикл пишется с начала файла и успевает затереть только давно скопированные кадры.
+        """
+        self._ship()
+        if self._offset == 0:
+            return True
+        salt = self._header['salt']
+        frame_size = WAL_FRAME_HEADER_SIZE + self._header['page_size']
+
+        # Соединение открыто до снятия закрепления и закрывается после нового: если оно окажется
+        # последним соединением с базой, SQLite удалит WAL вместе с нескопированными кадрами
+        conn = sqlite3.connect(self.path, timeout=config.REPLICATION_CHECKPOINT_TIMEOUT, isolation_level=None)
+        try:
+            conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            self._release()
+            busy, wal_frames, _ = conn.execute("PRAGMA wal_checkpoint(RESTART)").fetchone()
+            conn.execute(f"PRAGMA busy_timeout = {config.REPLICATION_LOCK_TIMEOUT_MS}")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._ship(tail=True)
+                with open(self.path + '-wal', 'rb') as f:
+                    header = _parse_header(f.read(WAL_HEADER_SIZE))
+                restarted = header is not None and header['salt'] != salt
+                if restarted and (busy or (self._offset - WAL_HEADER_SIZE) // frame_size != wal_frames):
+                    # Бот начал WAL заново, и неизвестно, все ли кадры прошлого цикла уцелели
+                    return False
+                if not busy and not restarted:
+                    # Пустая запись начинает WAL с начала, пока его не начал бот
+                    user_version = conn.execute("PRAGMA user_version").fetchone()[0]
+                    conn.execute(f"PRAGMA user_version = {user_version}")
+                # Закрепление до фиксации: до следующей синхронизации WAL больше не начнется заново
+                self._repin()
+                conn.execute("COMMIT")
+            finally:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+        finally:
+            conn.close()
+
+        with open(self.path + '-wal', 'rb') as f:
+            header = _parse_header(f.read(WAL_HEADER_SIZE))
+        if header is None or header['salt'] == salt:
+            # Читатели не дали начать WAL сначала - он продолжается
+            return True
+        if header['salt'][0] != (salt[0] + 1) & 0xFFFFFFFF:
+            return False
+        self._wal_index += 1
+        self._offset = 0
+        return True
+
+    def _new_generation(self, path: str, reason: str):
+        """Снимок базы, с которого начинается поколение; текущий цикл WAL копируется с начала."""
+        self._release()
+        self.path = path
+        self.generation = f"{datetime.datetime.utcnow():%Y%m%d_%H%M%S}_{random.getrandbits(16):04x}"
+        self._generation_started = time.time()
+        self._wal_index = 0
+        self._offset = 0
+
+        generation_dir = os.path.join(_replica_root(path), self.generation)
+        os.makedirs(os.path.join(generation_dir, 'wal'))
+        # Снимок делается при закрепленном WAL: кадры текущего цикла, уже вошедшие в снимок,
+        # при восстановлении просто запишутся повторно
+        self._repin()
+        snapshot_tmp = os.path.join(generation_dir, 'snapshot.db.tmp')
+        try:
+            copy_database(path, snapshot_tmp)
+            with open(snapshot_tmp, 'rb') as src, gzip.open(snapshot_tmp + '.gz', 'wb',
+                                                           compresslevel=config.REPLICATION_COMPRESSLEVEL) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            os.replace(snapshot_tmp + '.gz', os.path.join(generation_dir, SNAPSHOT_NAME))
+        finally:
+            for tmp_path in (snapshot_tmp, snapshot_tmp + '.gz'):
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+        with open(os.path.join(generation_dir, GENERATION_META), 'w', encoding='utf-8') as f:
+            json.dump({'db': path, 'created_ms': int(self._generation_started * 1000), 'reason': reason}, f)
+        metrics.counter("replication_generations_total", "Новые поколения реплики", reason=reason).inc()
+        log.info("Новое поколение реплики", extra={'path': path, 'generation': self.generation, 'reason': reason})
+
+        self._ship()
+        self._apply_retention(path)
+
+    def _apply_retention(self, path: str):
+        """Удаляет поколения, которые закончились раньше config.REPLICATION_RETENTION_HOURS назад."""
+        generations = list_generations(path)
+        cutoff = (time.time() - config.REPLICATION_RETENTION_HOURS * 3600) * 1000
+        for generation, following in zip(generations, generations[1:]):
+            if following['created_ms'] < cutoff:
+                shutil.rmtree(generation['path'], ignore_errors=True)
+
+def _segments(generation_path: str) -> List[Tuple[int, int, int, str]]:
+    """Сегменты поколения: (цикл WAL, смещение, время копирования в мс, путь) по порядку."""
+    segments = []
+    for path in glob.glob(os.path.join(generation_path, 'wal', '*.gz')):
+        wal_index, offset, shipped_ms = os.path.basename(path)[:-3].split('_')
+        segments.append((int(wal_index), int(offset), int(shipped_ms), path))
+    segments.sort()
+    return segments
+
+def list_generations(db_path: Optional[str] = None) -> List[dict]:
+    """Поколения реплики базы от старых к новым (только со снимком)."""
+    root = _replica_root(db_path or database.DATABASE_NAME)
+    generations = []
+    for meta_path in glob.glob(os.path.join(root, '*', GENERATION_META)):
+        generation_path = os.path.dirname(meta_path)
+        if not os.path.exists(os.path.join(generation_path, SNAPSHOT_NAME)):
+            continue
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        segments = _segments(generation_path)
+        generations.append({
+            'id': os.path.basename(generation_path),
+            'path': generation_path,
+            'created_ms': meta['created_ms'],
+            'reason': meta.get('reason'),
+            'segments': len(segments),
+            'last_ms': max([s[2] for s in segments], default=meta['created_ms'])
+        })
+    generations.sort(key=lambda generation: generation['created_ms'])
+    return generations
+
+def restore(output: str, timestamp: Optional[float] = None, db_path: Optional[str] = None) -> dict:
+    """
+    Собирает базу в файл output на момент timestamp (секунды Unix, None - последнее состояние):
+    снимок последнего поколения, начатого не позже этого момента, и сегменты WAL,
+    скопированные не позже него. Возвращает сведения о восстановлении.
+    """
+    limit_ms = int(timestamp * 1000) if timestamp is not None else None
+    generations = [g for g in list_generations(db_path) if limit_ms is None or g['created_ms'] <= limit_ms]
+    if not generations:
+        raise RuntimeError("в реплике нет поколения, начатого до этого момента")
+    generation = generations[-1]
+
+    tmp_path = output + '.tmp'
+    with gzip.open(os.path.join(generation['path'], SNAPSHOT_NAME), 'rb') as src, open(tmp_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+
+    applied = 0
+    frames = 0
+    last_ms = generation['created_ms']
+    header = None
+    expected = (0, 0)
+    with open(tmp_path, 'r+b') as db:
+        for wal_index, offset, shipped_ms, path in _segments(generation['path']):
+            if limit_ms is not None and shipped_ms > limit_ms:
+                break
+            if (wal_index, offset) != expected and not (wal_index == expected[0] + 1 and offset == 0):
+                # Пропуск в цепочке сегментов - дальше восстанавливать нельзя
+                break
+            with gzip.open(path, 'rb') as f:
+                data = f.read()
+            position = 0
+            if offset == 0:
+                header = _parse_header(data)
+                position = WAL_HEADER_SIZE
+            page_size = header['page_size']
+            frame_size = WAL_FRAME_HEADER_SIZE + page_size
+            while position + frame_size <= len(data):
+                page_number, commit_size = struct.unpack_from('>2I', data, position)
+                db.seek((page_number - 1) * page_size)
+                db.write(data[position + WAL_FRAME_HEADER_SIZE:position + frame_size])
+                if commit_size:
+                    db.truncate(commit_size * page_size)
+                position += frame_size
+                frames += 1
+            applied += 1
+            last_ms = shipped_ms
+            expected = (wal_index, offset + len(data))
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        check = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    finally:
+        conn.close()
+    if check != ['ok']:
+        os.remove(tmp_path)
+        raise RuntimeError(f"восстановленная база не прошла integrity_check: {'; '.join(check[:5])}")
+    os.replace(tmp_path, output)
+
+    return {'generation': generation['id'], 'segments': applied, 'frames': frames, 'as_of_ms': last_ms}
+
+def _parse_time(value: str) -> float:
+    moment = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return moment.timestamp()
+
+def main():
+    parser = argparse.ArgumentParser(description="Реплика WAL базы текущего ивента")
+    parser.add_argument('--db', help="Файл базы (по умолчанию база текущего ивента)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('generations', help="Показать поколения реплики")
+    restore_parser = commands.add_parser('restore', help="Восстановить базу на момент времени")
+    restore_parser.add_argument('--output', required=True, help="Файл восстановленной базы")
+    restore_parser.add_argument('--time', help="Момент в ISO 8601 (без пояса - UTC); по умолчанию последнее состояние")
+    args = parser.parse_args()
+
+    if args.command == 'generations':
+        for generation in list_generations(args.db):
+            created = datetime.datetime.utcfromtimestamp(generation['created_ms'] / 1000)
+            last = datetime.datetime.utcfromtimestamp(generation['last_ms'] / 1000)
+            print(f"{generation['id']}\t{created:%Y-%m-%d %H:%M:%S} - {last:%Y-%m-%d %H:%M:%S} UTC\t"
+                  f"сегментов: {generation['segments']}\t{generation['reason']}")
+        return
+
+    try:
+        result = restore(args.output, _parse_time(args.time) if args.time else None, args.db)
+    except (RuntimeError, ValueError, sqlite3.Error, OSError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    as_of = datetime.datetime.utcfromtimestamp(result['as_of_ms'] / 1000)
+    print(f"{args.output}: поколение {result['generation']}, сегментов {result['segments']}, "
+          f"кадров {result['frames']}, состояние на {as_of.isoformat(' ', 'milliseconds')} UTC")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+# screenshot_archive.py
+import asyncio
+import hashlib
+import os
+import struct
+import uuid
+from typing import List, Optional, Tuple
+
+import aiohttp
+import discord
+
+import config
+import database
+import storage
+from thumbnails import preview_cache
+
+# Размер блока при потоковом скачивании вложения
+CHUNK_SIZE = 64 * 1024
+
+# Маркеры JPEG, после которых идут размеры кадра (SOF0-SOF15, кроме DHT/JPG/DAC)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+def _sniff_jpeg(f) -> Optional[Tuple[int, int]]:
+    """Ищет маркер SOF и возвращает (width, height) JPEG-файла."""
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        while byte == b'\xff':
+            byte = f.read(1)
+        if not byte:
+            return None
+
+        marker = byte[0]
+        if marker == 0xDA:  # Начало данных изображения - размеров уже не будет
+            return None
+
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack('>H', length_bytes)[0]
+
+        if marker in JPEG_SOF_MARKERS:
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            height, width = struct.unpack('>HH', data[1:5])
+            return width, height
+
+        f.seek(length - 2, os.SEEK_CUR)
+        byte = f.read(1)
+        if byte != b'\xff':
+            return None
+
+def sniff_image(path: str) -> Optional[Tuple[str, int, int]]:
+    """
+    Определяет формат изображения по сигнатуре файла (а не по расширению).
+    Возвращает кортеж (format, width, height) или None, если это не PNG/JPEG/GIF/WEBP.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(32)
+
+        if header.startswith(b'\x89PNG\r\n\x1a\n') and header[12:16] == b'IHDR':
+            width, height = struct.unpack('>II', header[16:24])
+            result = ('png', width, height)
+        elif header[:6] in (b'GIF87a', b'GIF89a'):
+            width, height = struct.unpack('<HH', header[6:10])
+            result = ('gif', width, height)
+        elif header[:4] == b'RIFF' and header[8:12] == b'WEBP' and len(header) >= 30:
+            chunk = header[12:16]
+            if chunk == b'VP8 ' and header[23:26] == b'\x9d\x01\x2a':
+                width, height = struct.unpack('<HH', header[26:30])
+                result = ('webp', width & 0x3FFF, height & 0x3FFF)
+            elif chunk == b'VP8L' and header[20] == 0x2F:
+                bits = struct.unpack('<I', header[21:25])[0]
+                result = ('webp', (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1)
+            elif chunk == b'VP8X':
+                width = int.from_bytes(header[24:27], 'little') + 1
+                height = int.from_bytes(header[27:30], 'little') + 1
+                result = ('webp', width, height)
+            else:
+                return None
+        elif header[:2] == b'\xff\xd8':
+            size = _sniff_jpeg(f)
+            if not size:
+                return None
+            result = ('jpg', size[0], size[1])
+        else:
+            return None
+
+    return result if result[1] > 0 and result[2] > 0 else None
+
+class ScreenshotArchive:
+    """
+    Локальный архив скриншотов с адресацией по SHA-256.
+    Вложения скачиваются потоково через пул с ограниченным числом одновременных загрузок,
+    проверяются по сигнатуре и сохраняются как <root>/ab/cd/<sha256>.<format>.
+    """
+
+    def __init__(self, root: str, concurrency: int):
+        self.root = root
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._session: Optional[aiohttp.ClientSession] = None
+        # Сколько вложений сейчас скачивается или ждет своей очереди
+        self.in_flight = 0
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60))
+        return self._session
+
+    async def close(self):
+        if self._session:
+            await self._session.close()
+
+    def path_for(self, sha256: str, image_format: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256[2:4], f"{sha256}.{image_format}")
+
+    async def _download(self, url: str, tmp_path: str) -> Tuple[str, int]:
+        """Скачивает файл во временный путь, считая SHA-256 на лету. Возвращает (sha256, size)."""
+        digest = hashlib.sha256()
+        size = 0
+
+        async with self._semaphore:
+            async with self._get_session().get(url) as response:
+                response.raise_for_status()
+                with open(tmp_path, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        size += len(chunk)
+                        if size > config.ARCHIVE_MAX_FILE_SIZE:
+                            raise ValueError(f"файл больше {config.ARCHIVE_MAX_FILE_SIZE} байт")
+                        digest.update(chunk)
+                        f.write(chunk)
+
+        return digest.hexdigest(), size
+
+    async def archive(self, url: str) -> Optional[dict]:
+        """
+        Сохраняет вложение в архив.
+        Возвращает данные файла (sha256, path, format, width, height, size_bytes)
+        или None, если файл не является изображением. Ошибки загрузки пробрасываются.
+        """
+        tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        tmp_path = os.path.join(tmp_dir, uuid.uuid4().hex)
+
+        self.in_flight += 1
+        try:
+            try:
+                sha256, size = await self._download(url, tmp_path)
+            finally:
+                self.in_flight -= 1
+
+            image = sniff_image(tmp_path)
+            if not image:
+                return None
+            image_format, width, height = image
+
+            path = self.path_for(sha256, image_format)
+            if os.path.exists(path):
+                # Точно такой же файл уже в архиве
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+
+            database.save_screenshot_file(sha256, path, image_format, width, height, size)
+            return {
+                'sha256': sha256,
+                'path': path,
+                'format': image_format,
+                'width': width,
+                'height': height,
+                'size_bytes': size
+            }
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+def image_for_embed(submission: storage.Submission) -> Tuple[str, List[discord.File]]:
+    """
+    Возвращает (url, files) для картинки скриншота в embed.
+    Предпочитается уменьшенное превью, затем оригинал из архива (оба прикладываются
+    к сообщению как attachment://), иначе используется исходная ссылка Discord CDN.
+    """
+    sha256 = submission.file_sha256
+    if sha256:
+        preview = preview_cache.get(sha256)
+        if preview:
+            filename = f"{sha256[:16]}.webp"
+            return f"attachment://{filename}", [discord.File(preview, filename=filename)]
+
+        stored = database.get_screenshot_file(sha256)
+        if stored and os.path.exists(stored.path):
+            # Превью еще не готово или вытеснено из кэша - создаем его для следующих показов
+            preview_cache.schedule(sha256, stored.path)
+            filename = f"{sha256[:16]}.{stored.format}"
+            return f"attachment://{filename}", [discord.File(stored.path, filename=filename)]
+    return submission.screenshot_url, []
+
+def original_link(submission: storage.Submission) -> str:
+    """Ссылка на полноразмерный оригинал скриншота для описания embed."""
+    return f"🔗 [Открыть оригинал]({submission.screenshot_url})"
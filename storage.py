@@ -0,0 +1,347 @@
+# storage.py
+# Интерфейс хранилища бота: все операции с игроками, скриншотами, модерацией и архивом файлов.
+#
+# Реализации:
+#   database.SQLiteStorage            - файл SQLite текущего ивента (бот в работе)
+#   memory_storage.MemoryStorage      - словари в памяти процесса (тесты и нагрузочные прогоны)
+#
+# Хранилище выбирается в config.STORAGE_ENGINE; остальной код вызывает функции database.py
+# с теми же именами, и они передают вызов текущему хранилищу (database.use_storage меняет его).
+# Обе реализации проходят один набор проверок test_storage.py.
+#
+# Игроки, скриншоты, решения модерации и файлы архива возвращаются записями (именованными
+# кортежами ниже), которые строятся прямо из строк результата запроса, без словаря на строку.
+# Значения в записях - в том виде, в каком их отдает SQLite: флаги is_disqualified, is_valid,
+# is_approved и approved - числа 1/0 (is_approved - None, пока скриншот на модерации; approved - None
+# у решения, которое возвращает скриншот на модерацию).
+#
+# Время хранится целым числом миллисекунд Unix (UTC): такие столбцы и индексы компактнее строк,
+# сравниваются как числа, а выборки по диапазону времени идут по индексу. Операции принимают
+# и возвращают datetime в UTC без часового пояса; перевод - to_epoch_ms и from_epoch_ms.
+# Записи хранят миллисекунды (поля *_ms), а datetime создается только при обращении к свойству.
+#
+# Дисквалификация - флаг игрока: скриншоты дисквалифицированного игрока недействительны, но их
+# собственные флаги is_valid не меняются. is_valid в записях скриншотов - действительность с учетом
+# дисквалификации, поэтому снятие дисквалификации возвращает скриншотам прежние флаги.
+#
+# Сводки по часам (hourly_stats) обновляются в тех же операциях записи, что и исходные данные,
+# поэтому статистика по времени читается без просмотра скриншотов и журнала модерации.
+import calendar
+import datetime
+from abc import ABC, abstractmethod
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+EPOCH = datetime.datetime(1970, 1, 1)
+HOUR_MS = 3_600_000
+
+# Статусы скриншота для выборок по статусу: значение is_approved
+SUBMISSION_STATUSES = {'pending': None, 'approved': 1, 'rejected': 0}
+
+def to_epoch_ms(moment: datetime.datetime) -> int:
+    """Момент (UTC без часового пояса) в миллисекундах Unix, как время хранится в хранилище."""
+    return calendar.timegm(moment.timetuple()) * 1000 + moment.microsecond // 1000
+
+def from_epoch_ms(value: int) -> datetime.datetime:
+    """Миллисекунды Unix из хранилища в datetime (UTC без часового пояса)."""
+    return EPOCH + datetime.timedelta(milliseconds=value)
+
+def hour_bucket(moment: datetime.datetime) -> int:
+    """Начало часа момента moment (UTC без часового пояса) в миллисекундах Unix - ключ сводок по часам."""
+    return to_epoch_ms(moment) // HOUR_MS * HOUR_MS
+
+class Player(NamedTuple):
+    """Игрок на сервере."""
+    discord_id: int
+    static_id: str
+    nickname: str
+    registration_ms: int
+    is_disqualified: int
+    guild_id: int
+
+    @property
+    def registration_time(self) -> datetime.datetime:
+        return from_epoch_ms(self.registration_ms)
+
+class Submission(NamedTuple):
+    """Скриншот. discord_id - ID игрока, duplicate_of - первый скриншот сервера с тем же файлом."""
+    submission_id: int
+    discord_id: int
+    guild_id: int
+    screenshot_url: str
+    submission_ms: int
+    is_valid: int
+    is_approved: Optional[int]
+    file_sha256: Optional[str]
+    duplicate_of: Optional[int]
+
+    @property
+    def submission_time(self) -> datetime.datetime:
+        return from_epoch_ms(self.submission_ms)
+
+class PlayerSubmission(NamedTuple):
+    """
+    Строка списка скриншотов игрока: только поля, которые показывают профиль и выбор скриншота.
+    seq - личный номер скриншота игрока на сервере (1-й, 2-й, 3-й и т.д.).
+    """
+    submission_id: int
+    screenshot_url: str
+    submission_ms: int
+    is_valid: int
+    is_approved: Optional[int]
+    seq: int
+
+    @property
+    def submission_time(self) -> datetime.datetime:
+        return from_epoch_ms(self.submission_ms)
+
+class ModerationDecision(NamedTuple):
+    """
+    Решение модерации из журнала (moderator_id - None, если решение принято не модератором;
+    approved - None, если скриншот возвращен на модерацию).
+    """
+    moderator_id: Optional[int]
+    approved: Optional[int]
+    reason: Optional[str]
+    decided_ms: int
+
+    @property
+    def decided_at(self) -> datetime.datetime:
+        return from_epoch_ms(self.decided_ms)
+
+class ScreenshotFile(NamedTuple):
+    """Файл локального архива скриншотов (phash - 64-битный перцептивный хеш без знака или None)."""
+    sha256: str
+    path: str
+    format: str
+    width: int
+    height: int
+    size_bytes: int
+    phash: Optional[int]
+
+class Storage(ABC):
+    """Операции хранилища. approve_screenshot и reject_screenshot общие для всех реализаций."""
+
+    @abstractmethod
+    def setup_database(self):
+        """Создает структуру хранилища, если ее еще нет (повторный вызов ничего не меняет)."""
+
+    @abstractmethod
+    def get_guild_settings(self, guild_id: int) -> dict:
+        """
+        Настройки ивента сервера: guild_id, event_start_time, event_end_time, moderation_channel_id.
+        Незаданные поля берутся из config.py (канал модерации по умолчанию - только для config.GUILD_ID).
+        """
+
+    @abstractmethod
+    def update_guild_settings(self, guild_id: int, event_start_time: Optional[str] = None,
+                              event_end_time: Optional[str] = None,
+                              moderation_channel_id: Optional[int] = None) -> bool:
+        """Сохраняет настройки ивента сервера. Переданные None поля не изменяются."""
+
+    @abstractmethod
+    def register_player(self, guild_id: int, discord_id: int, static_id: str, nickname: str) -> bool:
+        """Регистрирует игрока на сервере. False, если игрок уже зарегистрирован на этом сервере."""
+
+    @abstractmethod
+    def get_player(self, guild_id: int, discord_id: int) -> Optional[Player]:
+        """Игрок на сервере. None, если игрок не зарегистрирован."""
+
+    @abstractmethod
+    def get_player_guilds(self, discord_id: int) -> List[int]:
+        """ID серверов, на которых зарегистрирован игрок; последняя регистрация идет первой."""
+
+    @abstractmethod
+    def list_players(self, guild_id: Optional[int] = None) -> List[Tuple[Player, int]]:
+        """
+        Игроки сервера (None - всех серверов) по порядку guild_id, discord_id:
+        кортежи (игрок, число действительных скриншотов игрока).
+        """
+
+    @abstractmethod
+    def add_submission(self, guild_id: int, player_id: int, screenshot_url: str,
+                       file_sha256: Optional[str] = None) -> Optional[int]:
+        """
+        Добавляет скриншот на модерацию и возвращает его ID (ID не повторяются, в том числе
+        между ивентами). Если файл с таким SHA-256 уже отправлялся на этом сервере, скриншот
+        помечается как дубликат первого такого скриншота (duplicate_of). None при ошибке.
+        """
+
+    @abstractmethod
+    def get_player_submissions(self, guild_id: int, discord_id: int) -> List[PlayerSubmission]:
+        """Все скриншоты игрока на сервере, новые первыми (по убыванию seq)."""
+
+    @abstractmethod
+    def get_player_submissions_page(self, guild_id: int, discord_id: int, status: Optional[str] = None,
+                                    before_seq: Optional[int] = None, limit: int = 25) -> List[PlayerSubmission]:
+        """
+        Страница скриншотов игрока на сервере, новые первыми: не больше limit скриншотов с seq
+        меньше before_seq (None - с самого нового). status - 'pending', 'approved' или 'rejected'
+        (None - все). Следующая страница начинается с before_seq = seq последнего скриншота.
+        """
+
+    @abstractmethod
+    def get_player_submission_counts(self, guild_id: int, discord_id: int) -> Dict[str, int]:
+        """Число скриншотов игрока на сервере по статусам: ключи 'pending', 'approved' и 'rejected'."""
+
+    @abstractmethod
+    def get_leaderboard(self, guild_id: int) -> List[Tuple[int, str, int]]:
+        """
+        Недисквалифицированные игроки сервера по убыванию числа действительных скриншотов:
+        кортежи (discord_id, nickname, screenshot_count).
+        """
+
+    @abstractmethod
+    def get_all_players_stats(self, guild_id: int) -> int:
+        """Число зарегистрированных игроков сервера."""
+
+    @abstractmethod
+    def disqualify_player(self, guild_id: int, discord_id: int) -> bool:
+        """
+        Дисквалифицирует игрока на сервере: все его скриншоты считаются недействительными.
+        Меняется только строка игрока.
+        """
+
+    @abstractmethod
+    def cancel_disqualification(self, guild_id: int, discord_id: int) -> bool:
+        """
+        Снимает дисквалификацию: скриншоты игрока на сервере снова действительны, кроме
+        отмеченных недействительными по отдельности.
+        """
+
+    @abstractmethod
+    def is_player_disqualified(self, guild_id: int, discord_id: int) -> bool:
+        """Дисквалифицирован ли игрок на сервере (False для незарегистрированного)."""
+
+    @abstractmethod
+    def record_moderation_decisions(self, decisions: List[Tuple[int, Optional[bool], Optional[int], Optional[str]]]
+                                    ) -> int:
+        """
+        Применяет решения модерации (submission_id, approved, moderator_id, reason) одной транзакцией:
+        записывает их в журнал модерации и обновляет статус скриншотов. approved None возвращает
+        скриншот на модерацию. Решения по несуществующим скриншотам пропускаются.
+        Возвращает число примененных решений.
+        """
+
+    def approve_screenshot(self, submission_id: int, moderator_id: Optional[int] = None) -> bool:
+        """Одобряет скриншот (is_approved = TRUE) и записывает решение в журнал модерации."""
+        return self.record_moderation_decisions([(submission_id, True, moderator_id, None)]) > 0
+
+    def reject_screenshot(self, submission_id: int, moderator_id: Optional[int] = None,
+                          reason: Optional[str] = None) -> bool:
+        """Отклоняет скриншот (is_approved = FALSE) и записывает решение с причиной в журнал модерации."""
+        return self.record_moderation_decisions([(submission_id, False, moderator_id, reason)]) > 0
+
+    @abstractmethod
+    def get_moderation_history(self, submission_id: int) -> List[ModerationDecision]:
+        """Решения модерации по скриншоту от первого к последнему."""
+
+    @abstractmethod
+    def get_moderation_log(self, guild_id: Optional[int] = None) -> List[Tuple[int, Optional[int], int]]:
+        """
+        Журнал модерации сервера (None - всех серверов) в порядке записи:
+        (submission_id, approved, decided_ms) - время решения в миллисекундах Unix.
+        """
+
+    @abstractmethod
+    def reopen_unmoderated_rejections(self) -> int:
+        """
+        Возвращает на модерацию отклоненные скриншоты, по которым в журнале модерации нет решений
+        (их статус выставлен не модератором). Возвращает число таких скриншотов.
+        """
+
+    @abstractmethod
+    def get_approved_screenshots_stats(self, guild_id: int) -> List[Tuple[int, str, str, int]]:
+        """
+        Недисквалифицированные игроки сервера с одобренными действительными скриншотами, по убыванию
+        их числа: кортежи (discord_id, nickname, static_id, approved_count).
+        """
+
+    @abstractmethod
+    def get_submission_by_id(self, submission_id: int) -> Optional[Submission]:
+        """Скриншот по ID. None, если скриншота нет."""
+
+    @abstractmethod
+    def get_leaderboard_by_approved(self, guild_id: int) -> List[Tuple[int, str, int, int]]:
+        """
+        Недисквалифицированные игроки сервера с действительными скриншотами по убыванию числа
+        одобренных, затем всех действительных: кортежи (discord_id, nickname, total_screenshots, approved_count).
+        """
+
+    @abstractmethod
+    def get_player_screenshot_number(self, discord_id: int, submission_id: int) -> int:
+        """
+        Личный номер скриншота игрока (1-й, 2-й, 3-й и т.д.) на сервере этого скриншота:
+        номер по порядку отправки, который скриншот получает при добавлении (seq).
+        """
+
+    @abstractmethod
+    def get_hourly_stats(self, guild_id: int, since: datetime.datetime) -> Tuple[int, List[dict]]:
+        """
+        Сводки сервера по часам начиная с часа момента since: очередь модерации на начало периода
+        и строки только за часы с событиями, по возрастанию hour. Поля строки: hour (начало часа), submissions,
+        approved, rejected (решения модерации), moderated (скриншоты, впервые получившие решение),
+        registrations и pending - скриншоты без решения на конец часа.
+        """
+
+    @abstractmethod
+    def rebuild_hourly_stats(self):
+        """
+        Пересчитывает сводки по часам из игроков, скриншотов и журнала модерации
+        (после массовой загрузки или восстановления статусов в обход операций хранилища).
+        Скриншот уходит из очереди в час первого решения в журнале после последнего возврата
+        на модерацию (без таких решений - в час отправки).
+        """
+
+    @abstractmethod
+    def number_submissions(self) -> int:
+        """
+        Выдает личные номера скриншотам, загруженным без номера в обход add_submission (массовая
+        загрузка), продолжая нумерацию игрока на сервере. Возвращает число пронумерованных скриншотов.
+        """
+
+    @abstractmethod
+    def reset_all_statistics(self, guild_id: int) -> bool:
+        """Удаляет игроков, скриншоты, карточки, журнал модерации и сводки сервера в текущем ивенте."""
+
+    @abstractmethod
+    def start_new_event(self, guild_id: int) -> Optional[str]:
+        """
+        Начинает новый ивент сервера: данные сервера остаются в прошлом ивенте, настройки серверов
+        и данные других серверов переносятся, нумерация скриншотов продолжается.
+        Возвращает имя прошлого ивента (у SQLite - путь к файлу для архивации) или None при ошибке.
+        """
+
+    @abstractmethod
+    def save_moderation_cards(self, channel_id: int, message_id: int, submission_ids: List[int]) -> bool:
+        """Запоминает, в каком сообщении канала модерации опубликованы карточки скриншотов."""
+
+    @abstractmethod
+    def get_moderation_card_group(self, submission_id: int) -> Optional[Tuple[int, int, List[int]]]:
+        """
+        Сообщение канала модерации с карточкой скриншота:
+        (channel_id, message_id, [submission_id всех карточек сообщения по возрастанию]) или None.
+        """
+
+    @abstractmethod
+    def get_unposted_pending_submissions(self, guild_id: int) -> List[int]:
+        """ID действительных скриншотов сервера на модерации без карточки в канале модерации, по возрастанию."""
+
+    @abstractmethod
+    def save_screenshot_file(self, sha256: str, path: str, image_format: str, width: int, height: int,
+                             size_bytes: int) -> bool:
+        """Запоминает файл локального архива скриншотов (повторное сохранение того же файла игнорируется)."""
+
+    @abstractmethod
+    def get_screenshot_file(self, sha256: str) -> Optional[ScreenshotFile]:
+        """Файл архива по SHA-256 (или None)."""
+
+    @abstractmethod
+    def save_perceptual_hash(self, sha256: str, phash: int) -> bool:
+        """Сохраняет 64-битный перцептивный хеш (беззнаковый) файла архива."""
+
+    @abstractmethod
+    def get_guild_perceptual_hashes(self, guild_id: int) -> List[Tuple[int, int, int]]:
+        """Перцептивные хеши скриншотов сервера: кортежи (submission_id, player_id, phash) в любом порядке."""
+
+# Имена операций в порядке объявления (функции database.py с теми же именами)
+OPERATIONS = [name for name, value in vars(Storage).items() if callable(value) and not name.startswith('_')]
@@ -0,0 +1,40 @@
+# test_backup.py
+# Проверки политики хранения резервных копий (backup.py).
+# Запуск: python -m pytest test_backup.py
+import datetime
+
+import backup
+import config
+
+def _touch(directory, name: str, moment: datetime.datetime) -> str:
+    path = directory / f"{name}_{moment:%Y%m%d_%H%M%S}{backup.BACKUP_SUFFIX}"
+    path.write_bytes(b'')
+    return str(path)
+
+def test_retention_orders_backups_of_different_events_by_time(tmp_path, monkeypatch):
+    """После смены ивента копии новой базы (event_...) новее копий event_data, хотя по имени идут раньше."""
+    monkeypatch.setattr(config, 'BACKUP_DIR', str(tmp_path))
+    monkeypatch.setattr(config, 'BACKUP_KEEP_RECENT', 3)
+    monkeypatch.setattr(config, 'BACKUP_KEEP_DAILY', 0)
+    start = datetime.datetime(2025, 7, 10, 12)
+    old_event = [_touch(tmp_path, 'event_data', start + datetime.timedelta(hours=n)) for n in range(4)]
+    new_event = [_touch(tmp_path, 'event_20250710_160000', start + datetime.timedelta(hours=4 + n))
+                 for n in range(4)]
+
+    assert backup.list_backups() == old_event + new_event
+    removed = backup.apply_retention(now=start + datetime.timedelta(hours=8))
+    assert sorted(removed) == sorted(old_event + new_event[:1])
+    assert backup.list_backups() == new_event[1:]
+
+def test_retention_keeps_latest_copy_of_each_day(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'BACKUP_DIR', str(tmp_path))
+    monkeypatch.setattr(config, 'BACKUP_KEEP_RECENT', 1)
+    monkeypatch.setattr(config, 'BACKUP_KEEP_DAILY', 3)
+    day = datetime.datetime(2025, 7, 10)
+    evening_old = _touch(tmp_path, 'event_data', day + datetime.timedelta(hours=20))
+    morning_new = _touch(tmp_path, 'event_20250710_150000', day + datetime.timedelta(hours=9))
+    latest = _touch(tmp_path, 'event_20250710_150000', day + datetime.timedelta(days=1, hours=9))
+
+    backup.apply_retention(now=day + datetime.timedelta(days=1, hours=10))
+    assert backup.list_backups() == [evening_old, latest]
+    assert morning_new not in backup.list_backups()
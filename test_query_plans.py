@@ -0,0 +1,150 @@
+# test_query_plans.py
+# Проверка планов запросов database.py: ни один запрос не должен просматривать таблицу целиком.
+# Запуск: python -m pytest test_query_plans.py или python test_query_plans.py
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+
+import config
+import database
+import query_log
+
+GUILD_ID = 1
+OTHER_GUILD_ID = 2
+PLAYERS = 40
+SUBMISSIONS_PER_PLAYER = 5
+
+class _Capture(logging.Handler):
+    """Собирает записи журнала медленных запросов."""
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(json.loads(record.getMessage()))
+
+def _fill_database():
+    """Заполняет базу синтетическими игроками и скриншотами двух серверов."""
+    database.setup_database()
+    for guild_id in (GUILD_ID, OTHER_GUILD_ID):
+        for player in range(PLAYERS):
+            discord_id = 10_000 + player
+            database.register_player(guild_id, discord_id, f"static{player}", f"player{player}")
+            for number in range(SUBMISSIONS_PER_PLAYER):
+                sha256 = f"{guild_id:02x}{player:08x}{number:054x}"
+                submission_id = database.add_submission(guild_id, discord_id, f"https://cdn/{sha256}", sha256)
+                if number % 3 == 0:
+                    database.approve_screenshot(submission_id)
+                elif number % 3 == 1:
+                    database.reject_screenshot(submission_id)
+                database.save_screenshot_file(sha256, f"/archive/{sha256}.png", 'png', 100, 100, 1000)
+                database.save_perceptual_hash(sha256, number)
+
+def _exercise_queries():
+    """Вызывает все функции database.py, которые использует бот."""
+    discord_id = 10_000
+    database.get_guild_settings(GUILD_ID)
+    database.update_guild_settings(GUILD_ID, moderation_channel_id=1)
+    database.get_player(GUILD_ID, discord_id)
+    database.get_player_guilds(discord_id)
+    database.list_players(GUILD_ID)
+    submission_id = database.add_submission(GUILD_ID, discord_id, "https://cdn/new", "ff" * 32)
+    database.get_player_submissions(GUILD_ID, discord_id)
+    database.get_player_submissions_page(GUILD_ID, discord_id, before_seq=3)
+    database.get_player_submissions_page(GUILD_ID, discord_id, 'pending')
+    database.get_player_submission_counts(GUILD_ID, discord_id)
+    database.get_leaderboard(GUILD_ID)
+    database.get_leaderboard_by_approved(GUILD_ID)
+    database.get_all_players_stats(GUILD_ID)
+    database.get_approved_screenshots_stats(GUILD_ID)
+    database.disqualify_player(GUILD_ID, discord_id + 1)
+    database.cancel_disqualification(GUILD_ID, discord_id + 1)
+    database.is_player_disqualified(GUILD_ID, discord_id)
+    database.approve_screenshot(submission_id, discord_id)
+    database.reject_screenshot(submission_id, discord_id, "причина")
+    database.record_moderation_decisions([(submission_id, True, discord_id, None), (submission_id - 1, False, None, None)])
+    database.get_moderation_history(submission_id)
+    database.get_submission_by_id(submission_id)
+    database.get_player_screenshot_number(discord_id, submission_id)
+    database.save_moderation_cards(1, 2, [submission_id])
+    database.get_moderation_card_group(submission_id)
+    database.get_unposted_pending_submissions(GUILD_ID)
+    database.get_screenshot_file("ff" * 32)
+    database.get_guild_perceptual_hashes(GUILD_ID)
+    database.get_hourly_stats(GUILD_ID, datetime.datetime(2025, 1, 1))
+    database.reset_all_statistics(OTHER_GUILD_ID)
+
+def _with_query_log(function):
+    """Выполняет function на временной базе с журналом всех запросов (порог 0 мс)."""
+    saved = (database.DATABASE_NAME, config.SLOW_QUERY_LOG_ENABLED, config.SLOW_QUERY_THRESHOLD_MS,
+             config.SLOW_QUERY_LOG_FILE)
+    capture = _Capture()
+    logger = logging.getLogger('photoevent.slow_queries')
+    previous_storage = database.use_storage(database.SQLiteStorage())
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database.DATABASE_NAME = os.path.join(tmp_dir, 'test.db')
+        config.SLOW_QUERY_LOG_ENABLED = True
+        config.SLOW_QUERY_LOG_FILE = os.path.join(tmp_dir, 'slow_queries.log')
+        try:
+            config.SLOW_QUERY_THRESHOLD_MS = 1_000_000
+            _fill_database()
+
+            config.SLOW_QUERY_THRESHOLD_MS = 0
+            logger.addHandler(capture)
+            function()
+        finally:
+            logger.removeHandler(capture)
+            for handler in list(logger.handlers):
+                handler.close()
+                logger.removeHandler(handler)
+            query_log._logger = None
+            database.use_storage(previous_storage)
+            (database.DATABASE_NAME, config.SLOW_QUERY_LOG_ENABLED, config.SLOW_QUERY_THRESHOLD_MS,
+             config.SLOW_QUERY_LOG_FILE) = saved
+
+    return capture.records
+
+def test_queries_do_not_scan_tables():
+    records = _with_query_log(_exercise_queries)
+    called = {record['function'] for record in records}
+    assert 'get_leaderboard_by_approved' in called
+    assert 'get_player_screenshot_number' in called
+
+    scans = [(record['function'], record['full_scans'], record['sql']) for record in records if record['full_scans']]
+    assert not scans, "Полный просмотр таблиц:\n" + "\n".join(map(str, scans))
+
+def test_rows_are_counted():
+    records = _with_query_log(lambda: database.get_leaderboard(GUILD_ID))
+    leaderboard = [record for record in records if record['function'] == 'get_leaderboard']
+    assert leaderboard and leaderboard[0]['rows_returned'] == PLAYERS
+
+def test_runaway_read_is_aborted():
+    saved = (config.QUERY_MAX_READ_SECONDS, config.SLOW_QUERY_THRESHOLD_MS)
+    config.QUERY_MAX_READ_SECONDS = 0.05
+    config.SLOW_QUERY_THRESHOLD_MS = 1_000_000  # Прерванный запрос не пишем в настоящий журнал
+    conn = query_log.connect(':memory:')
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT count(*) FROM n"
+        )
+        cursor.fetchall()
+        raise AssertionError("бесконечный запрос не был прерван")
+    except sqlite3.OperationalError as e:
+        assert 'interrupt' in str(e)
+    finally:
+        conn.close()
+        config.QUERY_MAX_READ_SECONDS, config.SLOW_QUERY_THRESHOLD_MS = saved
+
+if __name__ == "__main__":
+    for test in (test_queries_do_not_scan_tables, test_rows_are_counted, test_runaway_read_is_aborted):
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e}")
@@ -0,0 +1,516 @@
+# test_storage.py
+# Общие проверки хранилищ (storage.py): SQLite и хранилище в памяти должны вести себя одинаково.
+# Запуск: python -m pytest test_storage.py
+import datetime
+import sqlite3
+import time
+
+import pytest
+
+import config
+import database
+import memory_storage
+import moderation_history
+import storage
+
+GUILD_ID = 1
+OTHER_GUILD_ID = 2
+PLAYER_ID = 10_000
+SHA = "ab" * 32
+
+@pytest.fixture(params=['sqlite', 'memory'])
+def store(request, tmp_path, monkeypatch):
+    """Пустое хранилище; функции database.py на время теста передают вызовы ему."""
+    monkeypatch.setattr(database, 'DATABASE_NAME', str(tmp_path / 'test.db'))
+    monkeypatch.setattr(config, 'EVENTS_DIR', str(tmp_path / 'events'))
+    monkeypatch.setattr(config, 'SLOW_QUERY_LOG_ENABLED', False)
+    engine = database.create_storage(request.param)
+    engine.setup_database()
+    previous = database.use_storage(engine)
+    yield engine
+    database.use_storage(previous)
+
+def _register(store, guild_id=GUILD_ID, players=3):
+    for number in range(players):
+        assert store.register_player(guild_id, PLAYER_ID + number, f"static{number}", f"player{number}")
+
+def test_engines_implement_interface():
+    assert 'list_players' in storage.OPERATIONS and 'approve_screenshot' in storage.OPERATIONS
+    for engine in (database.SQLiteStorage(), memory_storage.MemoryStorage()):
+        assert isinstance(engine, storage.Storage)
+    with pytest.raises(ValueError):
+        database.create_storage('postgres')
+
+def test_module_functions_use_current_storage(store):
+    assert database.register_player(GUILD_ID, PLAYER_ID, "s", "n")
+    assert store.get_player(GUILD_ID, PLAYER_ID).nickname == "n"
+    assert list(database.inspect.signature(database.get_player).parameters) == ['guild_id', 'discord_id']
+
+def test_guild_settings(store):
+    settings = store.get_guild_settings(OTHER_GUILD_ID)
+    assert settings == {'guild_id': OTHER_GUILD_ID, 'event_start_time': config.EVENT_START_TIME,
+                        'event_end_time': config.EVENT_END_TIME, 'moderation_channel_id': None}
+
+    assert store.update_guild_settings(OTHER_GUILD_ID, event_start_time="2030-01-01T00:00:00")
+    assert store.update_guild_settings(OTHER_GUILD_ID, moderation_channel_id=77)
+    settings = store.get_guild_settings(OTHER_GUILD_ID)
+    assert settings['event_start_time'] == "2030-01-01T00:00:00"
+    assert settings['event_end_time'] == config.EVENT_END_TIME
+    assert settings['moderation_channel_id'] == 77
+
+def test_players(store):
+    assert store.get_player(GUILD_ID, PLAYER_ID) is None
+    assert store.register_player(GUILD_ID, PLAYER_ID, "123", "Nick")
+    assert not store.register_player(GUILD_ID, PLAYER_ID, "456", "Other")
+    time.sleep(0.002)
+    assert store.register_player(OTHER_GUILD_ID, PLAYER_ID, "789", "Nick2")
+
+    player = store.get_player(GUILD_ID, PLAYER_ID)
+    assert player.static_id == "123" and player.nickname == "Nick" and player.guild_id == GUILD_ID
+    assert player.is_disqualified == 0
+    assert isinstance(player.registration_time, datetime.datetime)
+    assert abs(player.registration_time - datetime.datetime.utcnow()) < datetime.timedelta(minutes=1)
+
+    assert store.get_player_guilds(PLAYER_ID) == [OTHER_GUILD_ID, GUILD_ID]
+    assert store.get_player_guilds(PLAYER_ID + 1) == []
+    assert store.get_all_players_stats(GUILD_ID) == 1
+    assert store.get_all_players_stats(3) == 0
+
+def test_submissions(store):
+    _register(store)
+    first = store.add_submission(GUILD_ID, PLAYER_ID, "https://cdn/1", SHA)
+    time.sleep(0.002)
+    second = store.add_submission(GUILD_ID, PLAYER_ID, "https://cdn/2", SHA)
+    other_guild = store.add_submission(OTHER_GUILD_ID, PLAYER_ID, "https://cdn/3", SHA)
+    assert first < second < other_guild
+
+    submission = store.get_submission_by_id(second)
+    assert submission.discord_id == PLAYER_ID and submission.guild_id == GUILD_ID
+    assert submission.is_valid == 1 and submission.is_approved is None
+    assert submission.file_sha256 == SHA and submission.duplicate_of == first
+    assert store.get_submission_by_id(first).duplicate_of is None
+    assert store.get_submission_by_id(other_guild).duplicate_of is None
+    assert store.get_submission_by_id(10_000) is None
+
+    submissions = store.get_player_submissions(GUILD_ID, PLAYER_ID)
+    assert [s.submission_id for s in submissions] == [second, first]
+    assert submissions[0].is_valid == 1 and submissions[0].is_approved is None
+    assert submissions[0].screenshot_url == "https://cdn/2"
+
+    assert store.get_player_screenshot_number(PLAYER_ID, first) == 1
+    assert store.get_player_screenshot_number(PLAYER_ID, second) == 2
+    assert store.get_player_screenshot_number(PLAYER_ID, other_guild) == 1
+    assert store.get_player_screenshot_number(PLAYER_ID, 10_000) == 1
+
+def test_player_submission_pages(store):
+    _register(store)
+    ids = [store.add_submission(GUILD_ID, PLAYER_ID, f"https://cdn/{n}") for n in range(60)]
+    store.add_submission(OTHER_GUILD_ID, PLAYER_ID, "https://cdn/other")
+    for number, submission_id in enumerate(ids):
+        if number % 3 == 0:
+            store.approve_screenshot(submission_id)
+        elif number % 3 == 1:
+            store.reject_screenshot(submission_id)
+
+    assert [s.seq for s in store.get_player_submissions(GUILD_ID, PLAYER_ID)] == list(range(60, 0, -1))
+    first = store.get_player_submissions_page(GUILD_ID, PLAYER_ID, limit=25)
+    assert [s.submission_id for s in first] == ids[:-26:-1]
+    second = store.get_player_submissions_page(GUILD_ID, PLAYER_ID, before_seq=first[-1].seq, limit=25)
+    assert [s.seq for s in second] == list(range(35, 10, -1))
+    assert [s.seq for s in store.get_player_submissions_page(GUILD_ID, PLAYER_ID, before_seq=11)] == list(range(10, 0, -1))
+    assert store.get_player_submissions_page(GUILD_ID, PLAYER_ID, before_seq=1) == []
+
+    pending = store.get_player_submissions_page(GUILD_ID, PLAYER_ID, 'pending', limit=5)
+    assert [s.seq for s in pending] == [60, 57, 54, 51, 48] and all(s.is_approved is None for s in pending)
+    approved = store.get_player_submissions_page(GUILD_ID, PLAYER_ID, 'approved', before_seq=10)
+    assert [s.seq for s in approved] == [7, 4, 1]
+    assert [s.seq for s in store.get_player_submissions_page(GUILD_ID, PLAYER_ID, 'rejected', limit=2)] == [59, 56]
+
+    assert store.get_player_submission_counts(GUILD_ID, PLAYER_ID) == {'pending': 20, 'approved': 20, 'rejected': 20}
+    assert store.get_player_submission_counts(OTHER_GUILD_ID, PLAYER_ID) == {'pending': 1, 'approved': 0, 'rejected': 0}
+    assert store.get_player_submission_counts(GUILD_ID, PLAYER_ID + 1) == {'pending': 0, 'approved': 0, 'rejected': 0}
+
+def test_moderation(store):
+    _register(store)
+    first = store.add_submission(GUILD_ID, PLAYER_ID, "https://cdn/1")
+    second = store.add_submission(GUILD_ID, PLAYER_ID, "https://cdn/2")
+
+    assert store.approve_screenshot(first, 500)
+    assert not store.approve_screenshot(10_000)
+    assert store.record_moderation_decisions([(second, False, 501, "размыто"), (10_000, True, 501, None),
+                                              (first, False, None, None)]) == 2
+    assert store.get_submission_by_id(first).is_approved == 0
+    assert store.get_submission_by_id(second).is_approved == 0
+
+    history = store.get_moderation_history(first)
+    assert [(h.moderator_id, h.approved, h.reason) for h in history] == [(500, True, None), (None, False, None)]
+    assert isinstance(history[0].decided_at, datetime.datetime)
+    assert store.get_moderation_history(second)[0].reason == "размыто"
+    assert store.get_moderation_history(10_000) == []
+
+    assert store.reject_screenshot(first, 500, "повтор")
+    assert store.approve_screenshot(first, 500)
+    assert store.get_submission_by_id(first).is_approved == 1
+    # Решения модераторов в журнале - статусы не трогаются
+    assert store.reopen_unmoderated_rejections() == 0
+    assert store.get_submission_by_id(second).is_approved == 0
+
+def test_return_to_moderation(store):
+    _register(store)
+    first = store.add_submission(GUILD_ID, PLAYER_ID, "https://cdn/1")
+    second = store.add_submission(GUILD_ID, PLAYER_ID, "https://cdn/2")
+    store.approve_screenshot(first, 500)
+    store.reject_screenshot(second, 500)
+
+    assert store.record_moderation_decisions([(first, None, None, "ошибка")]) == 1
+    assert store.get_submission_by_id(first).is_approved is None
+    assert [h.approved for h in store.get_moderation_history(first)] == [True, None]
+    assert [(entry[0], entry[1]) for entry in store.get_moderation_log(GUILD_ID)] == [
+        (first, True), (second, False), (first, None)
+    ]
+    assert store.get_moderation_log(OTHER_GUILD_ID) == []
+
+    # Сводки: возвращенный скриншот снова в очереди, и пересчет из журнала дает то же самое
+    rows = store.get_hourly_stats(GUILD_ID, storage.EPOCH)[1]
+    assert [sum(row[field] for row in rows) for field in ('approved', 'rejected', 'moderated')] == [1, 1, 1]
+    store.approve_screenshot(first, 501)
+    before = store.get_hourly_stats(GUILD_ID, storage.EPOCH)
+    assert sum(row['moderated'] for row in before[1]) == 2
+    store.rebuild_hourly_stats()
+    assert store.get_hourly_stats(GUILD_ID, storage.EPOCH) == before
+
+def test_replay_writes_compensating_decisions(store):
+    _register(store)
+    ids = [store.add_submission(GUILD_ID, PLAYER_ID, f"https://cdn/{n}") for n in range(3)]
+    store.approve_screenshot(ids[0], 500)
+    store.reject_screenshot(ids[1], 500)
+    time.sleep(0.01)
+    until = datetime.datetime.utcnow()
+    time.sleep(0.01)
+    # Ошибочная массовая модерация после until
+    store.record_moderation_decisions([(ids[0], False, 501, None), (ids[1], True, 501, None),
+                                       (ids[2], True, 501, None)])
+
+    assert moderation_history.replay(GUILD_ID, until, dry_run=True) == {'submissions': 3, 'changed': 3}
+    assert store.get_submission_by_id(ids[2]).is_approved == 1
+    assert moderation_history.replay(GUILD_ID, until) == {'submissions': 3, 'changed': 3}
+    assert [store.get_submission_by_id(n).is_approved for n in ids] == [1, 0, None]
+    last = store.get_moderation_history(ids[2])[-1]
+    assert (last.moderator_id, last.approved) == (None, None)
+    assert last.reason.startswith("восстановлено по журналу")
+
+    # Восстановление записано в журнал: полный проход по журналу дает те же статусы
+    assert moderation_history.decisions_as_of(GUILD_ID) == {ids[0]: True, ids[1]: False, ids[2]: None}
+    assert moderation_history.replay(GUILD_ID) == {'submissions': 3, 'changed': 0}
+    before = store.get_hourly_stats(GUILD_ID, storage.EPOCH)
+    store.rebuild_hourly_stats()
+    assert store.get_hourly_stats(GUILD_ID, storage.EPOCH) == before
+
+def test_leaderboards_and_disqualification(store):
+    _register(store)
+    for player, (total, approved) in enumerate(((1, 1), (3, 1), (2, 0))):
+        for number in range(total):
+            submission_id = store.add_submission(GUILD_ID, PLAYER_ID + player, f"https://cdn/{player}/{number}")
+            if number < approved:
+                store.approve_screenshot(submission_id)
+    store.register_player(GUILD_ID, PLAYER_ID + 3, "static3", "player3")
+
+    assert store.get_leaderboard(GUILD_ID) == [
+        (PLAYER_ID + 1, "player1", 3), (PLAYER_ID + 2, "player2", 2), (PLAYER_ID, "player0", 1),
+        (PLAYER_ID + 3, "player3", 0)
+    ]
+    assert store.get_leaderboard_by_approved(GUILD_ID) == [
+        (PLAYER_ID + 1, "player1", 3, 1), (PLAYER_ID, "player0", 1, 1), (PLAYER_ID + 2, "player2", 2, 0)
+    ]
+    assert sorted(store.get_approved_screenshots_stats(GUILD_ID)) == [
+        (PLAYER_ID, "player0", "static0", 1), (PLAYER_ID + 1, "player1", "static1", 1)
+    ]
+
+    assert store.disqualify_player(GUILD_ID, PLAYER_ID + 1)
+    assert store.is_player_disqualified(GUILD_ID, PLAYER_ID + 1)
+    assert not store.is_player_disqualified(GUILD_ID, PLAYER_ID + 99)
+    assert all(not s.is_valid for s in store.get_player_submissions(GUILD_ID, PLAYER_ID + 1))
+    assert [row[0] for row in store.get_leaderboard(GUILD_ID)] == [PLAYER_ID + 2, PLAYER_ID, PLAYER_ID + 3]
+    assert store.get_approved_screenshots_stats(GUILD_ID) == [(PLAYER_ID, "player0", "static0", 1)]
+
+    assert store.cancel_disqualification(GUILD_ID, PLAYER_ID + 1)
+    assert store.get_leaderboard(GUILD_ID)[0] == (PLAYER_ID + 1, "player1", 3)
+
+    players = store.list_players(GUILD_ID)
+    assert [(p.discord_id, valid, p.is_disqualified) for p, valid in players] == [
+        (PLAYER_ID, 1, 0), (PLAYER_ID + 1, 3, 0), (PLAYER_ID + 2, 2, 0), (PLAYER_ID + 3, 0, 0)
+    ]
+    _register(store, OTHER_GUILD_ID, 1)
+    assert [(p.guild_id, p.discord_id) for p, _ in store.list_players()][-2:] == [
+        (GUILD_ID, PLAYER_ID + 3), (OTHER_GUILD_ID, PLAYER_ID)
+    ]
+
+def test_moderation_cards(store):
+    _register(store)
+    ids = [store.add_submission(GUILD_ID, PLAYER_ID, f"https://cdn/{n}") for n in range(4)]
+    store.reject_screenshot(ids[3])
+    assert store.get_unposted_pending_submissions(GUILD_ID) == ids[:3]
+    assert store.get_moderation_card_group(ids[0]) is None
+
+    assert store.save_moderation_cards(100, 200, [ids[1], ids[0]])
+    assert store.get_moderation_card_group(ids[1]) == (100, 200, [ids[0], ids[1]])
+    assert store.get_unposted_pending_submissions(GUILD_ID) == [ids[2]]
+
+    # Повторная публикация переносит карточку в новое сообщение
+    assert store.save_moderation_cards(100, 201, [ids[1]])
+    assert store.get_moderation_card_group(ids[0]) == (100, 200, [ids[0]])
+    assert store.get_moderation_card_group(ids[1]) == (100, 201, [ids[1]])
+
+    store.disqualify_player(GUILD_ID, PLAYER_ID)
+    assert store.get_unposted_pending_submissions(GUILD_ID) == []
+
+def test_screenshot_files(store):
+    _register(store)
+    assert store.get_screenshot_file(SHA) is None
+    assert store.save_screenshot_file(SHA, "/archive/a.png", 'png', 640, 480, 1234)
+    assert store.save_screenshot_file(SHA, "/archive/other.png", 'jpeg', 1, 1, 1)
+    assert store.get_screenshot_file(SHA) == storage.ScreenshotFile(SHA, "/archive/a.png", 'png', 640, 480, 1234, None)
+
+    submission_id = store.add_submission(GUILD_ID, PLAYER_ID, "https://cdn/a", SHA)
+    store.add_submission(GUILD_ID, PLAYER_ID, "https://cdn/b", "cd" * 32)
+    assert store.get_guild_perceptual_hashes(GUILD_ID) == []
+
+    high_bit = (1 << 63) + 5
+    assert store.save_perceptual_hash(SHA, high_bit)
+    assert store.save_perceptual_hash("ef" * 32, 1)
+    assert store.get_screenshot_file(SHA).phash == high_bit
+    assert store.get_guild_perceptual_hashes(GUILD_ID) == [(submission_id, PLAYER_ID, high_bit)]
+    assert store.get_guild_perceptual_hashes(OTHER_GUILD_ID) == []
+
+def test_hourly_stats(store):
+    hour = datetime.datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    assert store.get_hourly_stats(GUILD_ID, storage.EPOCH) == (0, [])
+
+    _register(store)
+    ids = [store.add_submission(GUILD_ID, PLAYER_ID, f"https://cdn/{n}") for n in range(5)]
+    store.add_submission(OTHER_GUILD_ID, PLAYER_ID, "https://cdn/other")
+    store.record_moderation_decisions([(ids[0], True, 1, None), (ids[0], False, 1, None), (ids[1], False, 1, None)])
+    store.approve_screenshot(ids[1])
+
+    backlog, rows = store.get_hourly_stats(GUILD_ID, storage.EPOCH)
+    if len(rows) == 2:
+        # Граница часа пришлась на середину теста
+        rows = [{field: sum(row[field] for row in rows) for field in rows[-1]}]
+    assert backlog == 0
+    assert rows == [{'hour': rows[0]['hour'], 'submissions': 5, 'approved': 2, 'rejected': 2, 'moderated': 2,
+                     'registrations': 3, 'pending': 3}]
+    assert rows[0]['hour'] in (hour, hour + datetime.timedelta(hours=1))
+    assert store.get_hourly_stats(GUILD_ID, hour + datetime.timedelta(hours=2)) == (3, [])
+    assert store.get_hourly_stats(OTHER_GUILD_ID, storage.EPOCH)[1][0]['submissions'] == 1
+
+    # Пересчет из исходных данных дает те же сводки
+    before = [store.get_hourly_stats(guild_id, storage.EPOCH) for guild_id in (GUILD_ID, OTHER_GUILD_ID)]
+    store.rebuild_hourly_stats()
+    assert [store.get_hourly_stats(guild_id, storage.EPOCH) for guild_id in (GUILD_ID, OTHER_GUILD_ID)] == before
+
+    assert store.reset_all_statistics(GUILD_ID)
+    assert store.get_hourly_stats(GUILD_ID, storage.EPOCH) == (0, [])
+    assert store.start_new_event(GUILD_ID) is not None
+    assert store.get_hourly_stats(OTHER_GUILD_ID, storage.EPOCH) == before[1]
+
+def test_reset_all_statistics(store):
+    _register(store)
+    _register(store, OTHER_GUILD_ID, 1)
+    mine = store.add_submission(GUILD_ID, PLAYER_ID, "https://cdn/1", SHA)
+    other = store.add_submission(OTHER_GUILD_ID, PLAYER_ID, "https://cdn/2", SHA)
+    store.approve_screenshot(mine)
+    store.approve_screenshot(other)
+    store.save_moderation_cards(1, 2, [mine, other])
+
+    assert store.reset_all_statistics(GUILD_ID)
+    assert store.get_all_players_stats(GUILD_ID) == 0
+    assert store.get_submission_by_id(mine) is None
+    assert store.get_moderation_history(mine) == []
+    assert store.get_moderation_card_group(other) == (1, 2, [other])
+    assert store.get_player(OTHER_GUILD_ID, PLAYER_ID) is not None
+    assert len(store.get_moderation_history(other)) == 1
+
+    # ID скриншотов не используются повторно, дубликаты ищутся заново
+    _register(store)
+    again = store.add_submission(GUILD_ID, PLAYER_ID, "https://cdn/3", SHA)
+    assert again > other
+    assert store.get_submission_by_id(again).duplicate_of is None
+
+def test_start_new_event(store):
+    _register(store)
+    _register(store, OTHER_GUILD_ID, 1)
+    store.update_guild_settings(GUILD_ID, moderation_channel_id=55)
+    mine = store.add_submission(GUILD_ID, PLAYER_ID, "https://cdn/1", SHA)
+    other = store.add_submission(OTHER_GUILD_ID, PLAYER_ID, "https://cdn/2", "cd" * 32)
+    store.save_screenshot_file(SHA, "/a.png", 'png', 1, 1, 1)
+    store.save_screenshot_file("cd" * 32, "/b.png", 'png', 1, 1, 1)
+    store.save_perceptual_hash("cd" * 32, 7)
+    store.approve_screenshot(other, 500)
+    store.save_moderation_cards(1, 2, [mine, other])
+
+    assert store.start_new_event(GUILD_ID) is not None
+    assert store.get_all_players_stats(GUILD_ID) == 0
+    assert store.get_submission_by_id(mine) is None
+    assert store.get_screenshot_file(SHA) is None
+    assert store.get_guild_settings(GUILD_ID)['moderation_channel_id'] == 55
+
+    assert store.get_submission_by_id(other).is_approved == 1
+    assert store.get_moderation_history(other)[0].moderator_id == 500
+    assert store.get_moderation_card_group(other) == (1, 2, [other])
+    assert store.get_guild_perceptual_hashes(OTHER_GUILD_ID) == [(other, PLAYER_ID, 7)]
+
+    _register(store, players=1)
+    assert store.add_submission(GUILD_ID, PLAYER_ID, "https://cdn/3") > other
+    assert store.approve_screenshot(other)
+    assert len(store.get_moderation_history(other)) == 2
+
+def _scenario(store) -> list:
+    """Один и тот же набор операций; результаты без времени (оно у хранилищ разное)."""
+    results = []
+    for guild_id in (GUILD_ID, OTHER_GUILD_ID):
+        _register(store, guild_id, 6)
+    ids = []
+    for number in range(40):
+        guild_id = GUILD_ID if number % 4 else OTHER_GUILD_ID
+        sha = f"{number % 7:064x}"
+        ids.append(store.add_submission(guild_id, PLAYER_ID + number % 5, f"https://cdn/{number}", sha))
+        store.save_screenshot_file(sha, f"/archive/{sha}", 'png', 10, 10, 100)
+        store.save_perceptual_hash(sha, number * 977 + ((number % 16) << 60))
+    store.record_moderation_decisions([(submission_id, number % 3 == 0, 900, None)
+                                       for number, submission_id in enumerate(ids) if number % 2])
+    store.disqualify_player(GUILD_ID, PLAYER_ID + 2)
+    store.save_moderation_cards(1, 5, ids[:6])
+    for guild_id in (GUILD_ID, OTHER_GUILD_ID):
+        results.append(store.get_leaderboard_by_approved(guild_id))
+        results.append(sorted(store.get_leaderboard(guild_id)))
+        results.append(sorted(store.get_approved_screenshots_stats(guild_id)))
+        results.append(store.get_unposted_pending_submissions(guild_id))
+        results.append(sorted(store.get_guild_perceptual_hashes(guild_id)))
+        backlog, rows = store.get_hourly_stats(guild_id, storage.EPOCH)
+        results.append((backlog, {field: sum(row[field] for row in rows)
+                                  for field in ('submissions', 'approved', 'rejected', 'moderated', 'registrations')}))
+        for player, valid_submissions in store.list_players(guild_id):
+            results.append((player._replace(registration_ms=None), valid_submissions))
+            results.append([(s.submission_id, s.is_valid, s.is_approved, s.seq)
+                            for s in store.get_player_submissions(guild_id, player.discord_id)])
+            results.append([s.submission_id for s in store.get_player_submissions_page(
+                guild_id, player.discord_id, 'approved', before_seq=6, limit=2)])
+            results.append(store.get_player_submission_counts(guild_id, player.discord_id))
+    for submission_id in ids:
+        submission = store.get_submission_by_id(submission_id)
+        results.append(submission._replace(submission_ms=None))
+        results.append(store.get_player_screenshot_number(submission.discord_id, submission_id))
+    return results
+
+def test_engines_return_same_results(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'DATABASE_NAME', str(tmp_path / 'test.db'))
+    monkeypatch.setattr(config, 'SLOW_QUERY_LOG_ENABLED', False)
+    sqlite_store = database.SQLiteStorage()
+    sqlite_store.setup_database()
+    assert _scenario(sqlite_store) == _scenario(memory_storage.MemoryStorage())
+
+def test_epoch_ms_conversion():
+    moment = datetime.datetime(2025, 7, 10, 18, 30, 5, 123456)
+    assert storage.to_epoch_ms(moment) == 1752172205123
+    assert storage.from_epoch_ms(1752172205123) == moment.replace(microsecond=123000)
+    assert storage.from_epoch_ms(storage.hour_bucket(moment)) == datetime.datetime(2025, 7, 10, 18)
+
+def test_migration_to_epoch_time(tmp_path, monkeypatch):
+    """База со временем строками (столбцы TIMESTAMP) переводится на миллисекунды Unix без потери данных."""
+    path = str(tmp_path / 'old.db')
+    monkeypatch.setattr(database, 'DATABASE_NAME', path)
+    monkeypatch.setattr(config, 'SLOW_QUERY_LOG_ENABLED', False)
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE players (guild_id INTEGER NOT NULL, discord_id INTEGER NOT NULL, static_id TEXT NOT NULL,
+                              nickname TEXT NOT NULL, registration_time TIMESTAMP NOT NULL,
+                              is_disqualified BOOLEAN DEFAULT FALSE, PRIMARY KEY (guild_id, discord_id));
+        CREATE TABLE submissions (submission_id INTEGER PRIMARY KEY AUTOINCREMENT, guild_id INTEGER NOT NULL,
+                                  player_id INTEGER NOT NULL, screenshot_url TEXT NOT NULL,
+                                  submission_time TIMESTAMP NOT NULL, is_valid BOOLEAN DEFAULT TRUE,
+                                  is_approved BOOLEAN DEFAULT FALSE, file_sha256 TEXT, duplicate_of INTEGER);
+        CREATE TABLE moderation_log (log_id INTEGER PRIMARY KEY, submission_id INTEGER NOT NULL,
+                                     guild_id INTEGER NOT NULL, moderator_id INTEGER, approved BOOLEAN NOT NULL,
+                                     reason TEXT, decided_at TIMESTAMP NOT NULL);
+        INSERT INTO players VALUES (1, 10000, 's', 'n', '2025-07-10 18:30:05.123456', FALSE);
+        INSERT INTO submissions VALUES (7, 1, 10000, 'u7', '2025-07-10 18:40:00', TRUE, TRUE, NULL, NULL);
+        INSERT INTO submissions VALUES (8, 1, 10000, 'u8', '2025-07-10 18:40:00', TRUE, NULL, NULL, NULL);
+        INSERT INTO moderation_log VALUES (1, 7, 1, 5, TRUE, NULL, '2025-07-10 19:01:02.500000');
+        UPDATE sqlite_sequence SET seq = 20 WHERE name = 'submissions';
+    ''')
+    conn.commit()
+    conn.close()
+
+    engine = database.SQLiteStorage()
+    engine.setup_database()
+    engine.setup_database()
+
+    conn = sqlite3.connect(path)
+    types = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(submissions)")}
+    assert types['submission_time'] == 'INTEGER'
+    assert conn.execute("SELECT typeof(registration_time) FROM players").fetchone()[0] == 'integer'
+    assert conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'submissions'").fetchone()[0] == 20
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {'idx_submissions_player_seq', 'idx_moderation_log_submission', 'idx_players_discord'} <= indexes
+    assert 'idx_submissions_guild_player' not in indexes
+    conn.close()
+
+    assert engine.get_player(1, 10000).registration_time == datetime.datetime(2025, 7, 10, 18, 30, 5, 123000)
+    assert engine.get_submission_by_id(7).submission_time == datetime.datetime(2025, 7, 10, 18, 40)
+    assert engine.get_moderation_history(7)[0].decided_at == datetime.datetime(2025, 7, 10, 19, 1, 2, 500000)
+    # Одинаковое время отправки: номера различаются по ID
+    assert [engine.get_player_screenshot_number(10000, n) for n in (7, 8)] == [1, 2]
+    assert [row['hour'] for row in engine.get_hourly_stats(1, storage.EPOCH)[1]] == [
+        datetime.datetime(2025, 7, 10, 18), datetime.datetime(2025, 7, 10, 19)]
+    assert engine.add_submission(1, 10000, 'u21') == 21
+    assert engine.get_player_screenshot_number(10000, 21) == 3
+
+def test_disqualification_keeps_submission_flags(tmp_path, monkeypatch):
+    """Дисквалификация меняет одну строку игрока, а собственные флаги скриншотов сохраняются."""
+    monkeypatch.setattr(database, 'DATABASE_NAME', str(tmp_path / 'test.db'))
+    monkeypatch.setattr(config, 'SLOW_QUERY_LOG_ENABLED', False)
+    engine = database.SQLiteStorage()
+    engine.setup_database()
+    _register(engine)
+    ids = [engine.add_submission(GUILD_ID, PLAYER_ID, f"https://cdn/{n}") for n in range(3)]
+    conn = sqlite3.connect(database.DATABASE_NAME)
+    with conn:
+        conn.execute("UPDATE submissions SET is_valid = FALSE WHERE submission_id = ?", (ids[0],))
+    stored_flags = lambda: [row[0] for row in conn.execute("SELECT is_valid FROM submissions ORDER BY submission_id")]
+
+    assert engine.disqualify_player(GUILD_ID, PLAYER_ID)
+    assert stored_flags() == [0, 1, 1]
+    assert [engine.get_submission_by_id(n).is_valid for n in ids] == [0, 0, 0]
+    assert engine.get_unposted_pending_submissions(GUILD_ID) == []
+
+    assert engine.cancel_disqualification(GUILD_ID, PLAYER_ID)
+    assert stored_flags() == [0, 1, 1]
+    conn.close()
+    assert [s.is_valid for s in engine.get_player_submissions(GUILD_ID, PLAYER_ID)] == [1, 1, 0]
+    assert engine.list_players(GUILD_ID)[0][1] == 2
+    assert engine.get_unposted_pending_submissions(GUILD_ID) == ids[1:]
+
+def test_migration_restores_flags_of_disqualified_players(tmp_path, monkeypatch):
+    """В старых базах дисквалификация записана в is_valid скриншотов: флаги возвращаются один раз."""
+    path = str(tmp_path / 'old.db')
+    monkeypatch.setattr(database, 'DATABASE_NAME', path)
+    monkeypatch.setattr(config, 'SLOW_QUERY_LOG_ENABLED', False)
+    engine = database.SQLiteStorage()
+    engine.setup_database()
+    _register(engine, players=2)
+    first = engine.add_submission(GUILD_ID, PLAYER_ID, "https://cdn/1")
+    other = engine.add_submission(GUILD_ID, PLAYER_ID + 1, "https://cdn/2")
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("UPDATE players SET is_disqualified = TRUE WHERE discord_id = ?", (PLAYER_ID,))
+        conn.execute("UPDATE submissions SET is_valid = FALSE")
+        conn.execute("PRAGMA user_version = 0")
+    conn.close()
+
+    engine.setup_database()
+    engine.cancel_disqualification(GUILD_ID, PLAYER_ID)
+    assert engine.get_submission_by_id(first).is_valid == 1
+    assert engine.get_submission_by_id(other).is_valid == 0
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 1
+    conn.close()
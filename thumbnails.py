@@ -0,0 +1,153 @@
+# thumbnails.py
+import asyncio
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import config
+import tracing
+from bot_logging import get_logger
+
+log = get_logger('thumbnails')
+
+try:
+    from PIL import Image
+except ImportError:  # Без Pillow в embed используются оригиналы скриншотов
+    Image = None
+
+def make_preview(src_path: str, dst_path: str, max_side: int, quality: int) -> int:
+    """
+    Создает уменьшенное WebP-превью изображения.
+    Выполняется в процессе пула, возвращает размер превью в байтах (0 при ошибке).
+    """
+    tmp_path = dst_path + '.tmp'
+    try:
+        with Image.open(src_path) as image:
+            image.thumbnail((max_side, max_side))
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+            image.save(tmp_path, 'WEBP', quality=quality, method=4)
+        os.replace(tmp_path, dst_path)
+        return os.path.getsize(dst_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return 0
+
+class ThumbnailCache:
+    """
+    Дисковый кэш превью скриншотов с вытеснением по суммарному размеру.
+    Превью создаются в пуле процессов при приеме скриншота; при превышении
+    лимита удаляются превью, к которым дольше всего не обращались.
+    """
+
+    def __init__(self, root: str, max_bytes: int, workers: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.enabled = Image is not None
+        self._workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # path -> размер; порядок - от давно использованных к недавним
+        self._entries: Optional[OrderedDict] = None
+        self._total_bytes = 0
+        self._pending = set()
+        self._tasks = set()
+
+    @property
+    def pending(self) -> int:
+        """Сколько превью сейчас создается."""
+        return len(self._pending)
+
+    def path_for(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], f"{sha256}.webp")
+
+    def _load(self):
+        """Один раз при первом обращении сканирует каталог кэша."""
+        if self._entries is not None:
+            return
+
+        found = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith('.webp'):
+                    path = os.path.join(dirpath, name)
+                    stat = os.stat(path)
+                    found.append((stat.st_mtime, path, stat.st_size))
+
+        found.sort()
+        self._entries = OrderedDict((path, size) for _, path, size in found)
+        self._total_bytes = sum(size for _, _, size in found)
+
+    def get(self, sha256: str) -> Optional[str]:
+        """Возвращает путь к превью файла или None, если превью еще нет (или оно вытеснено)."""
+        if not self.enabled:
+            return None
+
+        self._load()
+        path = self.path_for(sha256)
+        if path not in self._entries:
+            return None
+        if not os.path.exists(path):
+            self._total_bytes -= self._entries.pop(path)
+            return None
+
+        self._entries.move_to_end(path)
+        try:
+            os.utime(path)  # Время изменения файла хранит порядок вытеснения между перезапусками
+        except OSError:
+            pass
+        return path
+
+    def schedule(self, sha256: str, src_path: str):
+        """Ставит создание превью в фон, если его еще нет."""
+        if not self.enabled or sha256 in self._pending or self.get(sha256):
+            return
+
+        self._pending.add(sha256)
+        task = asyncio.create_task(self._generate(sha256, src_path))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _generate(self, sha256: str, src_path: str):
+        try:
+            path = self.path_for(sha256)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self._workers)
+            loop = asyncio.get_running_loop()
+            # Задача создана обработчиком, поэтому span попадает в его трассу
+            with tracing.span("thumbnail.generate", sha256=sha256):
+                size = await loop.run_in_executor(
+                    self._pool, make_preview, src_path, path, config.THUMBNAIL_MAX_SIDE, config.THUMBNAIL_QUALITY
+                )
+
+            if size:
+                self._add(path, size)
+            else:
+                log.warning("Не удалось создать превью", extra={'sha256': sha256, 'path': src_path})
+        except Exception:
+            log.exception("Ошибка при создании превью", extra={'sha256': sha256, 'path': src_path})
+        finally:
+            self._pending.discard(sha256)
+
+    def _add(self, path: str, size: int):
+        self._load()
+        if path in self._entries:
+            self._total_bytes -= self._entries[path]
+        self._entries[path] = size
+        self._entries.move_to_end(path)
+        self._total_bytes += size
+
+        # Вытесняем давно не использованные превью (самое свежее не трогаем)
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            old_path, old_size = self._entries.popitem(last=False)
+            self._total_bytes -= old_size
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+# Общий кэш превью для embed модерации и личных сообщений
+preview_cache = ThumbnailCache(config.THUMBNAIL_DIR, config.THUMBNAIL_CACHE_MAX_BYTES, config.THUMBNAIL_WORKERS)
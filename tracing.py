@@ -0,0 +1,232 @@
+# tracing.py
+import contextvars
+import json
+import logging
+import logging.handlers
+import random
+import time
+from typing import Dict, List, Optional
+
+import config
+from bot_logging import bind, get_logger, queued
+
+log = get_logger('tracing')
+
+# Виды span в терминах OpenTelemetry (SpanKind в OTLP)
+INTERNAL = 1
+SERVER = 2
+CLIENT = 3
+CONSUMER = 5
+
+# Коды статуса OTLP
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+# Текущий span задачи; asyncio.create_task копирует его в фоновые задачи
+_current: contextvars.ContextVar[Optional['Span']] = contextvars.ContextVar('trace_span', default=None)
+
+_exporter: Optional[logging.Logger] = None
+
+class Trace:
+    """
+    Спаны одного взаимодействия. Решение о записи принимается, когда завершается корневой span:
+    трасса записывается, если попала в выборку, закончилась ошибкой или оказалась медленной.
+    Спаны фоновой работы, завершившиеся позже, дописываются отдельной строкой с тем же trace_id.
+    """
+
+    __slots__ = ('trace_id', 'sampled', 'keep', 'spans', 'open', 'dropped')
+
+    def __init__(self, sampled: bool):
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.sampled = sampled
+        self.keep: Optional[bool] = None
+        self.spans: List['Span'] = []
+        self.open = 0
+        self.dropped = 0
+
+class Span:
+    __slots__ = ('trace', 'span_id', 'parent', 'name', 'kind', 'attributes', 'links',
+                 'start_ns', 'duration_ns', 'error', '_started', '_token')
+
+    def __init__(self, trace: Trace, parent: Optional['Span'], name: str, kind: int, attributes: dict, links):
+        self.trace = trace
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent = parent
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.links = links
+        self.start_ns = 0
+        self.duration_ns = 0
+        self.error: Optional[str] = None
+        self._started = 0
+        self._token = None
+
+    def __enter__(self) -> 'Span':
+        self.trace.open += 1
+        self.start_ns = time.time_ns()
+        self._started = time.perf_counter_ns()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration_ns = time.perf_counter_ns() - self._started
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        _finish(self)
+        return False
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+class _NoSpan:
+    """Заглушка вне трассы: запросы к базе и Discord API вне обработчиков не записываются."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+_NO_SPAN = _NoSpan()
+
+def current() -> Optional[Span]:
+    """Текущий span (его можно передать через очередь как parent для фоновой работы)."""
+    return _current.get()
+
+def span(name: str, kind: int = INTERNAL, root: bool = False, parent: Optional[Span] = None,
+         links: Optional[List[Span]] = None, **attributes):
+    """
+    Span вокруг блока кода: with tracing.span("inbox.post", submissions=3): ...
+    Без родителя новая трасса начинается только при root=True (обработчики взаимодействий
+    и фоновые задачи), иначе возвращается заглушка.
+    """
+    if not config.TRACING_ENABLED:
+        return _NO_SPAN
+    if parent is None:
+        parent = _current.get()
+
+    if parent is not None:
+        trace = parent.trace
+        if len(trace.spans) + trace.open >= config.TRACE_MAX_SPANS:
+            trace.dropped += 1
+            return _NO_SPAN
+    elif root:
+        trace = Trace(random.random() < config.TRACE_SAMPLE_RATE)
+        # Идентификатор трассы попадает во все записи журнала обработчика
+        bind(trace_id=trace.trace_id)
+    else:
+        return _NO_SPAN
+
+    return Span(trace, parent, name, kind, attributes, links or [])
+
+def _finish(finished: Span):
+    trace = finished.trace
+    trace.spans.append(finished)
+    trace.open -= 1
+
+    if finished.parent is None:
+        slow = finished.duration_ns >= config.TRACE_SLOW_MS * 1_000_000
+        trace.keep = trace.sampled or slow or finished.error is not None
+        if slow and finished.kind == SERVER:
+            _report_slow(finished)
+
+    # Пишем, когда в трассе не осталось незавершенных спанов
+    if trace.open == 0 and trace.keep is not None:
+        if trace.keep and trace.spans:
+            _export(trace.spans)
+        trace.spans = []
+
+def breakdown(root: Span) -> Dict[str, float]:
+    """
+    Куда ушло время корневого span, мс: база, запросы к Discord (REST и ответы на взаимодействия),
+    вложенные обработчики и собственное время (код бота и ожидание цикла событий).
+    """
+    result = {'db': 0.0, 'discord': 0.0, 'other': 0.0}
+    children = [s for s in root.trace.spans if s.parent is root]
+    for child in children:
+        category = 'db' if child.name.startswith('db ') else 'discord' if child.kind == CLIENT else 'other'
+        result[category] += child.duration_ns / 1e6
+    result['self'] = max(0.0, root.duration_ns / 1e6 - sum(result.values()))
+    return {key: round(value, 1) for key, value in result.items()}
+
+def _report_slow(root: Span):
+    children = sorted((s for s in root.trace.spans if s.parent is root), key=lambda s: -s.duration_ns)
+    log.warning("Медленное взаимодействие", extra={
+        'trace_id': root.trace.trace_id,
+        'span': root.name,
+        'duration_ms': round(root.duration_ns / 1e6, 1),
+        'breakdown_ms': breakdown(root),
+        'slowest': [f"{s.name}: {s.duration_ns / 1e6:.1f} ms" for s in children[:config.TRACE_SLOW_TOP_SPANS]],
+    })
+
+# Экспорт в формате OTLP/JSON (ExportTraceServiceRequest, одна строка на порцию спанов) -
+# так же пишет file exporter OpenTelemetry Collector, файл читают otelcol и Jaeger/Tempo.
+
+def _attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+def _otlp_span(s: Span) -> dict:
+    data = {
+        'traceId': s.trace.trace_id,
+        'spanId': s.span_id,
+        'name': s.name,
+        'kind': s.kind,
+        'startTimeUnixNano': str(s.start_ns),
+        'endTimeUnixNano': str(s.start_ns + s.duration_ns),
+        'attributes': [_attribute(key, value) for key, value in s.attributes.items()],
+        'status': {'code': STATUS_ERROR, 'message': s.error} if s.error else {'code': STATUS_OK},
+    }
+    if s.parent is not None:
+        data['parentSpanId'] = s.parent.span_id
+    if s.links:
+        data['links'] = [{'traceId': link.trace.trace_id, 'spanId': link.span_id} for link in s.links]
+    if s.parent is None and s.trace.dropped:
+        data['droppedSpansCount'] = s.trace.dropped
+    return data
+
+class _OtlpBatch:
+    """Сообщение журнала, которое сериализуется в JSON в фоновом потоке, а не в цикле событий."""
+
+    __slots__ = ('spans',)
+
+    def __init__(self, spans: List[Span]):
+        self.spans = spans
+
+    def __str__(self) -> str:
+        return json.dumps({'resourceSpans': [{
+            'resource': {'attributes': [_attribute('service.name', config.TRACE_SERVICE_NAME)]},
+            'scopeSpans': [{
+                'scope': {'name': 'photoevent.tracing'},
+                'spans': [_otlp_span(s) for s in self.spans],
+            }],
+        }]}, ensure_ascii=False)
+
+def _get_exporter() -> logging.Logger:
+    global _exporter
+    if _exporter is None:
+        _exporter = logging.getLogger('photoevent.traces')
+        _exporter.setLevel(logging.INFO)
+        _exporter.propagate = False
+        handler = logging.handlers.RotatingFileHandler(
+            config.TRACE_FILE,
+            maxBytes=config.TRACE_FILE_MAX_BYTES,
+            backupCount=config.TRACE_FILE_BACKUPS,
+            encoding='utf-8'
+        )
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        _exporter.addHandler(queued(handler))
+    return _exporter
+
+def _export(spans: List[Span]):
+    _get_exporter().info(_OtlpBatch(spans))